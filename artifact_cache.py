@@ -0,0 +1,107 @@
+import json
+import os
+import os.path as path
+import shutil
+import time
+
+from slave_utils import tree_size
+
+metadata_file = 'metadata.json'
+
+
+class ArtifactCache(object):
+    """
+    A slave-local store of build artifacts, keyed by a caller supplied hash.
+    Each entry is a directory holding the cached files and a metadata file.
+    Entries are evicted least-recently-used first once the total size of the
+    cache exceeds its limit.
+    """
+
+    def __init__(self, root, limit_bytes):
+        self.root = path.abspath(root)
+        self.limit_bytes = limit_bytes
+        if not path.isdir(self.root):
+            os.makedirs(self.root)
+
+    def entry_path(self, key):
+        return path.join(self.root, key)
+
+    def fetch(self, key, files):
+        """
+        Copies the cached files of an entry to their destinations. 'files'
+        maps the names used when storing the entry to destination paths.
+        Returns the entry's metadata, or None when the entry is missing or
+        incomplete.
+        """
+        entry = self.entry_path(key)
+        if not path.isdir(entry):
+            return None
+        for name in files:
+            if not path.isfile(path.join(entry, name)):
+                return None
+
+        for name, dest in files.items():
+            dest_dir = path.dirname(dest)
+            if dest_dir and not path.isdir(dest_dir):
+                os.makedirs(dest_dir)
+            shutil.copy2(path.join(entry, name), dest)
+
+        # Mark the entry as recently used.
+        os.utime(entry, None)
+        return self.read_metadata(key)
+
+    def store(self, key, files, metadata=None):
+        """
+        Stores the given files under a key. 'files' maps names to source
+        paths. The entry is written to a temporary directory first and moved
+        into place, so readers never see a partial entry.
+        """
+        entry = self.entry_path(key)
+        staging = path.join(self.root, '.tmp-{0}-{1}'.format(key, os.getpid()))
+        if path.exists(staging):
+            shutil.rmtree(staging)
+        os.makedirs(staging)
+
+        for name, src in files.items():
+            shutil.copy2(src, path.join(staging, name))
+
+        metadata = dict(metadata or {})
+        metadata['stored'] = time.time()
+        with open(path.join(staging, metadata_file), 'w') as fh:
+            json.dump(metadata, fh)
+
+        if path.exists(entry):
+            shutil.rmtree(entry)
+        os.rename(staging, entry)
+        self.evict(keep=key)
+
+    def read_metadata(self, key):
+        try:
+            with open(path.join(self.entry_path(key), metadata_file)) as fh:
+                return json.load(fh)
+        except (IOError, ValueError):
+            return {}
+
+    def entries(self):
+        result = []
+        for name in os.listdir(self.root):
+            entry = path.join(self.root, name)
+            if name.startswith('.') or not path.isdir(entry):
+                continue
+            result.append((path.getmtime(entry), tree_size(entry), name))
+        return result
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.limit_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(self.entry_path(name), ignore_errors=True)
+            total -= size
+        return total
@@ -0,0 +1,188 @@
+"""
+Keeps the artifacts under public_html within an age and size budget.
+
+Artifacts live in '{root}/{builder}/{revision}/'. The newest revisions of
+every builder and the revisions of release tags are always kept. Of the
+other revisions, those older than the age budget are removed, then the
+oldest ones until the size budget is met. Before a revision is removed, its
+testament results are compacted into the builder's archive for the month,
+'{root}/{builder}/archive-YYYY-MM.zip', from which they can still be
+served. Entries of the upload content store which no artifact links to
+anymore are removed too.
+
+usage: artifact_retention.py <public_html> <max MB> <max age in days>
+                             <recent revisions kept>
+"""
+import os
+import os.path as path
+import re
+import shutil
+import subprocess
+import sys
+import time
+import zipfile
+
+from slave_utils import tree_size
+import content_store
+
+artifact_roots = ['test-data', 'installer-data']
+content_store_name = 'content-store'
+nim_git_url = 'https://github.com/nim-lang/Nim'
+
+# Files of a removed revision which are moved into the monthly archive.
+archived_pattern = re.compile(r'^(testament|testresults)-\d+\.(db|html)$')
+archive_name_pattern = re.compile(r'^archive-\d{4}-\d{2}\.zip$')
+
+
+def release_revisions(repository=nim_git_url):
+    """
+    Returns the revisions of the repository's tags, or None when they can't
+    be listed.
+    """
+    try:
+        process = subprocess.Popen(['git', 'ls-remote', '--tags', repository],
+                                   stdout=subprocess.PIPE)
+        output = process.communicate()[0]
+    except OSError:
+        return None
+    if process.returncode != 0:
+        return None
+    return set(line.split()[0] for line in
+               output.decode('utf-8', 'replace').splitlines() if line.strip())
+
+
+def archive_path(builder_dir, timestamp):
+    return path.join(builder_dir, time.strftime(
+        'archive-%Y-%m.zip', time.gmtime(timestamp)
+    ))
+
+
+def compact_revision(builder_dir, revision):
+    """
+    Moves the testament results of a revision into the monthly archive of
+    its builder, then removes the revision's directory. Returns the number
+    of bytes freed.
+    """
+    revision_dir = path.join(builder_dir, revision)
+    size = tree_size(revision_dir)
+    archive = archive_path(builder_dir, path.getmtime(revision_dir))
+
+    names = sorted(
+        name for name in os.listdir(revision_dir)
+        if archived_pattern.match(name)
+        and not path.islink(path.join(revision_dir, name))
+    )
+    if names:
+        with zipfile.ZipFile(archive, 'a', zipfile.ZIP_DEFLATED) as zf:
+            present = set(zf.namelist())
+            for name in names:
+                member = revision + '/' + name
+                if member not in present:
+                    zf.write(path.join(revision_dir, name), member)
+
+    # The archive's growth is only counted by the next run.
+    shutil.rmtree(revision_dir)
+    return size
+
+
+def builder_revisions(root):
+    """
+    Returns (modification time, size, builder dir, revision) for every
+    revision directory below an artifact root.
+    """
+    result = []
+    for builder in sorted(os.listdir(root)):
+        builder_dir = path.join(root, builder)
+        if not path.isdir(builder_dir):
+            continue
+        for revision in os.listdir(builder_dir):
+            revision_dir = path.join(builder_dir, revision)
+            if path.isdir(revision_dir):
+                result.append((path.getmtime(revision_dir),
+                               tree_size(revision_dir), builder_dir, revision))
+    return result
+
+
+def prune(public_html, max_bytes, max_age_days, keep_recent, releases=None,
+          now=None, log=None):
+    """
+    Applies the retention budget and returns the number of removed
+    revisions. When the release revisions are unknown, nothing is removed.
+    """
+    if log is None:
+        log = lambda message: None
+    if releases is None:
+        releases = release_revisions()
+    if releases is None:
+        log('Unable to list the release tags, not pruning')
+        return 0
+    if now is None:
+        now = time.time()
+
+    revisions = []
+    total = 0
+    for root_name in artifact_roots:
+        root = path.join(public_html, root_name)
+        if path.isdir(root):
+            revisions.extend(builder_revisions(root))
+            total += tree_size(root)
+
+    # The newest revisions of each builder are kept.
+    kept = set()
+    by_builder = {}
+    for entry in revisions:
+        by_builder.setdefault(entry[2], []).append(entry)
+    for entries in by_builder.values():
+        entries.sort(reverse=True)
+        for _, _, builder_dir, revision in entries[:keep_recent]:
+            kept.add((builder_dir, revision))
+
+    candidates = sorted(
+        entry for entry in revisions
+        if (entry[2], entry[3]) not in kept and entry[3] not in releases
+    )
+    removed = 0
+    max_age = max_age_days * 24 * 3600
+    for mtime, size, builder_dir, revision in candidates:
+        if now - mtime <= max_age and total <= max_bytes:
+            break
+        log('Compacting {0}'.format(path.join(builder_dir, revision)))
+        total -= compact_revision(builder_dir, revision)
+        removed += 1
+
+    freed = content_store.prune(path.join(public_html, content_store_name))
+    if freed:
+        log('Freed {0} bytes of unreferenced stored content'.format(freed))
+    return removed
+
+
+def read_archived(builder_dir, member):
+    """
+    Returns the content of a file compacted into one of a builder's monthly
+    archives, or None when no archive holds it.
+    """
+    if not path.isdir(builder_dir):
+        return None
+    for name in sorted(os.listdir(builder_dir), reverse=True):
+        if not archive_name_pattern.match(name):
+            continue
+        with zipfile.ZipFile(path.join(builder_dir, name)) as zf:
+            try:
+                return zf.read(member)
+            except KeyError:
+                continue
+    return None
+
+
+def main():
+    public_html, max_mb, max_age_days, keep_recent = sys.argv[1:5]
+
+    def log(message):
+        print(message)
+
+    removed = prune(public_html, int(max_mb) * 1024 * 1024,
+                    float(max_age_days), int(keep_recent), log=log)
+    print('Removed {0} revisions'.format(removed))
+
+if __name__ == "__main__":
+    main()
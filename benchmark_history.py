@@ -0,0 +1,201 @@
+"""
+Master-side history of the compiler benchmarks.
+
+usage: benchmark_history.py ingest <history> <benchmarks.json> <builder>
+                                   <revision> <build number> <threshold>
+                                   <trend page>
+
+Loads the results of a build's benchmarks, rewrites the builder's trend
+page, and exits with 1 when a benchmark took longer than the median of its
+previous runs by more than the threshold, so that the ingesting step marks
+the build with warnings.
+"""
+import json
+import os
+import os.path as path
+import sqlite3
+import sys
+import time
+from xml.sax.saxutils import escape
+
+from step_timings import median
+
+default_history_path = 'benchmark_history.sqlite'
+
+# Number of earlier builds a benchmark's time is compared with, and the
+# number of builds shown on the trend page.
+baseline_runs = 10
+trend_builds = 50
+
+schema = """
+CREATE TABLE IF NOT EXISTS Benchmark(
+    builder     TEXT NOT NULL,
+    number      INTEGER NOT NULL,
+    revision    TEXT NOT NULL,
+    name        TEXT NOT NULL,
+    seconds     REAL,
+    peak_rss    INTEGER,
+    binary_size INTEGER,
+    returncode  INTEGER,
+    ingested    REAL NOT NULL,
+    PRIMARY KEY (builder, name, number)
+);
+"""
+
+trend_page = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Compiler benchmarks: {builder}</title>
+<style>
+td, th {{ padding: 2px 8px; text-align: right; }}
+td.revision {{ font-family: monospace; text-align: left; }}
+td.regressed {{ background-color: #fdd; }}
+</style>
+</head>
+<body>
+<h1>Compiler benchmarks: {builder}</h1>
+<p>Wall time in seconds / peak RSS in MB, newest build first.</p>
+<table>
+<tr><th>Build</th><th>Revision</th>{headers}</tr>
+{rows}
+</table>
+</body>
+</html>
+"""
+
+
+def dict_factory(cursor, row):
+    return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+
+
+class BenchmarkHistory(object):
+
+    def __init__(self, history_path=default_history_path):
+        self.connection = sqlite3.connect(history_path, timeout=60)
+        self.connection.row_factory = dict_factory
+        self.connection.executescript(schema)
+
+    def close(self):
+        self.connection.close()
+
+    def ingest(self, results, builder, revision, number):
+        with self.connection:
+            for name, result in results.items():
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO Benchmark(builder, number,'
+                    ' revision, name, seconds, peak_rss, binary_size,'
+                    ' returncode, ingested) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (builder, number, revision, name, result.get('seconds'),
+                     result.get('peak_rss'), result.get('binary_size'),
+                     result.get('returncode'), time.time())
+                )
+
+    def baseline(self, builder, name, before):
+        rows = self.connection.execute(
+            'SELECT seconds FROM Benchmark WHERE builder = ? AND name = ?'
+            ' AND number < ? AND returncode = 0'
+            ' ORDER BY number DESC LIMIT ?',
+            (builder, name, before, baseline_runs)
+        ).fetchall()
+        if not rows:
+            return None
+        return median([row['seconds'] for row in rows])
+
+    def regressions(self, builder, number, threshold):
+        result = []
+        for row in self.connection.execute(
+                'SELECT * FROM Benchmark WHERE builder = ? AND number = ?'
+                ' AND returncode = 0 ORDER BY name',
+                (builder, number)).fetchall():
+            baseline = self.baseline(builder, row['name'], number)
+            if baseline and row['seconds'] > baseline * (1 + threshold):
+                row['baseline'] = baseline
+                result.append(row)
+        return result
+
+    def trend(self, builder):
+        builds = self.connection.execute(
+            'SELECT DISTINCT number, revision FROM Benchmark'
+            ' WHERE builder = ? ORDER BY number DESC LIMIT ?',
+            (builder, trend_builds)
+        ).fetchall()
+        results = {}
+        if builds:
+            for row in self.connection.execute(
+                    'SELECT * FROM Benchmark WHERE builder = ?'
+                    ' AND number >= ?',
+                    (builder, builds[-1]['number'])):
+                results[(row['number'], row['name'])] = row
+        return builds, results
+
+    def write_trend_page(self, builder, page_path, threshold):
+        builds, results = self.trend(builder)
+        names = sorted(set(name for _, name in results))
+
+        rows = []
+        for build in builds:
+            cells = []
+            for name in names:
+                row = results.get((build['number'], name))
+                if row is None or row['seconds'] is None:
+                    cells.append('<td></td>')
+                    continue
+                baseline = self.baseline(builder, name, build['number'])
+                regressed = (baseline and
+                             row['seconds'] > baseline * (1 + threshold))
+                rss = ('{0:.0f}'.format(row['peak_rss'] / 1048576.0)
+                       if row['peak_rss'] else '-')
+                cells.append('<td{0}>{1:.1f} / {2}</td>'.format(
+                    ' class="regressed"' if regressed else '',
+                    row['seconds'], rss
+                ))
+            rows.append(
+                '<tr><td>{0}</td><td class="revision">{1}</td>{2}</tr>'.format(
+                    build['number'], escape(build['revision'][:12]),
+                    ''.join(cells)
+                )
+            )
+
+        page_dir = path.dirname(page_path)
+        if page_dir and not path.isdir(page_dir):
+            os.makedirs(page_dir)
+        with open(page_path, 'w') as fh:
+            fh.write(trend_page.format(
+                builder=escape(builder),
+                headers=''.join('<th>{0}</th>'.format(escape(name))
+                                for name in names),
+                rows='\n'.join(rows)
+            ))
+
+
+def main():
+    action, history_path = sys.argv[1:3]
+    if action != 'ingest':
+        sys.exit('Unknown action {0}'.format(action))
+
+    results_path, builder, revision, number, threshold, page_path = \
+        sys.argv[3:9]
+    number = int(number)
+    threshold = float(threshold)
+    with open(results_path) as fh:
+        results = json.load(fh)
+
+    history = BenchmarkHistory(history_path)
+    try:
+        history.ingest(results, builder, revision, number)
+        history.write_trend_page(builder, page_path, threshold)
+        regressions = history.regressions(builder, number, threshold)
+    finally:
+        history.close()
+
+    for row in regressions:
+        print('{0}: {1:.1f}s, {2:.0%} slower than its median of {3:.1f}s'
+              .format(row['name'], row['seconds'],
+                      row['seconds'] / row['baseline'] - 1, row['baseline']))
+    if regressions:
+        sys.exit(1)
+    print('No benchmark regressed')
+
+if __name__ == "__main__":
+    main()
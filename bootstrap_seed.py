@@ -0,0 +1,104 @@
+"""
+Keeps the last compiler which was built and tested on a builder and branch
+in a slave-local cache, so that the next build can start 'koch boot' from it
+instead of from csources.
+
+usage: bootstrap_seed.py fetch <cache dir> <limit in MB> <builder> <branch>
+                               <bin dir> <build number> <cold interval>
+       bootstrap_seed.py store <cache dir> <limit in MB> <builder> <branch>
+                               <bin dir> <nim revision>
+       bootstrap_seed.py boot <nim dir> <command>...
+
+'fetch' restores the seed into the bin directory and reports the
+'bootstrap_seed' property as 'hit', 'miss' or 'cold'. Every build whose
+number is a multiple of the cold interval is a cold build, which boots from
+csources even when a seed exists. 'boot' runs the boot command and reports
+whether it succeeded as the 'seed_boot' property, 'ok' or 'failed', instead
+of failing, so that the build can fall back to csources.
+"""
+import os.path as path
+import platform
+import subprocess
+import sys
+
+from artifact_cache import ArtifactCache
+from slave_utils import report_property, hash_strings, command_output
+from slave_utils import exe_name
+
+binary_names = [exe_name('nim'), exe_name('nimrod')]
+
+
+def seed_key(builder, branch):
+    return hash_strings([builder, branch, platform.system(),
+                         platform.machine()])
+
+
+def seed_cache(cache_dir, limit_mb):
+    return ArtifactCache(path.join(cache_dir, 'seeds'),
+                         int(limit_mb) * 1024 * 1024)
+
+
+def fetch(cache, key, bin_dir, build_number, cold_interval):
+    if cold_interval > 0 and build_number % cold_interval == 0:
+        print('Build {0} is a cold build'.format(build_number))
+        return 'cold'
+
+    stored_names = cache.read_metadata(key).get('binaries', [])
+    files = {name: path.join(bin_dir, name) for name in stored_names}
+    metadata = cache.fetch(key, files) if files else None
+    if metadata is None:
+        print('No bootstrap seed for {0}'.format(key))
+        return 'miss'
+
+    # A seed which doesn't run is as good as none, csources replaces it.
+    version = command_output([path.abspath(files[exe_name('nim')]),
+                              '--version'])
+    if 'Nim' not in version:
+        print('The bootstrap seed does not run:\n{0}'.format(version))
+        return 'miss'
+    print('Restored the compiler built from {0}:\n{1}'.format(
+        metadata.get('revision'), version
+    ))
+    report_property('bootstrap_seed_revision', metadata.get('revision'))
+    return 'hit'
+
+
+def main():
+    action = sys.argv[1]
+    if action == 'boot':
+        nim_dir, command = sys.argv[2], sys.argv[3:]
+        local_exe = path.join(nim_dir, exe_name(command[0]))
+        if path.isfile(local_exe):
+            command[0] = path.abspath(local_exe)
+        returncode = subprocess.call(command, cwd=nim_dir)
+        print('Boot command exited with {0}'.format(returncode))
+        report_property('seed_boot', 'ok' if returncode == 0 else 'failed')
+        return
+
+    cache_dir, limit_mb, builder, branch, bin_dir = sys.argv[2:7]
+    cache = seed_cache(cache_dir, limit_mb)
+    key = seed_key(builder, branch)
+
+    if action == 'fetch':
+        build_number, cold_interval = sys.argv[7:9]
+        report_property('bootstrap_seed', fetch(
+            cache, key, bin_dir, int(build_number), int(cold_interval)
+        ))
+
+    elif action == 'store':
+        revision = sys.argv[7]
+        files = {}
+        for name in binary_names:
+            if path.isfile(path.join(bin_dir, name)):
+                files[name] = path.join(bin_dir, name)
+        if exe_name('nim') not in files:
+            sys.exit('No compiler found in {0}'.format(bin_dir))
+        cache.store(key, files, {'binaries': sorted(files),
+                                 'revision': revision})
+        print('Stored the compiler built from {0} as {1}'.format(revision, key))
+
+    else:
+        sys.exit('Unknown action {0}'.format(action))
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,58 @@
+import os
+import re
+import glob
+import sys
+import time
 from pathlib import PureWindowsPath, PurePosixPath
+from twisted.internet import defer, threads
 from buildbot.steps.source.git import Git
-from buildbot.steps.shell import ShellCommand
-from buildbot.steps.transfer import FileUpload, DirectoryUpload
+from buildbot.steps.shell import ShellCommand, SetPropertyFromCommand
+from buildbot.steps.transfer import FileUpload, FileDownload, DirectoryUpload
+from buildbot.steps.trigger import Trigger
 from buildbot.steps.mswin import Robocopy
 from buildbot.process.factory import BuildFactory
+from buildbot.process.buildstep import BuildStep, RemoteShellCommand
 from buildbot.process.properties import Property, Interpolate, renderer
-from buildbot.status.results import FAILURE, SUCCESS
+from buildbot.status.results import FAILURE, SUCCESS, WARNINGS, SKIPPED
 from buildbot.steps.master import MasterShellCommand
+from test_warehouse import default_warehouse_path
+from step_timings import default_timings_path
+from benchmark_history import default_history_path
+from verified_builds import VerifiedBuilds, default_verified_path
+from verified_builds import link_artifacts
+from change_filter import classify_files
+from testament_db import merge_databases
+import testament_queue
+import content_store
 
 # Constants
 
 # Properties
-python_exe_prop          = Property('python_exe', default='python')
-dir_command_prop         = Property('dir_command')
-run_cpp_builds_prop      = Property('run_cpp_builds')
-run_release_builds_prop  = Property('run_release_builds')
-hide_cpp_builds_prop     = Property('hide_cpp_builds')
-hide_release_builds_prop = Property('hide_release_builds')
+python_exe_prop           = Property('python_exe', default='python')
+dir_command_prop          = Property('dir_command')
+run_cpp_builds_prop       = Property('run_cpp_builds')
+run_release_builds_prop   = Property('run_release_builds')
+hide_cpp_builds_prop      = Property('hide_cpp_builds')
+hide_release_builds_prop  = Property('hide_release_builds')
+cache_dir_prop            = Property('cache_dir', default='../cache')
+csources_cache_limit_prop = Property('csources_cache_limit', default=256)
+koch_cache_limit_prop     = Property('koch_cache_limit', default=64)
+use_git_mirrors_prop      = Property('use_git_mirrors')
+git_mirror_gc_prop        = Property('git_mirror_gc_interval', default=50)
+testament_shards_prop     = Property('testament_shards', default='auto')
+use_ccache_prop           = Property('use_ccache')
+ccache_limit_prop         = Property('ccache_limit', default=2048)
+persistent_nimcache_prop  = Property('persistent_nimcache')
+variant_jobs_prop         = Property('compiler_variant_jobs', default='auto')
+timing_threshold_prop     = Property('step_timing_threshold', default=0.3)
+run_benchmarks_prop       = Property('run_benchmarks')
+benchmark_threshold_prop  = Property('benchmark_threshold', default=0.15)
+force_rebuild_prop        = Property('force_rebuild')
+test_reruns_prop          = Property('test_reruns', default=3)
+max_test_reruns_prop      = Property('max_test_reruns', default=25)
+use_bootstrap_seed_prop   = Property('use_bootstrap_seed')
+seed_cold_interval_prop   = Property('bootstrap_seed_cold_interval', default=20)
+seed_cache_limit_prop     = Property('bootstrap_seed_limit', default=128)
 
 # Git Repositories
 nim_git_url      = 'https://github.com/nim-lang/Nim'
@@ -80,6 +116,107 @@ def step_has_properties(names, default=None, giveResults=False, sentinal=None):
         return check_for_property
 
 
+def step_property_is(name, value, default=None, giveResults=False):
+    def check_property(step):
+        return step.getProperty(name, default) == value
+    if giveResults:
+        return lambda results, s: check_property(s)
+    else:
+        return check_property
+
+
+def step_property_is_not(name, value, default=None, giveResults=False):
+    def check_property(step):
+        return step.getProperty(name, default) != value
+    if giveResults:
+        return lambda results, s: check_property(s)
+    else:
+        return check_property
+
+
+def step_all(*checks):
+    """
+    Combines doStepIf values, so that a step only runs when all of them
+    hold.
+    """
+    def check_all(step):
+        return all(check(step) if callable(check) else check
+                   for check in checks)
+    return check_all
+
+
+def extract_properties(rc, stdout, stderr):
+    """
+    Collects the properties reported by the utility scripts, which print
+    them as 'property: name=value' lines.
+    """
+    properties = {}
+    for line in stdout.splitlines():
+        if line.startswith('property: '):
+            name, _, value = line[len('property: '):].partition('=')
+            properties[name.strip()] = value.strip()
+    return properties
+
+
+def FormatInterpolate(format_string):
+    @renderer
+    def render_revision(props):
+        return format_string.format(**props.properties)
+    return render_revision
+
+
+@renderer
+def ccache_dir(props):
+    configured = props.getProperty('ccache_dir')
+    if configured:
+        return configured
+    return props.getProperty('cache_dir', '../cache') + '/ccache'
+
+
+@renderer
+def nim_branch(props):
+    """
+    The branch of the Nim repository. The 'branch' property is only set for
+    builds of a single codebase, these builds have three.
+    """
+    build = props.getBuild()
+    sourcestamp = build.getSourceStamp('nim') if build is not None else None
+    if sourcestamp is None or not sourcestamp.branch:
+        return 'default'
+    return sourcestamp.branch
+
+
+def compiler_env(env):
+    """
+    Renders a step environment which routes C compiler calls through ccache
+    once the compiler cache has been set up for the build.
+    """
+    @renderer
+    def render_env(props):
+        result = dict(env)
+        bin_dir = props.getProperty('ccache_bin_dir')
+        if bin_dir:
+            result['PATH'] = [bin_dir] + env['PATH']
+            result['CCACHE_DIR'] = props.getProperty('ccache_dir')
+            result['CCACHE_BASEDIR'] = props.getProperty('ccache_basedir')
+        return result
+    return render_env
+
+
+def nimcache_command(command, name):
+    """
+    Renders a compiler command which uses the persistent nimcache prepared
+    under 'name', when there is one.
+    """
+    @renderer
+    def render_command(props):
+        nimcache = props.getProperty('nimcache_' + name)
+        if nimcache:
+            return command + ['--nimcache:' + nimcache]
+        return command
+    return render_command
+
+
 def gen_dest_filename(s):
     parts = s.rsplit('.', 1)
     result = '{1}-{0}'.format('{buildnumber[0]}', parts[0])
@@ -99,6 +236,359 @@ def get_codebase(change_dict):
     return repositories[change_dict['repository']]
 
 
+# Artifacts a build uploads to its test-data directory
+test_artifacts = ['testresults.html', 'testament.db', 'benchmarks.json']
+
+
+class SkipVerifiedBuild(BuildStep):
+    """
+    Ends the build early when the same builder already passed with the same
+    nim, csources and scripts revisions. The earlier build's artifacts are
+    linked under this build's number, so the usual URLs keep working.
+    """
+
+    def __init__(self, verified_path=default_verified_path, **kwargs):
+        BuildStep.__init__(self, **kwargs)
+        self.verified_path = verified_path
+
+    def start(self):
+        builder = self.getProperty('buildername')
+        revisions = self.getProperty('got_revision') or {}
+        store = VerifiedBuilds(self.verified_path)
+        try:
+            earlier = store.lookup(builder, revisions)
+        finally:
+            store.close()
+
+        if earlier is None:
+            self.step_status.setText(['not', 'verified', 'before'])
+            self.finished(SUCCESS)
+            return
+
+        test_url = 'test-data/{0}/{1}/'.format(builder, revisions['nim'])
+        dest_filename = lambda name, number: \
+            gen_dest_filename(name).format(buildnumber=[number])
+        linked = link_artifacts(
+            'public_html/' + test_url, test_artifacts, dest_filename,
+            earlier['number'], self.getProperty('buildnumber')
+        )
+        for name in linked:
+            self.addURL(name, test_url + name)
+
+        self.setProperty('verified_by_build', earlier['number'],
+                         'SkipVerifiedBuild')
+        self.step_status.setText(['verified', 'by', 'build',
+                                  str(earlier['number'])])
+        # The remaining steps are skipped, as after a halting failure.
+        self.build.terminate = True
+        self.finished(SUCCESS)
+
+
+class ClassifyChanges(BuildStep):
+    """
+    Classifies the build by the files its changes to the Nim repository
+    touch, setting the 'change_class' and 'change_reason' properties. For
+    test-only changes, 'test_categories' lists the categories to run.
+    """
+
+    def start(self):
+        files = []
+        for change in self.build.allChanges():
+            if getattr(change, 'codebase', 'nim') == 'nim':
+                files.extend(change.files)
+        change_class, categories, reason = classify_files(files)
+
+        self.setProperty('change_class', change_class, 'ClassifyChanges')
+        self.setProperty('change_reason', reason, 'ClassifyChanges')
+        if categories:
+            self.setProperty('test_categories', ','.join(categories),
+                             'ClassifyChanges')
+        self.addCompleteLog('classification', '{0}: {1}\n\n{2}\n'.format(
+            change_class, reason, '\n'.join(sorted(set(files)))
+        ))
+        self.step_status.setText([change_class, 'build:', reason])
+        self.finished(SUCCESS)
+
+
+class CacheLookup(SetPropertyFromCommand):
+    """
+    Runs a cache script's fetch action, and shows whether the cache had the
+    artifact, as reported in 'result_property', on the step.
+    """
+
+    def __init__(self, result_property, **kwargs):
+        SetPropertyFromCommand.__init__(self, **kwargs)
+        self.result_property = result_property
+
+    def getText(self, cmd, results):
+        return self.describe(True) + [
+            self.getProperty(self.result_property, 'unknown')
+        ]
+
+
+class RerunFailedTests(SetPropertyFromCommand):
+    """
+    Runs rerun_failures.py, and shows how many of the failing tests turned
+    out flaky, failed consistently or weren't rerun on the step.
+    """
+
+    def getText(self, cmd, results):
+        return self.describe(True) + [
+            '{0} flaky'.format(self.getProperty('tests_flaky', 0)),
+            '{0} failing'.format(
+                self.getProperty('tests_consistently_failing', 0)
+            ),
+            '{0} not rerun'.format(self.getProperty('tests_not_rerun', 0))
+        ]
+
+
+class CreateTestamentQueue(BuildStep):
+    """
+    Queues the categories listed in 'testament_categories' on the master,
+    for the testament workers of a platform pool.
+    """
+
+    def __init__(self, pool, **kwargs):
+        BuildStep.__init__(self, **kwargs)
+        self.pool = pool
+
+    def start(self):
+        categories = [c for c in
+                      (self.getProperty('testament_categories') or '').split(',')
+                      if c]
+        queue_name = testament_queue.queue_id(
+            self.getProperty('buildername'), self.getProperty('buildnumber')
+        )
+        testament_queue.create_queue(queue_name, self.pool, categories)
+        self.setProperty('testament_queue', queue_name, 'CreateTestamentQueue')
+        self.step_status.setText(['queued', str(len(categories)),
+                                  'categories'])
+        self.finished(SUCCESS)
+
+
+class RunTestamentItems(BuildStep):
+    """
+    Runs on a testament worker: claims a batch of categories from the
+    master's queue, one for each of the slave's testament shards, and runs
+    them through testament_shards.py, until the queue is empty. The command
+    gets the batch's categories and the database collecting the results
+    appended. Categories claimed by a worker which fails go back to the
+    queue.
+    """
+    flunkOnFailure = True
+
+    def __init__(self, workdir, command, results_db, env, **kwargs):
+        BuildStep.__init__(self, **kwargs)
+        self.workdir = workdir
+        self.command = command
+        self.results_db = results_db
+        self.env = env
+
+    def batch_size(self):
+        shards = str(self.getProperty(testament_shards_prop.key, 'auto'))
+        if shards.isdigit():
+            return max(int(shards), 1)
+        try:
+            return max(int(self.getProperty('slave_cpus', 1)), 1)
+        except ValueError:
+            return 1
+
+    def start(self):
+        d = self.run_items()
+        d.addCallbacks(self.finished, self.failed)
+
+    @defer.inlineCallbacks
+    def run_items(self):
+        queue = testament_queue.get_queue(self.getProperty('testament_queue'))
+        if queue is None:
+            self.step_status.setText(['no', 'testament', 'queue'])
+            defer.returnValue(SKIPPED)
+
+        worker = self.getProperty('buildername')
+        env = yield self.build.render(self.env)
+        command = yield self.build.render(self.command)
+        batch_size = self.batch_size()
+        log = self.addLog('stdio')
+        ran = []
+        failed = []
+        try:
+            while True:
+                categories = queue.claim(worker, batch_size)
+                if not categories:
+                    break
+                batch_command = command + [','.join(categories),
+                                           self.results_db]
+                log.addHeader('> {0}\n'.format(' '.join(
+                    str(part) for part in batch_command
+                )))
+                started = time.time()
+                cmd = RemoteShellCommand(self.workdir, batch_command,
+                                         env=env, timeout=None)
+                cmd.useLog(log, False)
+                yield self.runCommand(cmd)
+                passed = cmd.rc == 0
+                queue.complete_batch(categories, worker, passed,
+                                     time.time() - started)
+                ran.extend(categories)
+                if not passed:
+                    failed.extend(categories)
+                self.step_status.setText(['ran', str(len(ran)), 'categories'])
+        finally:
+            queue.release(worker)
+
+        self.setProperty('testament_items_run', len(ran), 'RunTestamentItems')
+        if failed:
+            self.step_status.setText2(['failed:'] + failed)
+            defer.returnValue(FAILURE)
+        defer.returnValue(SUCCESS)
+
+
+class FinishTestamentQueue(BuildStep):
+    """
+    Merges the results the testament workers uploaded into a single
+    'testament.db', once the workers are done. Categories which failed, or
+    which no worker ran, fail the step.
+    """
+    flunkOnFailure = True
+
+    def start(self):
+        queue_name = self.getProperty('testament_queue')
+        queue = testament_queue.remove_queue(queue_name)
+        if queue is None:
+            self.step_status.setText(['no', 'testament', 'queue'])
+            self.finished(FAILURE)
+            return
+
+        work_dir = testament_queue.work_dir(queue_name)
+        target = os.path.join(work_dir, 'testament.db')
+        sources = sorted(name for name in
+                         glob.glob(os.path.join(work_dir, '*.db'))
+                         if name != target)
+        if os.path.exists(target):
+            os.remove(target)
+
+        # Merging large databases would stall the master's event loop.
+        d = threads.deferToThread(merge_databases, target, sources)
+        d.addCallback(lambda _: self.summarize(queue, sources))
+        d.addErrback(self.failed)
+
+    def summarize(self, queue, sources):
+        queue.save_timings()
+        failed = queue.failed()
+        unfinished = queue.unfinished()
+        workers = sorted(set(worker for worker, _, _ in queue.results.values()))
+        self.addCompleteLog('summary', ''.join(
+            '{0}: {1} on {2} in {3:.0f}s\n'.format(
+                category, 'passed' if passed else 'failed', worker, seconds
+            ) for category, (worker, passed, seconds)
+            in sorted(queue.results.items())
+        ) + ''.join('{0}: not run\n'.format(c) for c in unfinished))
+
+        text = ['merged', str(len(sources)), 'results', 'from',
+                str(len(workers)), 'workers']
+        if unfinished:
+            text += [str(len(unfinished)), 'categories', 'not', 'run']
+        if failed:
+            text += [str(len(failed)), 'categories', 'failed']
+        self.step_status.setText(text)
+        self.finished(FAILURE if failed or unfinished else SUCCESS)
+
+
+class MirroredGit(Git):
+    """
+    Git checkout which borrows objects from a mirror on the slave, when its
+    reference renders to one. Objects come from the mirror, so such clones
+    aren't shallow, and they are dissociated from the mirror, so that
+    maintenance or a reclone of the mirror can't break the checkout. Without
+    a mirror, the clone stays shallow.
+    """
+
+    def _clone(self, shallowClone):
+        return Git._clone(self, shallowClone and not self.reference)
+
+    def _dovccmd(self, command, *args, **kwargs):
+        if command and command[0] == 'clone' and self.reference:
+            command = command[:1] + ['--dissociate'] + command[1:]
+        return Git._dovccmd(self, command, *args, **kwargs)
+
+
+class LinkStoredContent(BuildStep):
+    """
+    Runs on the master before an upload: when the content store holds the
+    content the slave hashed, links it to the upload's destination instead
+    of transferring it. Sets the result property to 'hit' or 'miss'.
+    """
+    renderables = ['masterdest', 'url']
+
+    def __init__(self, digest_property, result_property, masterdest,
+                 url=None, store_root=content_store.default_store_root,
+                 **kwargs):
+        BuildStep.__init__(self, **kwargs)
+        self.digest_property = digest_property
+        self.result_property = result_property
+        self.masterdest = masterdest
+        self.url = url
+        self.store_root = store_root
+
+    def start(self):
+        digest = self.getProperty(self.digest_property)
+        if not digest:
+            self.linked(None)
+            return
+        d = threads.deferToThread(content_store.link, self.store_root,
+                                  digest, self.masterdest)
+        d.addCallback(self.linked)
+        d.addErrback(self.failed)
+
+    def linked(self, hashes):
+        self.setProperty(self.result_property, 'miss' if hashes is None
+                         else 'hit', 'LinkStoredContent')
+        if hashes is not None:
+            if self.url is not None:
+                self.addURL(os.path.basename(self.masterdest), self.url)
+            self.step_status.setText(['reused', str(len(hashes)),
+                                      'stored', 'files'])
+        else:
+            self.step_status.setText(['content', 'not', 'stored'])
+        self.finished(SUCCESS)
+
+
+class StoreUploadedContent(BuildStep):
+    """
+    Runs on the master after an upload, adding the uploaded files to the
+    content store.
+    """
+    renderables = ['masterdest']
+
+    def __init__(self, digest_property, masterdest,
+                 store_root=content_store.default_store_root, **kwargs):
+        BuildStep.__init__(self, **kwargs)
+        self.digest_property = digest_property
+        self.masterdest = masterdest
+        self.store_root = store_root
+
+    def start(self):
+        d = threads.deferToThread(content_store.add, self.store_root,
+                                  self.getProperty(self.digest_property),
+                                  self.masterdest)
+        d.addCallback(self.stored)
+        d.addErrback(self.failed)
+
+    def stored(self, added):
+        self.step_status.setText(['stored', str(added), 'bytes'])
+        self.finished(SUCCESS)
+
+
+def step_is_full_build(step):
+    return step.getProperty('change_class') != 'tests'
+
+
+# Whether the build boots from csources, rather than from the bootstrap seed,
+# and whether booting from the seed failed, so csources are needed after all.
+seed_unused = step_property_is_not('bootstrap_seed', 'hit')
+seed_boot_failed = step_property_is('seed_boot', 'failed')
+
+
 # Cross-Platform Environment Calculation
 class PlatformPaths:
     pass
@@ -108,16 +598,21 @@ for key, value in resource_dirs.iteritems():
     setattr(windows_directories, key, PureWindowsPath(value))
     setattr(posix_directories, key, PurePosixPath(value))
 for platform in [windows_directories, posix_directories]:
-    platform.base_env = {
+    platform.base_env = compiler_env({
         'PATH': [
             str(platform.current_dir),
             str(platform.nim_dir / 'bin'),
             'bin',
             "${PATH}"
         ]
-    }
+    })
 windows_directories.nim_exe = "nim.exe"
 posix_directories.nim_exe = "nim"
+windows_directories.tester_exe = "tester.exe"
+posix_directories.tester_exe = "tester"
+# 'koch csources' puts its build scripts here, relative to the Nim tree.
+windows_directories.release_script_dir = PureWindowsPath('build')
+posix_directories.release_script_dir = PurePosixPath('build')
 
 
 def inject_paths(func):
@@ -134,13 +629,51 @@ def inject_paths(func):
 @inject_paths
 def update_utility_scripts(platform):
     """
-    Updates the utility scripts used by other steps.
+    Updates the utility scripts used by other steps. The checkout borrows
+    objects from the slave's mirror of the scripts repository, when the
+    previous build left a valid one. The mirror itself is updated later, by
+    update_repositories, as that needs the scripts.
     """
     common_parameters = common_git_parameters.copy()
     common_parameters['haltOnFailure'] = False
+    mirror = Interpolate('%(prop:cache_dir:-../cache)s/git/scripts.git')
+    path_type = type(platform.scripts_dir)
+
+    @renderer
+    def scripts_reference(props):
+        if props.getProperty('scripts_mirror_valid') != 'yes':
+            return None
+        mirror_path = path_type(mirror.getRenderingFor(props))
+        if not mirror_path.is_absolute():
+            # The checkout runs in the scripts directory.
+            mirror_path = path_type(
+                *(['..'] * len(platform.scripts_dir.parts))
+            ) / mirror_path
+        return str(mirror_path)
 
     return [
-        Git(
+        SetPropertyFromCommand(
+            command           = ['git', '--git-dir', mirror, 'rev-parse',
+                                 '--verify', '--quiet', 'HEAD'],
+            workdir           = str(platform.current_dir),
+            extract_fn        = lambda rc, stdout, stderr: {
+                'scripts_mirror_valid': 'yes' if rc == 0 else 'no'
+            },
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = False,
+            doStepIf          = step_has_property(
+                name    = use_git_mirrors_prop.key,
+                default = True
+            ),
+            hideStepIf        = True,
+            **gen_description(
+                'Check', 'Checking', 'Checked', 'Utility Scripts Mirror'
+            )
+        ),
+
+        MirroredGit(
+            reference         = scripts_reference,
             name              = "Update Utility Scripts",
             descriptionSuffix = ' Utility Scripts',
             repourl           = scripts_git_url,
@@ -155,29 +688,154 @@ def update_utility_scripts(platform):
     ]
 
 
+@inject_paths
+def sample_slave_load(platform):
+    """
+    Records the slave's load average as the 'slave_load' property, which is
+    stored with the timings of the steps that follow.
+    """
+    script_path = str(platform.scripts_dir / 'slave_load.py')
+
+    return [
+        SetPropertyFromCommand(
+            command           = [python_exe_prop, script_path],
+            workdir           = str(platform.current_dir),
+            extract_fn        = extract_properties,
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = False,
+            hideStepIf        = True,
+            **gen_description(
+                'Sample', 'Sampling', 'Sampled', 'Slave Load'
+            )
+        )
+    ]
+
+
 @inject_paths
 def update_repositories(platform):
     """
     Adds the steps needed to update the csources and Nimrod repositories.
+    The slave's mirrors of the repositories are updated first, and the
+    checkouts borrow their objects from them.
     """
+    script_path = str(platform.scripts_dir / 'git_mirror.py')
+    mirror_dir = Interpolate('%(prop:cache_dir:-../cache)s/git')
+    mirror_args = [
+        '{0}={1}'.format(name, url) for url, name in sorted(repositories.items())
+    ]
+
+    git_parameters = common_git_parameters.copy()
+
     return [
-        Git(
+        SetPropertyFromCommand(
+            command           = [python_exe_prop, script_path, mirror_dir,
+                                 git_mirror_gc_prop] + mirror_args,
+            workdir           = str(platform.current_dir),
+            extract_fn        = extract_properties,
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = True,
+            doStepIf          = step_has_property(
+                name    = use_git_mirrors_prop.key,
+                default = True
+            ),
+            **gen_description(
+                'Update', 'Updating', 'Updated', 'Git Mirrors'
+            )
+        ),
+
+        MirroredGit(
             name              = "Update Local Nim Repository",
             descriptionSuffix = ' Local Nim Repository',
             repourl           = nim_git_url,
             codebase          = repositories[nim_git_url],
             workdir           = str(platform.nim_dir),
-            **common_git_parameters
+            reference         = Property('nim_mirror', default=None),
+            **git_parameters
         ),
 
-        Git(
+        MirroredGit(
             name              = "Update Local CSources Repository",
             descriptionSuffix = ' Local CSources Repository',
             repourl           = csources_git_url,
             codebase          = repositories[csources_git_url],
             workdir           = str(platform.csources_dir),
             alwaysUseLatest   = True,
-            **common_git_parameters
+            reference         = Property('csources_mirror', default=None),
+            **git_parameters
+        )
+    ]
+
+
+@inject_paths
+def classify_changes(platform):
+    """
+    Decides which parts of the build the changes being built need.
+    """
+    return [
+        ClassifyChanges(
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = True,
+            **gen_description(
+                'Classify', 'Classifying', 'Classified', 'Changes'
+            )
+        )
+    ]
+
+
+@inject_paths
+def skip_verified_build(platform):
+    """
+    Skips the rest of the build when its revisions were already verified on
+    this builder, unless the 'force_rebuild' property is set.
+    """
+    return [
+        SkipVerifiedBuild(
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            doStepIf          = step_property_is_not(
+                name    = force_rebuild_prop.key,
+                value   = True,
+                default = False
+            ),
+            **gen_description(
+                'Check', 'Checking', 'Checked', 'Earlier Verification'
+            )
+        )
+    ]
+
+
+@inject_paths
+def record_verified_build(platform):
+    """
+    Records the revisions of a full build which passed, so that later builds
+    of the same revisions on this builder are skipped.
+    """
+    return [
+        MasterShellCommand(
+            command    = [
+                sys.executable, 'verified_builds.py', 'record',
+                default_verified_path,
+                FormatInterpolate('{buildername[0]}'),
+                FormatInterpolate('{buildnumber[0]}'),
+                FormatInterpolate('{got_revision[0][nim]}'),
+                FormatInterpolate('{got_revision[0][csources]}'),
+                FormatInterpolate('{got_revision[0][scripts]}')
+            ],
+            flunkOnFailure  = False,
+            warnOnFailure   = True,
+            # Test-only builds skip parts of a full build, so they don't
+            # verify the revisions.
+            doStepIf        = lambda step: (
+                step.build.result in (SUCCESS, WARNINGS) and
+                step_is_full_build(step)
+            ),
+            hideStepIf      = True,
+            **gen_description(
+                'Record', 'Recording', 'Recorded', 'Verified Revisions'
+            )
         )
     ]
 
@@ -221,163 +879,846 @@ def clean_repositories(platform):
 
 
 @inject_paths
-def build_csources(platform, csources_script_cmd):
+def setup_compiler_cache(platform):
+    """
+    Prepares the slave's ccache, which the C compilation steps use through
+    'platform.base_env' when the 'use_ccache' property is set.
+    """
+    script_path = str(platform.scripts_dir / 'compiler_cache.py')
+
+    return [
+        SetPropertyFromCommand(
+            command           = [python_exe_prop, script_path, 'setup',
+                                 ccache_dir, ccache_limit_prop],
+            workdir           = str(platform.current_dir),
+            extract_fn        = extract_properties,
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = True,
+            doStepIf          = step_has_property(
+                name    = use_ccache_prop.key,
+                default = False
+            ),
+            hideStepIf        = True,
+            **gen_description(
+                'Prepare', 'Preparing', 'Prepared', 'Compiler Cache'
+            )
+        )
+    ]
+
+
+def report_compiler_cache(platform, step_name, doStepIf=True):
+    """
+    Reports the ccache hit rate of the compilations since the last report
+    as the '{step_name}_ccache_hit_rate' property. Unlike the step functions,
+    this takes the platform's paths, as it's called from within them.
+    """
+    script_path = str(platform.scripts_dir / 'compiler_cache.py')
+
+    def should_report(step):
+        if not step.getProperty('ccache_bin_dir'):
+            return False
+        if callable(doStepIf):
+            return doStepIf(step)
+        return doStepIf
+
+    return [
+        SetPropertyFromCommand(
+            command           = [python_exe_prop, script_path, 'stats',
+                                 ccache_dir, step_name],
+            workdir           = str(platform.current_dir),
+            extract_fn        = extract_properties,
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = False,
+            doStepIf          = should_report,
+            hideStepIf        = True,
+            **gen_description(
+                'Report', 'Reporting', 'Reported',
+                'Compiler Cache Usage ({0})'.format(step_name)
+            )
+        )
+    ]
+
+
+def prepare_nimcache(platform, name, flags, doStepIf=True):
+    """
+    Prepares the persistent nimcache used by 'nimcache_command' for the
+    same name. Like report_compiler_cache, this takes the platform's paths.
+    """
+    script_path = str(platform.scripts_dir / 'persistent_nimcache.py')
+    nim_exe = str(platform.nim_dir / 'bin' / platform.nim_exe)
+
+    return [
+        SetPropertyFromCommand(
+            command           = [python_exe_prop, script_path, cache_dir_prop,
+                                 Property('buildername'),
+                                 nim_branch,
+                                 name, nim_exe] + flags,
+            workdir           = str(platform.current_dir),
+            extract_fn        = extract_properties,
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = True,
+            doStepIf          = step_all(doStepIf, step_has_property(
+                name    = persistent_nimcache_prop.key,
+                default = False
+            )),
+            hideStepIf        = True,
+            **gen_description(
+                'Prepare', 'Preparing', 'Prepared',
+                'Persistent Nimcache ({0})'.format(name)
+            )
+        )
+    ]
+
+
+@inject_paths
+def build_csources(platform, csources_script_cmd, doStepIf=True):
     """
     Builds the csources binary. Requires that the csources repository be
     present and that a suitable C compiler be present on the system path.
+    The binary is restored from the slave's csources cache instead when one
+    was already built from the same csources revision, compiler and platform.
     """
+    cache_missed = step_all(
+        doStepIf, step_property_is_not('csources_cache', 'hit')
+    )
+    bin_dir = str(platform.nim_dir / 'bin')
+    script_path = str(platform.scripts_dir / 'csources_cache.py')
+    cache_args = [
+        cache_dir_prop,
+        csources_cache_limit_prop,
+        FormatInterpolate('{got_revision[0][csources]}'),
+        csources_script_cmd,
+        bin_dir
+    ]
+
     return [
+        SetPropertyFromCommand(
+            command           = [python_exe_prop, script_path, 'fetch'] + cache_args,
+            workdir           = str(platform.current_dir),
+            extract_fn        = extract_properties,
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = True,
+            doStepIf          = doStepIf,
+            **gen_description(
+                'Restore', 'Restoring', 'Restored', 'Cached CSources Binary'
+            )
+        ),
+
         ShellCommand(
             command           = csources_script_cmd,
             workdir           = str(platform.csources_dir),
+            env               = platform.base_env,
             haltOnFailure     = True,
+            doStepIf          = cache_missed,
             **gen_description(
                 'Build', 'Building', 'Built', 'Basic CSources Binary'
             )
+        ),
+    ] + report_compiler_cache(
+        platform, 'csources',
+        doStepIf = cache_missed
+    ) + [
+
+        SetPropertyFromCommand(
+            command           = [python_exe_prop, script_path, 'store'] + cache_args,
+            workdir           = str(platform.current_dir),
+            extract_fn        = extract_properties,
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = True,
+            doStepIf          = cache_missed,
+            hideStepIf        = True,
+            **gen_description(
+                'Cache', 'Caching', 'Cached', 'CSources Binary'
+            )
+        )
+    ]
+
+
+@inject_paths
+def normalize_nim_names(platform, doStepIf=True):
+    """
+    Makes sure that both a 'nim' and 'nimrod' binary are present.
+    """
+    bin_dir = str(platform.nim_dir / 'bin')
+    script_path = str(platform.scripts_dir / 'normalize_nim.py')
+
+    return [
+        ShellCommand(
+            command           = [python_exe_prop, script_path, bin_dir],
+            workdir           = str(platform.current_dir),
+            hideStepIf        = False,
+            doStepIf          = doStepIf,
+            **gen_description(
+                'Normalize', 'Normalizing', 'Normalized', 'Binary Names'
+            )
+        )
+    ]
+
+
+@inject_paths
+def fetch_bootstrap_seed(platform):
+    """
+    Restores the compiler which the last passing build of this builder and
+    branch left in the slave's seed cache, so that 'koch boot' can start
+    from it instead of from csources. Opt-in, and skipped on cold builds.
+    """
+    return [
+        CacheLookup(
+            result_property   = 'bootstrap_seed',
+            command           = [python_exe_prop,
+                                 str(platform.scripts_dir / 'bootstrap_seed.py'),
+                                 'fetch', cache_dir_prop, seed_cache_limit_prop,
+                                 Property('buildername'),
+                                 nim_branch,
+                                 str(platform.nim_dir / 'bin'),
+                                 Property('buildnumber'),
+                                 seed_cold_interval_prop],
+            workdir           = str(platform.current_dir),
+            extract_fn        = extract_properties,
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = True,
+            doStepIf          = step_has_property(
+                name    = use_bootstrap_seed_prop.key,
+                default = False
+            ),
+            hideStepIf        = lambda results, step: results == SKIPPED,
+            **gen_description(
+                'Restore', 'Restoring', 'Restored', 'Bootstrap Seed'
+            )
+        )
+    ]
+
+
+@inject_paths
+def boot_from_seed(platform):
+    """
+    Runs 'koch boot' with the restored bootstrap seed. A failure doesn't
+    fail the build, it sets 'seed_boot' so that csources are built and the
+    usual boot runs instead.
+    """
+    script_path = str(platform.scripts_dir / 'bootstrap_seed.py')
+    boot_command = nimcache_command(['koch', 'boot'], 'boot')
+    seeded = step_property_is('bootstrap_seed', 'hit')
+
+    @renderer
+    def seed_boot_command(props):
+        return [props.getProperty('python_exe', 'python'), script_path,
+                'boot', str(platform.nim_dir)] + \
+            boot_command.getRenderingFor(props)
+
+    return prepare_nimcache(platform, 'boot', [], seeded) + [
+        SetPropertyFromCommand(
+            command           = seed_boot_command,
+            workdir           = str(platform.current_dir),
+            env               = platform.base_env,
+            extract_fn        = extract_properties,
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = True,
+            doStepIf          = seeded,
+            hideStepIf        = lambda results, step: results == SKIPPED,
+            **gen_description(
+                'Bootstrap', 'Booting', 'Booted',
+                'Nim Compiler From Bootstrap Seed'
+            )
+        )
+    ] + report_compiler_cache(platform, 'seed_boot', seeded)
+
+
+@inject_paths
+def store_bootstrap_seed(platform):
+    """
+    Keeps the compiler of a passing build as the bootstrap seed of later
+    builds of the same builder and branch.
+    """
+    return [
+        ShellCommand(
+            command           = [python_exe_prop,
+                                 str(platform.scripts_dir / 'bootstrap_seed.py'),
+                                 'store', cache_dir_prop, seed_cache_limit_prop,
+                                 Property('buildername'),
+                                 nim_branch,
+                                 str(platform.nim_dir / 'bin'),
+                                 FormatInterpolate('{got_revision[0][nim]}')],
+            workdir           = str(platform.current_dir),
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = True,
+            doStepIf          = lambda step: (
+                step.getProperty(use_bootstrap_seed_prop.key, False) and
+                step.build.result in (SUCCESS, WARNINGS)
+            ),
+            hideStepIf        = True,
+            **gen_description(
+                'Store', 'Storing', 'Stored', 'Bootstrap Seed'
+            )
+        )
+    ]
+
+
+@inject_paths
+def compile_koch(platform):
+    """
+    Compiles the koch utility. The binary is restored from the slave's koch
+    cache instead when one was already built from the same modules by the
+    same compiler.
+    """
+    script_path = str(platform.scripts_dir / 'koch_cache.py')
+    cache_args = [cache_dir_prop, koch_cache_limit_prop, str(platform.nim_dir)]
+
+    return [
+        CacheLookup(
+            result_property   = 'koch_cache',
+            command           = [python_exe_prop, script_path, 'fetch'] + cache_args,
+            workdir           = str(platform.current_dir),
+            extract_fn        = extract_properties,
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = True,
+            **gen_description(
+                'Restore', 'Restoring', 'Restored', 'Cached Koch Binary'
+            )
+        ),
+
+        ShellCommand(
+            command           = ['nim', 'c', 'koch.nim'],
+            workdir           = str(platform.nim_dir),
+            env               = platform.base_env,
+            haltOnFailure     = True,
+            doStepIf          = step_property_is_not('koch_cache', 'hit'),
+            **gen_description(
+                'Compile', 'Compiling', 'Compiled', 'Koch Binary'
+            )
+        ),
+    ] + report_compiler_cache(
+        platform, 'koch',
+        doStepIf = step_property_is_not('koch_cache', 'hit')
+    ) + [
+
+        SetPropertyFromCommand(
+            command           = [python_exe_prop, script_path, 'store'] + cache_args,
+            workdir           = str(platform.current_dir),
+            extract_fn        = extract_properties,
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = True,
+            doStepIf          = step_property_is_not('koch_cache', 'hit'),
+            hideStepIf        = True,
+            **gen_description(
+                'Cache', 'Caching', 'Cached', 'Koch Binary'
+            )
+        )
+    ]
+
+
+def variant_enabled(props, variant):
+    # 'props' is either a build's properties or a step. Test-only changes
+    # leave the compiler unchanged, so its variants needn't be built.
+    if props.getProperty('change_class') == 'tests':
+        return False
+    enabled = props.getProperty(variant['run_property'])
+    if enabled is None:
+        return True
+    return enabled
+
+
+def run_compiler_variants(platform, variants):
+    """
+    Runs independent compiler variants concurrently in a single step, at
+    most 'compiler_variant_jobs' at a time, followed by a step per variant
+    which shows its output and result. Each variant is a dict holding its
+    'name', its 'command', the 'run_property' which enables it, and the
+    'parameters' of its step. Like report_compiler_cache, this takes the
+    platform's paths.
+    """
+    script_path = str(platform.scripts_dir / 'compiler_variants.py')
+    results_dir = str(platform.nim_dir / 'compiler-variants')
+
+    @renderer
+    def run_command(props):
+        command = [props.render(python_exe_prop), script_path, 'run',
+                   results_dir, props.render(variant_jobs_prop),
+                   str(platform.nim_dir)]
+        for variant in variants:
+            if variant_enabled(props, variant):
+                command += [variant['name']] + variant['command'] + ['--']
+        return command
+
+    def any_enabled(step):
+        return any(variant_enabled(step, variant) for variant in variants)
+
+    steps = [
+        ShellCommand(
+            command           = run_command,
+            workdir           = str(platform.current_dir),
+            env               = platform.base_env,
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = True,
+            doStepIf          = any_enabled,
+            timeout           = None,
+            **gen_description(
+                'Run', 'Running', 'Run', 'Compiler Variants'
+            )
+        )
+    ]
+    steps.extend(report_compiler_cache(platform, 'variants',
+                                       doStepIf=any_enabled))
+
+    for variant in variants:
+        steps.append(ShellCommand(
+            command  = [python_exe_prop, script_path, 'report', results_dir,
+                        variant['name']],
+            workdir  = str(platform.current_dir),
+            doStepIf = lambda step, variant=variant: variant_enabled(
+                step, variant
+            ),
+            **variant['parameters']
+        ))
+    return steps
+
+
+@inject_paths
+def boot_nimrod_debug(platform):
+    nimfile_dir = str(platform.current_dir / "compiler" / 'nim.nim')
+
+    # Concurrent variants keep their nimcache and binary apart.
+    variant_options = [
+        '--nimcache:{variant_dir}/nimcache',
+        '-o:{variant_dir}/' + platform.nim_exe
+    ]
+
+    compiler_variants = [
+        dict(
+            name         = 'release',
+            command      = ['nim', 'c', '-d:release'] + variant_options +
+                           [nimfile_dir],
+            run_property = run_release_builds_prop.key,
+            parameters   = dict(
+                haltOnFailure     = False,
+
+                hideStepIf=step_has_property(
+                    name        = hide_release_builds_prop.key,
+                    default     = False,
+                    giveResults = True
+                ),
+
+                **gen_description(
+                    'Bootstrap', 'Booting', 'Booted', 
+                    'Release Version of Nim Compiler (With C Backend)',
+                )
+            )
+        ),
+
+        dict(
+            name         = 'cpp',
+            command      = ['nim', 'cpp'] + variant_options + [nimfile_dir],
+            run_property = run_cpp_builds_prop.key,
+            parameters   = dict(
+                haltOnFailure     = False,
+                warnOnFailure     = False,
+                flunkOnFailure    = False,
+                flunkOnWarnings   = False,
+
+                hideStepIf=step_has_property(
+                   name = hide_cpp_builds_prop.key,
+                   default       = False,
+                   giveResults  = True
+                ),
+
+                **gen_description(
+                    'Bootstrap', 'Booting', 'Booted', 
+                    'Debug Version of Nim Compiler (With C++ Backend)',
+                )
+            )
+        ),
+    ]
+
+    # A boot which started from the bootstrap seed needn't be repeated.
+    not_seeded = step_property_is_not('seed_boot', 'ok')
+
+    return prepare_nimcache(platform, 'boot', [], not_seeded) + [
+        ShellCommand(
+            command           = nimcache_command(['koch', 'boot'], 'boot'),
+            workdir           = str(platform.nim_dir),
+            env               = platform.base_env,
+            haltOnFailure     = True,
+            doStepIf          = not_seeded,
+            **gen_description(
+                'Bootstrap', 'Booting', 'Booted', 
+                'Debug Version of Nim Compiler (With C Backend)',
+            )
+        ),
+    ] + report_compiler_cache(platform, 'boot', not_seeded) + \
+        run_compiler_variants(platform, compiler_variants)
+
+
+@inject_paths
+def run_benchmarks(platform):
+    """
+    Measures the freshly booted compiler on the benchmark corpus, uploads
+    the results next to the test results, and updates the builder's trend
+    page. A benchmark which regressed marks the build with warnings.
+    """
+    test_url = "test-data/{buildername[0]}/{got_revision[0][nim]}/"
+    test_directory = 'public_html/' + test_url
+
+    benchmark_results = 'benchmarks.json'
+    benchmark_results_dest = gen_dest_filename(benchmark_results)
+
+    script_path = str(platform.scripts_dir / 'compiler_benchmark.py')
+    corpus_path = str(platform.scripts_dir / 'benchmarks' / 'corpus.json')
+    run_requested = step_has_property(
+        name    = run_benchmarks_prop.key,
+        default = True
+    )
+    should_run = lambda step: run_requested(step) and step_is_full_build(step)
+
+    return [
+        ShellCommand(
+            command           = [python_exe_prop, script_path,
+                                 str(platform.nim_dir),
+                                 str(platform.scripts_dir),
+                                 corpus_path, benchmark_results],
+            workdir           = str(platform.current_dir),
+            env               = platform.base_env,
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = True,
+            doStepIf          = should_run,
+            timeout           = None,
+            **gen_description(
+                'Run', 'Running', 'Run', 'Compiler Benchmarks'
+            )
+        ),
+
+        MasterShellCommand(
+            command    = ['mkdir', '-p', FormatInterpolate(test_directory)],
+            path       = "public_html",
+            doStepIf   = should_run,
+            hideStepIf = True
+        ),
+
+        FileUpload(
+            slavesrc   = benchmark_results,
+            workdir    = str(platform.current_dir),
+            url        = FormatInterpolate(test_url + benchmark_results_dest),
+            masterdest = FormatInterpolate(
+                test_directory + benchmark_results_dest
+            ),
+            flunkOnFailure  = False,
+            warnOnFailure   = True,
+            doStepIf   = should_run,
+        ),
+
+        MasterShellCommand(
+            command    = [
+                sys.executable, 'benchmark_history.py', 'ingest',
+                default_history_path,
+                FormatInterpolate(test_directory + benchmark_results_dest),
+                FormatInterpolate('{buildername[0]}'),
+                FormatInterpolate('{got_revision[0][nim]}'),
+                FormatInterpolate('{buildnumber[0]}'),
+                benchmark_threshold_prop,
+                FormatInterpolate('public_html/benchmarks/{buildername[0]}.html')
+            ],
+            flunkOnFailure  = False,
+            warnOnFailure   = True,
+            doStepIf        = should_run,
+            **gen_description(
+                'Record', 'Recording', 'Recorded', 'Benchmark Results'
+            )
+        )
+    ]
+
+
+@inject_paths
+def boot_nimrod_release(platform):
+    boot_flags = ['-d:release']
+
+    return prepare_nimcache(platform, 'boot', boot_flags) + [
+        ShellCommand(
+            command           = nimcache_command(
+                ['koch', 'boot'] + boot_flags, 'boot'
+            ),
+            workdir           = str(platform.nim_dir),
+            env               = platform.base_env,
+            haltOnFailure     = True,
+            **gen_description(
+                'Bootstrap', 'Booting', 'Booted', 
+                'Release Version of Nim Compiler (With C Backend)',
+            )
+        ),
+    ] + report_compiler_cache(platform, 'boot') + [
+        ShellCommand(
+            command           = ['koch', 'csources', '-d:release'],
+            workdir           = str(platform.nim_dir),
+            env               = platform.base_env,
+            haltOnFailure     = True,
+            **gen_description(
+                'Generate', 'Generating', 'Generated', 'C Sources'
+            )
+        ),
+    ]
+
+
+@inject_paths
+def generate_docs(platform):
+    """
+    Generates the documentation shipped with a release.
+    """
+    return [
+        ShellCommand(
+            command           = ['koch', 'web'],
+            workdir           = str(platform.nim_dir),
+            env               = platform.base_env,
+            haltOnFailure     = True,
+            **gen_description(
+                'Generate', 'Generating', 'Generated', 'Documentation'
+            )
         )
     ]
 
 
+# Release sources are kept on the master, in
+# '{release_sources_root}/{nim revision}/', for the installer builders.
+release_sources_root = 'release-artifacts'
+release_sources_archive = 'release-sources.tar.bz2'
+release_sources_path = FormatInterpolate(
+    release_sources_root + '/{got_revision[0][nim]}/' + release_sources_archive
+)
+release_installer_scheduler = 'release-installer-scheduler'
+
+
 @inject_paths
-def normalize_nim_names(platform):
+def publish_release_sources(platform):
     """
-    Makes sure that both a 'nim' and 'nimrod' binary are present.
+    Packs the generated C sources and documentation, keeps them on the
+    master, and triggers the installer builders of every architecture,
+    which build their installers from them.
     """
-    bin_dir = str(platform.nim_dir / 'bin')
-    script_path = str(platform.scripts_dir / 'normalize_nim.py')
+    archive = str(platform.nim_dir / release_sources_archive)
 
     return [
         ShellCommand(
-            command           = [python_exe_prop, script_path, bin_dir],
+            command           = [python_exe_prop,
+                                 str(platform.scripts_dir / 'release_sources.py'),
+                                 'pack', str(platform.nim_dir), archive],
             workdir           = str(platform.current_dir),
-            hideStepIf        = False,
+            haltOnFailure     = True,
             **gen_description(
-                'Normalize', 'Normalizing', 'Normalized', 'Binary Names'
+                'Pack', 'Packing', 'Packed', 'Release Sources'
             )
-        )
-    ]
+        ),
 
+        # Release sources of older revisions are no longer needed.
+        MasterShellCommand(
+            command         = ['find', release_sources_root, '-mindepth', '1',
+                               '-maxdepth', '1', '-mtime', '+14',
+                               '-exec', 'rm', '-rf', '{}', '+'],
+            flunkOnFailure  = False,
+            warnOnFailure   = False,
+            hideStepIf      = True
+        ),
 
-@inject_paths
-def compile_koch(platform):
-    """
-    Compiles the koch utility.
-    """
-    return [
-        ShellCommand(
-            command           = ['nim', 'c', 'koch.nim'],
-            workdir           = str(platform.nim_dir),
-            env               = platform.base_env,
+        FileUpload(
+            slavesrc   = archive,
+            workdir    = str(platform.current_dir),
+            masterdest = release_sources_path,
+            haltOnFailure = True,
+            **gen_description(
+                'Publish', 'Publishing', 'Published', 'Release Sources'
+            )
+        ),
+
+        Trigger(
+            schedulerNames    = [release_installer_scheduler],
+            waitForFinish     = True,
+            updateSourceStamp = True,
             haltOnFailure     = True,
             **gen_description(
-                'Compile', 'Compiling', 'Compiled', 'Koch Binary'
+                'Build', 'Building', 'Built', 'Installers'
             )
         )
     ]
 
 
 @inject_paths
-def boot_nimrod_debug(platform):
-    nimfile_dir = str(platform.current_dir / "compiler" / 'nim.nim')
+def build_release_compiler(platform, csources_script_cmd):
+    """
+    Fetches the release sources published for the revision being built,
+    and compiles the release compiler of this slave's architecture from
+    their C sources. The build's output is cleared from the sources after,
+    as the installers package them.
+    """
+    archive = str(platform.nim_dir / release_sources_archive)
+    script_dir = platform.nim_dir / platform.release_script_dir
 
     return [
+        FileDownload(
+            mastersrc  = release_sources_path,
+            slavedest  = archive,
+            workdir    = str(platform.current_dir),
+            haltOnFailure = True,
+            **gen_description(
+                'Download', 'Downloading', 'Downloaded', 'Release Sources'
+            )
+        ),
+
         ShellCommand(
-            command           = ['koch', 'boot'],
-            workdir           = str(platform.nim_dir),
-            env               = platform.base_env,
+            command           = [python_exe_prop,
+                                 str(platform.scripts_dir / 'release_sources.py'),
+                                 'unpack', archive, str(platform.nim_dir)],
+            workdir           = str(platform.current_dir),
             haltOnFailure     = True,
             **gen_description(
-                'Bootstrap', 'Booting', 'Booted', 
-                'Debug Version of Nim Compiler (With C Backend)',
+                'Unpack', 'Unpacking', 'Unpacked', 'Release Sources'
             )
         ),
 
+        # Like the csources scripts, the generated build scripts use paths
+        # relative to their own directory.
         ShellCommand(
-            command           = ['nim', 'c', '-d:release', nimfile_dir],
-            workdir           = str(platform.nim_dir),
+            command           = csources_script_cmd,
+            workdir           = str(script_dir),
             env               = platform.base_env,
-            haltOnFailure     = False,
-
-            doStepIf=step_has_property(
-                name    = run_release_builds_prop.key,
-                default = True
-            ),
-            hideStepIf=step_has_property(
-                name        = hide_release_builds_prop.key,
-                default     = False,
-                giveResults = True
-            ),
-
+            haltOnFailure     = True,
             **gen_description(
-                'Bootstrap', 'Booting', 'Booted', 
-                'Release Version of Nim Compiler (With C Backend)',
+                'Compile', 'Compiling', 'Compiled', 'Release Compiler'
             )
         ),
 
         ShellCommand(
-            command           = ['nim', 'cpp', nimfile_dir],
-            workdir           = str(platform.nim_dir),
-            env               = platform.base_env,
-
-            haltOnFailure     = False,
-            warnOnFailure     = False,
-            flunkOnFailure    = False,
-            flunkOnWarnings   = False,
-
-            doStepIf=step_has_property(
-               name = run_cpp_builds_prop.key,
-               default       = True
-            ),
-            hideStepIf=step_has_property(
-               name = hide_cpp_builds_prop.key,
-               default       = False,
-               giveResults  = True
-            ),
-
+            command           = [python_exe_prop,
+                                 str(platform.scripts_dir / 'release_sources.py'),
+                                 'collect', str(script_dir),
+                                 str(platform.nim_dir / 'bin')],
+            workdir           = str(platform.current_dir),
+            haltOnFailure     = True,
+            hideStepIf        = True,
             **gen_description(
-                'Bootstrap', 'Booting', 'Booted', 
-                'Debug Version of Nim Compiler (With C++ Backend)',
+                'Collect', 'Collecting', 'Collected', 'Release Compiler'
             )
         ),
-    ]
+    ] + report_compiler_cache(platform, 'release')
 
 
-@inject_paths
-def boot_nimrod_release(platform):
+def distribute_testament(platform, pool):
+    """
+    Runs the testament categories on the testament workers of a platform
+    pool, through a queue on the master, then merges their results into the
+    'testament.db' and 'testresults.html' of the Nim tree. Like
+    report_compiler_cache, this takes the platform's paths.
+    """
+    work_dir = FormatInterpolate(
+        testament_queue.work_root + '/{buildername[0]}-{buildnumber[0]}/'
+    )
+    tester = str(platform.tester_dir / platform.tester_exe)
+
+    def work_file(name):
+        return FormatInterpolate(
+            testament_queue.work_root + '/{buildername[0]}-{buildnumber[0]}/' +
+            name
+        )
 
     return [
-        ShellCommand(
-            command           = ['koch', 'boot', '-d:release'],
-            workdir           = str(platform.nim_dir),
+        SetPropertyFromCommand(
+            command           = [python_exe_prop,
+                                 str(platform.scripts_dir / 'testament_items.py'),
+                                 str(platform.nim_dir),
+                                 Property('test_categories', default='all')],
+            workdir           = str(platform.current_dir),
             env               = platform.base_env,
+            extract_fn        = extract_properties,
             haltOnFailure     = True,
             **gen_description(
-                'Bootstrap', 'Booting', 'Booted', 
-                'Release Version of Nim Compiler (With C Backend)',
+                'List', 'Listing', 'Listed', 'Testament Categories'
+            )
+        ),
+
+        MasterShellCommand(
+            command    = ['mkdir', '-p', work_dir],
+            hideStepIf = True
+        ),
+
+        FileUpload(
+            slavesrc   = str(platform.nim_dir / 'bin' / platform.nim_exe),
+            workdir    = str(platform.current_dir),
+            masterdest = work_file(platform.nim_exe),
+            hideStepIf = True
+        ),
+
+        CreateTestamentQueue(
+            pool = pool,
+            **gen_description(
+                'Queue', 'Queueing', 'Queued', 'Testament Categories'
+            )
+        ),
+
+        Trigger(
+            schedulerNames    = [testament_scheduler_name(pool)],
+            waitForFinish     = True,
+            updateSourceStamp = True,
+            set_properties    = {
+                'testament_queue': Property('testament_queue')
+            },
+            haltOnFailure     = False,
+            flunkOnFailure    = True,
+            **gen_description(
+                'Run', 'Running', 'Ran', 'Testament on {0} Workers'.format(pool)
+            )
+        ),
+
+        FinishTestamentQueue(
+            haltOnFailure     = False,
+            **gen_description(
+                'Merge', 'Merging', 'Merged', 'Testament Results'
             )
         ),
 
+        FileDownload(
+            mastersrc  = work_file('testament.db'),
+            slavedest  = 'testament.db',
+            workdir    = str(platform.nim_dir),
+            haltOnFailure = True,
+            hideStepIf = True
+        ),
+
         ShellCommand(
-            command           = ['koch', 'csources', '-d:release'],
+            command           = [tester, 'html'],
             workdir           = str(platform.nim_dir),
             env               = platform.base_env,
             haltOnFailure     = True,
             **gen_description(
-                'Generate', 'Generating', 'Generated', 'C Sources'
+                'Generate', 'Generating', 'Generated', 'Test Results Page'
             )
         ),
+
+        MasterShellCommand(
+            command    = ['rm', '-rf', work_dir],
+            alwaysRun  = True,
+            hideStepIf = True
+        ),
     ]
 
 
+def testament_scheduler_name(pool):
+    return '{0}-testament'.format(pool)
 
-def FormatInterpolate(format_string):
-    @renderer
-    def render_revision(props):
-        return format_string.format(**props.properties)
-    return render_revision
 
 @inject_paths
-def run_testament(platform):
+def run_testament(platform, testament_pool=None):
+    """
+    Runs testament and uploads its results. With a 'testament_pool', the
+    categories are distributed between the testament workers of that
+    platform pool instead of running on this slave alone.
+    """
     test_url = "test-data/{buildername[0]}/{got_revision[0][nim]}/"
     test_directory = 'public_html/' + test_url
 
@@ -385,19 +1726,74 @@ def run_testament(platform):
     html_test_results_dest = gen_dest_filename(html_test_results)
     db_test_results = 'testament.db'
     db_test_results_dest = gen_dest_filename(db_test_results)
+    comparison_results = 'compresults.json'
+    comparison_results_dest = gen_dest_filename(comparison_results)
 
-    return [
-        ShellCommand(
-            command           = ['koch', 'test'],
-            workdir           = str(platform.nim_dir),
+    script_path = str(platform.scripts_dir / 'testament_shards.py')
+    timings_path = Interpolate(
+        '%(prop:cache_dir:-../cache)s/testament-timings.json'
+    )
+
+    if testament_pool is not None:
+        run_steps = distribute_testament(platform, testament_pool)
+    else:
+        run_steps = [
+            ShellCommand(
+                command       = [python_exe_prop, script_path,
+                                 str(platform.nim_dir), timings_path,
+                                 testament_shards_prop,
+                                 Property('test_categories', default='all')],
+                workdir       = str(platform.current_dir),
+                env           = platform.base_env,
+                haltOnFailure = True,
+                timeout       = None,
+                **gen_description(
+                    'Run', 'Running', 'Run', 'Testament'
+                )
+            )
+        ]
+
+    # Failing tests are rerun to tell flakes from regressions. The labels
+    # are uploaded even when testament halted the build.
+    rerun_steps = [
+        RerunFailedTests(
+            command           = [python_exe_prop,
+                                 str(platform.scripts_dir / 'rerun_failures.py'),
+                                 str(platform.nim_dir), test_reruns_prop,
+                                 max_test_reruns_prop,
+                                 str(platform.nim_dir / comparison_results)],
+            workdir           = str(platform.current_dir),
             env               = platform.base_env,
-            haltOnFailure     = True,
+            extract_fn        = extract_properties,
+            decodeRC          = {0: SUCCESS, 1: FAILURE, 2: WARNINGS},
+            alwaysRun         = True,
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = True,
+            warnOnWarnings    = True,
             timeout           = None,
+            doStepIf          = lambda step:
+                int(step.getProperty(test_reruns_prop.key, 3)) > 0,
+            hideStepIf        = lambda results, step: results == SKIPPED,
             **gen_description(
-                'Run', 'Running', 'Run', 'Testament'
+                'Rerun', 'Rerunning', 'Reran', 'Failing Tests'
             )
         ),
 
+        FileUpload(
+            slavesrc   = str(platform.nim_dir / comparison_results),
+            workdir    = str(platform.current_dir),
+            url        = FormatInterpolate(test_url + comparison_results_dest),
+            masterdest = FormatInterpolate(
+                test_directory + comparison_results_dest
+            ),
+            alwaysRun  = True,
+            doStepIf   = step_has_property('tests_flaky'),
+            hideStepIf = lambda results, step: results == SKIPPED
+        ),
+    ]
+
+    return run_steps + rerun_steps + [
         MasterShellCommand(
             command    = ['mkdir', '-p', FormatInterpolate(test_directory)],
             path       = "public_html",
@@ -420,9 +1816,152 @@ def run_testament(platform):
             masterdest = FormatInterpolate(
                 test_directory + db_test_results_dest
             ),
+        ),
+
+        MasterShellCommand(
+            command    = [
+                sys.executable, 'test_warehouse.py', 'ingest',
+                default_warehouse_path,
+                FormatInterpolate(test_directory + db_test_results_dest),
+                FormatInterpolate('{buildername[0]}'),
+                FormatInterpolate('{got_revision[0][nim]}'),
+                FormatInterpolate('{buildnumber[0]}')
+            ],
+            flunkOnFailure  = False,
+            warnOnFailure   = True,
+            **gen_description(
+                'Ingest', 'Ingesting', 'Ingested', 'Test Results'
+            )
+        )
+    ]
+
+@inject_paths
+def run_testament_items(platform):
+    """
+    Runs the categories a testament worker claims from the queue of the
+    build which triggered it, sharded like a local testament run, and
+    uploads the worker's results.
+    """
+    results_db = 'testament-items.db'
+    timings_path = Interpolate(
+        '%(prop:cache_dir:-../cache)s/testament-timings.json'
+    )
+
+    def work_file(name):
+        return Interpolate(
+            testament_queue.work_root + '/%(prop:testament_queue)s/' + name
+        )
+
+    return [
+        FileDownload(
+            mastersrc  = work_file(platform.nim_exe),
+            slavedest  = str(platform.nim_dir / 'bin' / platform.nim_exe),
+            workdir    = str(platform.current_dir),
+            mode       = 0o755,
+            haltOnFailure = True,
+            **gen_description(
+                'Download', 'Downloading', 'Downloaded', 'Nim Compiler'
+            )
+        ),
+
+        RunTestamentItems(
+            workdir           = str(platform.current_dir),
+            command           = [python_exe_prop,
+                                 str(platform.scripts_dir / 'testament_shards.py'),
+                                 str(platform.nim_dir), timings_path,
+                                 testament_shards_prop],
+            results_db        = str(platform.nim_dir / results_db),
+            env               = platform.base_env,
+            haltOnFailure     = False,
+            **gen_description(
+                'Run', 'Running', 'Ran', 'Queued Testament Categories'
+            )
+        ),
+
+        FileUpload(
+            slavesrc   = results_db,
+            workdir    = str(platform.nim_dir),
+            masterdest = work_file('%(prop:buildername)s.db'),
+            doStepIf   = lambda step: step.getProperty('testament_items_run', 0) > 0,
+            hideStepIf = True
         )
     ]
 
+
+def deduplicated_upload(platform, upload_class, slavesrc, masterdest,
+                        doStepIf=True, alwaysRun=False, **kwargs):
+    """
+    Uploads a file or directory, relative to the build directory, with the
+    given upload step class. The content is hashed on the slave first, and
+    the transfer is skipped when the master's content store already has it.
+    Only worth it for artifacts which repeat between builds, like binaries
+    and installers. Like report_compiler_cache, this takes the platform's
+    paths.
+    """
+    name = re.sub(r'[^\w.]+', '_', slavesrc)
+    digest_property = 'content_digest_' + name
+    result_property = 'content_store_' + name
+    upload_needed = step_all(
+        doStepIf, step_property_is_not(result_property, 'hit')
+    )
+    kwargs.setdefault('hideStepIf', lambda results, step: results == SKIPPED)
+
+    return [
+        SetPropertyFromCommand(
+            command           = [python_exe_prop,
+                                 str(platform.scripts_dir / 'content_hash.py'),
+                                 digest_property, slavesrc],
+            workdir           = str(platform.current_dir),
+            extract_fn        = extract_properties,
+            haltOnFailure     = False,
+            flunkOnFailure    = False,
+            warnOnFailure     = False,
+            doStepIf          = doStepIf,
+            alwaysRun         = alwaysRun,
+            hideStepIf        = True,
+            **gen_description(
+                'Hash', 'Hashing', 'Hashed', os.path.basename(slavesrc)
+            )
+        ),
+
+        LinkStoredContent(
+            digest_property   = digest_property,
+            result_property   = result_property,
+            masterdest        = masterdest,
+            url               = kwargs.get('url'),
+            flunkOnFailure    = False,
+            warnOnFailure     = True,
+            doStepIf          = doStepIf,
+            alwaysRun         = alwaysRun,
+            hideStepIf        = lambda results, step:
+                step.getProperty(result_property) != 'hit',
+            **gen_description(
+                'Link', 'Linking', 'Linked',
+                'Stored {0}'.format(os.path.basename(slavesrc))
+            )
+        ),
+
+        upload_class(
+            slavesrc          = slavesrc,
+            workdir           = str(platform.current_dir),
+            masterdest        = masterdest,
+            doStepIf          = upload_needed,
+            alwaysRun         = alwaysRun,
+            **kwargs
+        ),
+
+        StoreUploadedContent(
+            digest_property   = digest_property,
+            masterdest        = masterdest,
+            flunkOnFailure    = False,
+            warnOnFailure     = False,
+            doStepIf          = upload_needed,
+            alwaysRun         = alwaysRun,
+            hideStepIf        = True
+        ),
+    ]
+
+
 @inject_paths
 def upload_release(platform):
     upload_url = "test-data/{buildername[0]}/{got_revision[0][nim]}/"
@@ -438,16 +1977,12 @@ def upload_release(platform):
             hideStepIf = True
         ),
 
-        FileUpload(
-            slavesrc   = nim_exe_source,
-            workdir    = str(platform.nim_dir),
-            url        = FormatInterpolate(upload_url + nim_exe_dest),
-            masterdest = FormatInterpolate(
-                test_directory + nim_exe_dest
-            ),
-        ),
-
-    ]
+    ] + deduplicated_upload(
+        platform, FileUpload,
+        slavesrc   = nim_exe_source,
+        url        = FormatInterpolate(upload_url + nim_exe_dest),
+        masterdest = FormatInterpolate(test_directory + nim_exe_dest)
+    )
 
 
 @inject_paths
@@ -459,8 +1994,8 @@ def generate_installer(platform):
     dlls_dst = str(platform.current_dir / "build" / "bin")
 
     upload_src = str(platform.current_dir / 'build' / 'build')
-    upload_dst = "installer-data/{buildername[0]}/{got_revision[0][nim]}/"
-    upload_url = 'public_html/' + upload_dst
+    upload_url = "installer-data/{buildername[0]}/{got_revision[0][nim]}/"
+    upload_dst = 'public_html/' + upload_url
 
     return [
         ShellCommand(
@@ -494,49 +2029,142 @@ def generate_installer(platform):
                 'Generate', 'Generating', 'Generated', 'NSIS Installer'
             )
         ),
+    ] + deduplicated_upload(
+        platform, DirectoryUpload,
+        slavesrc   = upload_src,
+        masterdest = FormatInterpolate(upload_dst),
+        url        = FormatInterpolate(upload_url),
+        compress   = 'bz2'
+    )
 
-        DirectoryUpload(
-            slavesrc   = upload_src,
-            masterdest = upload_dst,
-            workdir    = str(platform.current_dir),
-            url        = FormatInterpolate(upload_url),
-            compress   = 'bz2'
+@inject_paths
+def check_step_timings(platform):
+    """
+    Marks the build with warnings when one of its steps ran markedly slower
+    than usual on this builder.
+    """
+    return [
+        MasterShellCommand(
+            command    = [
+                sys.executable, 'step_timings.py', 'check',
+                default_timings_path,
+                FormatInterpolate('{buildername[0]}'),
+                FormatInterpolate('{buildnumber[0]}'),
+                timing_threshold_prop
+            ],
+            flunkOnFailure  = False,
+            warnOnFailure   = True,
+            **gen_description(
+                'Check', 'Checking', 'Checked', 'Step Timings'
+            )
         )
     ]
 
+
 # Build Configurations
-def construct_nim_build(platform, csources_script_cmd, f=None):
+def construct_nim_build(platform, csources_script_cmd, f=None,
+                        testament_pool=None):
     if f is None:
         f = BuildFactory()
 
     steps = []
     steps.extend(update_utility_scripts(platform))
+    steps.extend(sample_slave_load(platform))
     steps.extend(update_repositories(platform))
+    steps.extend(classify_changes(platform))
+    steps.extend(skip_verified_build(platform))
     steps.extend(clean_repositories(platform))
-    steps.extend(build_csources(platform, csources_script_cmd))
+    steps.extend(setup_compiler_cache(platform))
+    steps.extend(fetch_bootstrap_seed(platform))
+    steps.extend(build_csources(platform, csources_script_cmd, seed_unused))
     steps.extend(normalize_nim_names(platform))
     steps.extend(compile_koch(platform))
+    steps.extend(sample_slave_load(platform))
+    steps.extend(boot_from_seed(platform))
+    steps.extend(build_csources(platform, csources_script_cmd,
+                                seed_boot_failed))
+    steps.extend(normalize_nim_names(platform, seed_boot_failed))
     steps.extend(boot_nimrod_debug(platform))
-    steps.extend(run_testament(platform))
+    steps.extend(run_benchmarks(platform))
+    steps.extend(sample_slave_load(platform))
+    steps.extend(run_testament(platform, testament_pool=testament_pool))
     #steps.extend(upload_release(platform))
+    steps.extend(check_step_timings(platform))
+    steps.extend(record_verified_build(platform))
+    steps.extend(store_bootstrap_seed(platform))
     for step in steps:
         f.addStep(step)
 
     return f
 
 def construct_nim_release(platform, csources_script_cmd, f=None):
+    """
+    Builds the architecture independent release sources once, then has the
+    installer builders package them.
+    """
     if f is None:
         f = BuildFactory()
 
     steps = []
     steps.extend(update_utility_scripts(platform))
+    steps.extend(sample_slave_load(platform))
     steps.extend(update_repositories(platform))
     steps.extend(clean_repositories(platform))
+    steps.extend(setup_compiler_cache(platform))
     steps.extend(build_csources(platform, csources_script_cmd))
     steps.extend(normalize_nim_names(platform))
     steps.extend(compile_koch(platform))
+    steps.extend(sample_slave_load(platform))
     steps.extend(boot_nimrod_release(platform))
+    steps.extend(generate_docs(platform))
+    steps.extend(publish_release_sources(platform))
+    steps.extend(check_step_timings(platform))
+    for step in steps:
+        f.addStep(step)
+
+    return f
+
+
+def construct_nim_installer(platform, csources_script_cmd, f=None):
+    """
+    Builds the installer of one architecture from the release sources
+    published by the build which triggered it.
+    """
+    if f is None:
+        f = BuildFactory()
+
+    steps = []
+    steps.extend(update_utility_scripts(platform))
+    steps.extend(sample_slave_load(platform))
+    steps.extend(update_repositories(platform))
+    steps.extend(clean_repositories(platform))
+    steps.extend(setup_compiler_cache(platform))
+    steps.extend(build_release_compiler(platform, csources_script_cmd))
+    steps.extend(normalize_nim_names(platform))
+    steps.extend(compile_koch(platform))
     steps.extend(generate_installer(platform))
+    steps.extend(check_step_timings(platform))
+    for step in steps:
+        f.addStep(step)
+
+    return f
+
+
+def construct_testament_worker(platform, f=None):
+    """
+    Builds for the testament workers of a platform pool, which check out the
+    revisions of the triggering build, fetch its compiler and tester from
+    the master, and run categories from its queue.
+    """
+    if f is None:
+        f = BuildFactory()
+
+    steps = []
+    steps.extend(update_utility_scripts(platform))
+    steps.extend(sample_slave_load(platform))
+    steps.extend(update_repositories(platform))
+    steps.extend(clean_repositories(platform))
+    steps.extend(run_testament_items(platform))
     for step in steps:
         f.addStep(step)
 
@@ -0,0 +1,75 @@
+"""
+Classifies changes to the Nim repository by the files they touch.
+
+ - 'docs': only documentation changed, nothing needs to be built.
+ - 'tests': only tests changed, so the compiler itself is unchanged and only
+   the affected test categories need to run.
+ - 'full': anything else.
+"""
+import posixpath
+
+doc_prefixes = ['doc/', 'web/']
+doc_suffixes = ['.md']
+tests_prefix = 'tests/'
+
+# Changes to these parts of the test tree affect every category.
+shared_test_dirs = ['testament', 'testdata']
+
+
+def is_doc_file(name):
+    return (any(name.startswith(prefix) for prefix in doc_prefixes) or
+            any(name.endswith(suffix) for suffix in doc_suffixes))
+
+
+def test_category(name):
+    """
+    Returns the test category a file belongs to, '' for files affecting
+    every category, or None for files outside the test tree.
+    """
+    if not name.startswith(tests_prefix):
+        return None
+    parts = name[len(tests_prefix):].split('/')
+    if len(parts) < 2 or parts[0] in shared_test_dirs:
+        return ''
+    return parts[0]
+
+
+def classify_files(files):
+    """
+    Returns the class of a change touching the given files, the test
+    categories it affects (None for all of them) and the reason for the
+    classification.
+    """
+    files = [posixpath.normpath(name.replace('\\', '/')) for name in files]
+    if not files:
+        return 'full', None, 'the changed files are unknown'
+
+    code_files = [name for name in files if not is_doc_file(name)]
+    if not code_files:
+        return 'docs', [], 'only documentation changed'
+
+    categories = set()
+    for name in code_files:
+        category = test_category(name)
+        if category is None:
+            return 'full', None, '{0} is neither a test nor documentation'\
+                .format(name)
+        categories.add(category)
+
+    if '' in categories:
+        return 'tests', None, 'only tests changed, including the test ' \
+                              'infrastructure'
+    categories = sorted(categories)
+    return 'tests', categories, 'only tests in {0} changed'.format(
+        ', '.join(categories)
+    )
+
+
+def file_is_important(change):
+    """
+    Used by the schedulers, so that documentation-only changes to the Nim
+    repository don't trigger builds.
+    """
+    if getattr(change, 'codebase', 'nim') != 'nim':
+        return True
+    return classify_files(change.files)[0] != 'docs'
@@ -3,8 +3,34 @@ import json
 import shutil
 import tarfile
 import io
+import argparse
 import os.path as path
 
+from slave_utils import report_property
+
+# Compares every new result with the most recent old result of the same name.
+# The old database is indexed on test names, so each lookup is a single
+# index probe instead of a scan.
+comparison_view = """
+CREATE TEMP VIEW Comparison AS
+SELECT n.*,
+       o.result IS NULL AS is_new,
+       CASE
+           WHEN n.result = 'reSuccess' THEN
+               CASE WHEN o.result IS NOT NULL AND o.result != 'reSuccess'
+                    THEN 'newly passed' ELSE 'passed' END
+           ELSE
+               CASE WHEN o.result = 'reSuccess'
+                    THEN 'newly failed' ELSE 'failed' END
+       END AS status
+FROM main.TestResult n
+LEFT JOIN old.TestResult o ON o.rowid = (
+    SELECT max(rowid) FROM old.TestResult WHERE name = n.name
+)
+WHERE n.rowid IN (SELECT max(rowid) FROM main.TestResult GROUP BY name)
+"""
+
+
 def dict_factory(cursor, row):
     return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
 
@@ -18,15 +44,15 @@ def retrieve_test_results(path):
     return {row['name']: row for row in results}
 
 
-def compare_test_results():
+def compare_test_results(old_path, new_path):
     new_tests = []
     failed_tests = []
     passed_tests = []
     newly_failed_tests = []
     newly_passed_tests = []
 
-    old_results_rows = retrieve_test_results("testament.db")
-    new_results_rows = retrieve_test_results("build/testament.db")
+    old_results_rows = retrieve_test_results(old_path)
+    new_results_rows = retrieve_test_results(new_path)
 
     for new_result in new_results_rows.values():
         old_result = old_results_rows.get(new_result['name'])
@@ -51,12 +77,98 @@ def compare_test_results():
     return json.dumps(new_results_rows)
 
 
+def open_comparison(old_path, new_path):
+    connection = sqlite3.connect(new_path)
+    connection.row_factory = dict_factory
+    connection.execute('ATTACH DATABASE ? AS old', (old_path,))
+    connection.execute(
+        'CREATE INDEX IF NOT EXISTS old.TestResultNameIndex'
+        ' ON TestResult(name)'
+    )
+    connection.execute(comparison_view)
+    return connection
+
+
+def summarize_comparison(connection):
+    summary = connection.execute("""
+        SELECT count(*) AS total,
+               coalesce(sum(is_new), 0) AS new,
+               coalesce(sum(status IN ('passed', 'newly passed')), 0) AS passed,
+               coalesce(sum(status IN ('failed', 'newly failed')), 0) AS failed,
+               coalesce(sum(status = 'newly passed'), 0) AS newly_passed,
+               coalesce(sum(status = 'newly failed'), 0) AS newly_failed
+        FROM Comparison
+    """).fetchone()
+    return summary
+
+
+def iter_changed_results(connection):
+    cursor = connection.execute("""
+        SELECT * FROM Comparison
+        WHERE is_new OR status IN ('newly passed', 'newly failed')
+        ORDER BY status = 'newly failed' DESC, status = 'newly passed' DESC,
+                 name
+    """)
+    for row in cursor:
+        row['comparison_flags'] = (['new'] if row.pop('is_new') else []) + \
+                                  [row.pop('status')]
+        yield row
+
+
+def stream_test_comparison(old_path, new_path, fh):
+    """
+    Writes the summary counts and only the new, newly failed and newly
+    passed results, one row at a time. Returns the summary.
+    """
+    connection = open_comparison(old_path, new_path)
+    try:
+        summary = summarize_comparison(connection)
+        fh.write('{"summary": ')
+        fh.write(json.dumps(summary))
+        fh.write(', "changes": [')
+        for index, row in enumerate(iter_changed_results(connection)):
+            if index:
+                fh.write(',')
+            fh.write(json.dumps(row))
+        fh.write(']}')
+    finally:
+        connection.close()
+    return summary
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Compares the results of a testament run with the last '
+                    'recorded run.'
+    )
+    parser.add_argument('--old', default='testament.db',
+                        help='database of the last recorded run')
+    parser.add_argument('--new', default=path.join('build', 'testament.db'),
+                        help='database of the current run')
+    parser.add_argument('--output', default='compresults.json')
+    parser.add_argument('--full', action='store_true',
+                        help='dump every new result instead of only the '
+                             'changed ones')
+    return parser.parse_args()
+
+
 def main():
+    arguments = parse_arguments()
+
     # If we have two tests to compare, compare them and get the results:
     comparison_output = ""
-    if path.exists("testament.db") and path.exists("build/testament.db"):
-        with open('compresults.json', 'w') as fh:
-            fh.write(compare_test_results().replace('\n', '\r'))
+    if path.exists(arguments.old) and path.exists(arguments.new):
+        with open(arguments.output, 'w') as fh:
+            if arguments.full:
+                fh.write(compare_test_results(
+                    arguments.old, arguments.new
+                ).replace('\n', '\r'))
+            else:
+                summary = stream_test_comparison(
+                    arguments.old, arguments.new, fh
+                )
+                for name, count in sorted(summary.items()):
+                    report_property('tests_' + name, count)
 
     # Next, add the comparison results and test database to a tar file.
     # with tarfile.open("testfiles.tar.bz2", "w:bz2", compresslevel=9) as tar:
@@ -65,8 +177,8 @@ def main():
     #     tar.add('compresults.json')
 
     # Then update the 'last database' file.
-    if path.exists("build/testament.db"):
-        shutil.copyfile("build/testament.db", "testament.db")
+    if path.exists(arguments.new):
+        shutil.copyfile(arguments.new, arguments.old)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,114 @@
+"""
+Measures the performance of a freshly booted compiler on a fixed corpus.
+
+usage: compiler_benchmark.py <nim dir> <scripts dir> <corpus> <output>
+
+The corpus is a JSON file listing the benchmarks, each a Nim file compiled
+with 'nim c' from the root it names: 'nim' for the Nim tree, or 'scripts'
+for projects vendored into 'benchmarks/projects' of this repository. Every
+benchmark is compiled with an empty nimcache and without ccache, and its
+wall time, the compiler's peak resident memory and the size of the produced
+binary are written to the output file.
+"""
+import json
+import os
+import os.path as path
+import shutil
+import subprocess
+import sys
+import time
+
+from slave_utils import exe_name
+
+work_dir = 'benchmark-work'
+
+
+def peak_rss_bytes(rusage):
+    # Linux reports kilobytes, OS X bytes.
+    if sys.platform == 'darwin':
+        return rusage.ru_maxrss
+    return rusage.ru_maxrss * 1024
+
+
+def run_measured(command, cwd, environment):
+    """
+    Returns the exit code, wall time and peak resident memory of a command.
+    The memory is None where wait4 isn't available.
+    """
+    start_time = time.time()
+    process = subprocess.Popen(command, cwd=cwd, env=environment)
+    if hasattr(os, 'wait4'):
+        _, status, rusage = os.wait4(process.pid, 0)
+        if os.WIFEXITED(status):
+            process.returncode = os.WEXITSTATUS(status)
+        else:
+            process.returncode = -os.WTERMSIG(status)
+        peak_rss = peak_rss_bytes(rusage)
+    else:
+        process.wait()
+        peak_rss = None
+    return process.returncode, time.time() - start_time, peak_rss
+
+
+def run_benchmark(benchmark, roots, environment):
+    root = roots[benchmark['root']]
+    source = path.join(root, benchmark['file'])
+    if not path.isfile(source):
+        print('Skipping {0}, {1} is missing'.format(benchmark['name'], source))
+        return None
+
+    benchmark_dir = path.abspath(path.join(work_dir, benchmark['name']))
+    if path.exists(benchmark_dir):
+        shutil.rmtree(benchmark_dir)
+    os.makedirs(benchmark_dir)
+    binary = path.join(benchmark_dir, exe_name(benchmark['name']))
+
+    command = ['nim', 'c', '--verbosity:0',
+               '--nimcache:' + path.join(benchmark_dir, 'nimcache'),
+               '-o:' + binary] + benchmark.get('options', []) + [source]
+    print('> ' + ' '.join(command))
+    sys.stdout.flush()
+    returncode, seconds, peak_rss = run_measured(command, root, environment)
+
+    result = {
+        'seconds': seconds,
+        'peak_rss': peak_rss,
+        'binary_size': path.getsize(binary) if path.isfile(binary) else None,
+        'returncode': returncode
+    }
+    print('{0}: {1:.1f}s, peak RSS {2}, binary {3} bytes'.format(
+        benchmark['name'], seconds, peak_rss, result['binary_size']
+    ))
+    return result
+
+
+def main():
+    nim_dir, scripts_dir, corpus_path, output_path = sys.argv[1:5]
+    roots = {'nim': path.abspath(nim_dir), 'scripts': path.abspath(scripts_dir)}
+    # The output lives outside the cleaned trees. Results of an earlier
+    # build mustn't be published when this run crashes.
+    if path.exists(output_path):
+        os.remove(output_path)
+    with open(corpus_path) as fh:
+        corpus = json.load(fh)
+
+    # ccache would measure the cache rather than the compiler.
+    environment = dict(os.environ)
+    environment['CCACHE_DISABLE'] = '1'
+
+    results = {}
+    failed = False
+    for benchmark in corpus['benchmarks']:
+        result = run_benchmark(benchmark, roots, environment)
+        if result is not None:
+            results[benchmark['name']] = result
+            failed = failed or result['returncode'] != 0
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(output_path, 'w') as fh:
+        json.dump(results, fh, indent=1, sort_keys=True)
+    if failed:
+        sys.exit('Some benchmarks failed to compile')
+
+if __name__ == "__main__":
+    main()
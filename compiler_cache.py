@@ -0,0 +1,118 @@
+"""
+Sets up ccache for the C compilation steps and reports its statistics.
+
+usage: compiler_cache.py setup <ccache dir> <limit in MB>
+       compiler_cache.py stats <ccache dir> <step name>
+
+'setup' creates a directory of compiler names linked to ccache, which the
+build steps put first on the path, and reports it as 'ccache_bin_dir'. Where
+symbolic links can't be made, as on Windows without the privilege for
+them, copies of ccache are used instead. When ccache is unavailable, an
+empty 'ccache_bin_dir' is reported and the compilers are called directly.
+
+'stats' reports the hit rate of the compilations done since the previous
+call as '<step name>_ccache_hit_rate', along with the size of the cache.
+"""
+import filecmp
+import os
+import os.path as path
+import shutil
+import subprocess
+import sys
+
+try:
+    from shutil import which as find_executable
+except ImportError:
+    from distutils.spawn import find_executable
+
+from slave_utils import report_property, command_output, exe_name
+
+compiler_names = ['cc', 'gcc', 'c++', 'g++', 'clang', 'clang++']
+
+
+def ccache(*args):
+    return subprocess.call(['ccache'] + list(args)) == 0
+
+
+def ccache_stats():
+    """
+    Returns the counters printed by 'ccache --print-stats'.
+    """
+    stats = {}
+    for line in command_output(['ccache', '--print-stats']).splitlines():
+        parts = line.split('\t')
+        if len(parts) == 2 and parts[1].isdigit():
+            stats[parts[0]] = int(parts[1])
+    return stats
+
+
+def link_compiler(ccache_exe, link):
+    """
+    Makes a compiler name call ccache, through a symbolic link or, where
+    those can't be made, a copy of ccache.
+    """
+    if path.islink(link):
+        if os.readlink(link) == ccache_exe:
+            return
+        os.remove(link)
+    elif path.exists(link):
+        if filecmp.cmp(link, ccache_exe, shallow=False):
+            return
+        os.remove(link)
+    try:
+        os.symlink(ccache_exe, link)
+    except (AttributeError, NotImplementedError, OSError):
+        shutil.copy2(ccache_exe, link)
+
+
+def setup(cache_dir, limit_mb):
+    ccache_exe = find_executable('ccache')
+    if ccache_exe is None:
+        print('ccache is not available, compiling without it')
+        report_property('ccache_bin_dir', '')
+        return
+
+    bin_dir = path.join(cache_dir, 'bin')
+    if not path.isdir(bin_dir):
+        os.makedirs(bin_dir)
+    for name in compiler_names:
+        link_compiler(ccache_exe, path.join(bin_dir, exe_name(name)))
+
+    ccache('--max-size', '{0}M'.format(limit_mb))
+    ccache('--zero-stats')
+    report_property('ccache_bin_dir', bin_dir)
+    report_property('ccache_dir', cache_dir)
+    report_property('ccache_basedir', os.getcwd())
+
+
+def report_stats(step_name):
+    stats = ccache_stats()
+    hits = (stats.get('direct_cache_hit', 0) +
+            stats.get('preprocessed_cache_hit', 0))
+    misses = stats.get('cache_miss', 0)
+    if hits + misses:
+        hit_rate = '{0:.1f}'.format(100.0 * hits / (hits + misses))
+    else:
+        hit_rate = 'n/a'
+
+    print('{0}: {1} hits, {2} misses'.format(step_name, hits, misses))
+    report_property(step_name + '_ccache_hit_rate', hit_rate)
+    report_property(step_name + '_ccache_hits', hits)
+    report_property(step_name + '_ccache_misses', misses)
+    report_property('ccache_size', stats.get('cache_size_kibibyte', 0) * 1024)
+    ccache('--zero-stats')
+
+
+def main():
+    action, cache_dir = sys.argv[1:3]
+    cache_dir = path.abspath(cache_dir)
+    os.environ['CCACHE_DIR'] = cache_dir
+    if action == 'setup':
+        setup(cache_dir, int(sys.argv[3]))
+    elif action == 'stats':
+        report_stats(sys.argv[3])
+    else:
+        sys.exit('Unknown action {0}'.format(action))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Runs the independent compiler variants concurrently, then reports each one
+as if it had been run by its own step.
+
+usage: compiler_variants.py run <results dir> <jobs|auto> <work dir>
+                                <name> <command...> [-- <name> <command...>]
+       compiler_variants.py report <results dir> <name>
+
+'run' starts at most <jobs> variants at a time and records the output and
+exit code of every variant in the results directory. Any '{variant_dir}' in
+a command is replaced by a directory private to the variant, so variants can
+keep their nimcache and output binary apart. 'report' prints a variant's
+output and exits with its exit code.
+"""
+import json
+import multiprocessing
+import os
+import os.path as path
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+
+def parse_variants(arguments):
+    variants = []
+    current = []
+    for argument in arguments + ['--']:
+        if argument == '--':
+            if current:
+                variants.append((current[0], current[1:]))
+            current = []
+        else:
+            current.append(argument)
+    return variants
+
+
+def job_count_for(requested, variant_count):
+    if requested == 'auto':
+        try:
+            cores = multiprocessing.cpu_count()
+        except NotImplementedError:
+            cores = 1
+        # Each variant's C compilation already uses several cores.
+        jobs = cores // 2
+    else:
+        jobs = int(requested)
+    return min(max(jobs, 1), max(variant_count, 1))
+
+
+class Variant(threading.Thread):
+
+    def __init__(self, name, command, work_dir, results_dir, slots):
+        threading.Thread.__init__(self)
+        self.name = name
+        self.variant_dir = path.join(results_dir, name)
+        self.command = [
+            argument.replace('{variant_dir}', self.variant_dir)
+            for argument in command
+        ]
+        self.work_dir = work_dir
+        self.slots = slots
+        self.log_path = path.join(results_dir, name + '.log')
+        self.result_path = path.join(results_dir, name + '.json')
+
+    def run(self):
+        with self.slots:
+            os.makedirs(self.variant_dir)
+            start_time = time.time()
+            with open(self.log_path, 'w') as log:
+                log.write('> {0}\n'.format(' '.join(self.command)))
+                log.flush()
+                try:
+                    returncode = subprocess.call(
+                        self.command, cwd=self.work_dir,
+                        stdout=log, stderr=subprocess.STDOUT
+                    )
+                except OSError as e:
+                    log.write('Unable to run variant: {0}\n'.format(e))
+                    returncode = 127
+            elapsed = time.time() - start_time
+
+        with open(self.result_path, 'w') as fh:
+            json.dump({'returncode': returncode, 'seconds': elapsed}, fh)
+        print('{0} finished with {1} after {2:.0f}s'.format(
+            self.name, returncode, elapsed
+        ))
+        sys.stdout.flush()
+
+
+def run(results_dir, requested_jobs, work_dir, arguments):
+    variants = parse_variants(arguments)
+    if path.exists(results_dir):
+        shutil.rmtree(results_dir)
+    os.makedirs(results_dir)
+
+    jobs = job_count_for(requested_jobs, len(variants))
+    print('Running {0} variants, {1} at a time'.format(len(variants), jobs))
+    sys.stdout.flush()
+
+    slots = threading.BoundedSemaphore(jobs)
+    runners = [
+        Variant(name, command, path.abspath(work_dir),
+                path.abspath(results_dir), slots)
+        for name, command in variants
+    ]
+    for runner in runners:
+        runner.start()
+    for runner in runners:
+        runner.join()
+
+
+def report(results_dir, name):
+    try:
+        with open(path.join(results_dir, name + '.json')) as fh:
+            result = json.load(fh)
+        with open(path.join(results_dir, name + '.log')) as fh:
+            shutil.copyfileobj(fh, sys.stdout)
+    except (IOError, ValueError):
+        sys.exit('No result recorded for {0}'.format(name))
+    sys.stdout.flush()
+    sys.exit(result['returncode'])
+
+
+def main():
+    action, results_dir = sys.argv[1:3]
+    if action == 'run':
+        run(results_dir, sys.argv[3], sys.argv[4], sys.argv[5:])
+    elif action == 'report':
+        report(results_dir, sys.argv[3])
+    else:
+        sys.exit('Unknown action {0}'.format(action))
+
+if __name__ == "__main__":
+    main()
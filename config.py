@@ -18,12 +18,91 @@
 #                       Defaults to false.
 #
 #  - 'hide_release_builds': Whether to hide release builds. Defaults to false.
+#
+#  - 'cache_dir': Slave-side directory holding the caches shared between
+#                 builds, relative to the builder's directory.
+#                 Defaults to '../cache'.
+#
+#  - 'csources_cache_limit': Size limit of the csources binary cache, in
+#                            megabytes. Defaults to 256.
+#
+#  - 'koch_cache_limit': Size limit of the koch binary cache, in megabytes.
+#                        Defaults to 64.
+#
+#  - 'use_git_mirrors': Whether checkouts borrow objects from bare mirrors
+#                       kept in '{cache_dir}/git'. Defaults to true.
+#
+#  - 'git_mirror_gc_interval': Number of fetches between 'git gc' runs on the
+#                              mirrors. Defaults to 50.
+#
+#  - 'testament_shards': Number of testament shards run concurrently, or
+#                        'auto' to use one per core. A value of 1 runs
+#                        'koch test' serially. Defaults to 'auto'.
+#
+#  - 'use_ccache': Whether the C compilation steps go through ccache, when it
+#                  is installed on the slave. Defaults to false.
+#
+#  - 'ccache_dir': Slave-side directory holding the ccache data.
+#                  Defaults to '{cache_dir}/ccache'.
+#
+#  - 'ccache_limit': Size limit of the ccache data, in megabytes.
+#                    Defaults to 2048.
+#
+#  - 'persistent_nimcache': Whether 'koch boot' keeps its nimcache in
+#                           '{cache_dir}/nimcache/{builder}/{branch}', so it
+#                           survives the cleaning of the Nim repository.
+#                           Defaults to false.
+#
+#  - 'compiler_variant_jobs': Number of compiler variants (release, C++) built
+#                             at the same time after 'koch boot', or 'auto'
+#                             to use one per two cores. Defaults to 'auto'.
+#
+#  - 'step_timing_threshold': Fraction by which a step may run slower than its
+#                             recent median before the build is marked with
+#                             warnings. Defaults to 0.3.
+#
+#  - 'run_benchmarks': Whether the freshly booted compiler is measured on the
+#                      corpus in 'benchmarks/corpus.json'. Defaults to true.
+#
+#  - 'benchmark_threshold': Fraction by which a benchmark may run slower than
+#                           its recent median before the build is marked
+#                           with warnings. Defaults to 0.15.
+#
+#  - 'force_rebuild': Whether a compiler build runs even when its builder
+#                     already passed with the same nim, csources and scripts
+#                     revisions. Set from the force build form.
+#                     Defaults to false.
+#
+#  - 'use_bootstrap_seed': Whether 'koch boot' starts from the compiler of the
+#                          last passing build of the same builder and branch,
+#                          kept in '{cache_dir}/seeds', instead of from
+#                          csources. csources are still built when there is
+#                          no seed, or booting from it fails.
+#                          Defaults to false.
+#
+#  - 'bootstrap_seed_cold_interval': Every build whose number is a multiple of
+#                                    this boots from csources even when a
+#                                    seed exists. 0 disables cold builds.
+#                                    Defaults to 20.
+#
+#  - 'bootstrap_seed_limit': Size limit of the bootstrap seed cache, in
+#                            megabytes. Defaults to 128.
+#
+#  - 'test_reruns': Number of times each failing test is rerun after
+#                   testament, to label it flaky or consistently failing in
+#                   'compresults.json'. 0 disables the reruns. Defaults to 3.
+#
+#  - 'max_test_reruns': Number of failing tests which are rerun. Any further
+#                       failing tests are labelled 'not rerun'.
+#                       Defaults to 25.
 
 
 # Global Configuration
 import os
 from build_steps import construct_nim_build, python_exe_prop, get_codebase
-from build_steps import construct_nim_release
+from build_steps import construct_nim_release, construct_testament_worker
+from build_steps import construct_nim_installer, release_installer_scheduler
+from build_steps import testament_scheduler_name
 
 # Main configuration dictionary.
 c = BuildmasterConfig = {}
@@ -130,6 +209,12 @@ c['slaves'] = [
 
 all_slave_names = [slave.name for slave in c['slaves']]
 
+# Slaves of the same platform form a pool, shared by that platform's
+# builders.
+from slave_pools import slave_pools, SlaveSelector
+
+platform_slaves = slave_pools(all_slave_names)
+
 
 # PROTOCOLS
 # 'protocols' contains information about protocols which master will use for
@@ -161,51 +246,82 @@ c['change_source'] = [
 # List of builds and their build steps
 
 from buildbot.config import BuilderConfig
+from scheduling import merge_requests, next_build
+
+# Builds go to the least busy slave of the pool, preferably one which
+# recently built the same branch.
+select_slave = SlaveSelector()
+
+# Compiler builders also collapse pending requests per branch, building the
+# main branches first.
+default_builder_params = {
+    'mergeRequests': merge_requests,
+    'nextBuild': next_build,
+    'nextSlave': select_slave
+}
+
+# Testament runs are distributed between the slaves of these pools, once a
+# pool has more than one slave. A single slave runs them faster through its
+# local shards.
+testament_pool_candidates = ['linux-arm5', 'linux-arm6', 'linux-arm7']
+distributed_testament_pools = [
+    pool for pool in testament_pool_candidates
+    if len(platform_slaves[pool]) > 1
+]
+
+
+def testament_pool(pool):
+    return pool if pool in distributed_testament_pools else None
 
 c['builders'] = [
     BuilderConfig(
         name="windows-x64-builder",
-        slavenames=["windows-x64-slave-1"],
+        slavenames=platform_slaves['windows-x64'],
         factory=construct_nim_build(
             csources_script_cmd='build64.bat',
             platform='windows'
-        )
+        ),
+        **default_builder_params
     ),
     BuilderConfig(
         name="windows-x32-builder",
-        slavenames=["windows-x32-slave-1"],
+        slavenames=platform_slaves['windows-x32'],
         factory=construct_nim_build(
             csources_script_cmd='build.bat',
             platform='windows'
-        )
+        ),
+        **default_builder_params
     ),
     BuilderConfig(
         name="linux-x64-builder",
-        slavenames=["linux-x64-slave-1"],
+        slavenames=platform_slaves['linux-x64'],
         factory=construct_nim_build(
             csources_script_cmd='sh build.sh',
             platform='linux'
-        )
+        ),
+        **default_builder_params
     ),
     BuilderConfig(
         name="linux-x32-builder",
-        slavenames=["linux-x32-slave-1"],
+        slavenames=platform_slaves['linux-x32'],
         factory=construct_nim_build(
             csources_script_cmd='sh build.sh',
             platform='linux'
-        )
+        ),
+        **default_builder_params
     ),
     BuilderConfig(
         name="mac-x64-builder",
-        slavenames=["mac-x64-slave-1"],
+        slavenames=platform_slaves['mac-x64'],
         factory=construct_nim_build(
             csources_script_cmd='sh build.sh',
             platform='mac'
-        )
+        ),
+        **default_builder_params
     ),
     # BuilderConfig(
     #     name="mac-x32-builder",
-    #     slavenames=["mac-x32-slave-1"],
+    #     slavenames=platform_slaves['mac-x32'],
     #     factory=construct_nim_build(
     #         csources_script_cmd='sh build.sh',
     #         platform='mac'
@@ -213,79 +329,127 @@ c['builders'] = [
     # ),
     BuilderConfig(
         name="linux-arm5-builder",
-        slavenames=["linux-arm5-slave-1"],
+        slavenames=platform_slaves['linux-arm5'],
         factory=construct_nim_build(
             csources_script_cmd='sh build.sh',
-            platform='linux'
-        )
+            platform='linux',
+            testament_pool=testament_pool('linux-arm5')
+        ),
+        **default_builder_params
     ),
 
     BuilderConfig(
         name="linux-arm6-builder",
-        slavenames=["linux-arm6-slave-1"],
+        slavenames=platform_slaves['linux-arm6'],
         factory=construct_nim_build(
             csources_script_cmd='sh build.sh',
-            platform='linux'
-        )
+            platform='linux',
+            testament_pool=testament_pool('linux-arm6')
+        ),
+        **default_builder_params
     ),
 
     BuilderConfig(
         name="linux-arm7-builder",
-        slavenames=["linux-arm7-slave-1"],
+        slavenames=platform_slaves['linux-arm7'],
         factory=construct_nim_build(
             csources_script_cmd='sh build.sh',
-            platform='linux'
-        )
+            platform='linux',
+            testament_pool=testament_pool('linux-arm7')
+        ),
+        **default_builder_params
     ),
 
     BuilderConfig(
         name="freebsd-x64-builder",
-        slavenames=["freebsd-x64-slave-1"],
+        slavenames=platform_slaves['freebsd-x64'],
         factory=construct_nim_build(
             csources_script_cmd='sh build.sh',
             platform='freebsd'
-        )
+        ),
+        **default_builder_params
     ),
 
+    # Generates the C sources and documentation of a release once, then
+    # triggers the installer builders below, which package them.
     BuilderConfig(
-        name="windows-x64-installer",
-        slavenames=["windows-x64-slave-1"],
+        name="windows-release-installer",
+        slavenames=platform_slaves['windows-x64'],
         factory=construct_nim_release(
             csources_script_cmd='build64.bat',
             platform='windows'
-        )
+        ),
+        nextSlave=select_slave
+    ),
+    BuilderConfig(
+        name="windows-x64-installer",
+        slavenames=platform_slaves['windows-x64'],
+        factory=construct_nim_installer(
+            csources_script_cmd='build64.bat',
+            platform='windows'
+        ),
+        nextSlave=select_slave
     ),
     BuilderConfig(
         name="windows-x32-installer",
-        slavenames=["windows-x32-slave-1"],
-        factory=construct_nim_release(
+        slavenames=platform_slaves['windows-x32'],
+        factory=construct_nim_installer(
             csources_script_cmd='build.bat',
             platform='windows'
-        )
+        ),
+        nextSlave=select_slave
     ),
 ]
 
 all_builder_names = []
 all_installer_names = []
+release_builder_names = []
 for builder in c['builders']:
     if 'builder' in builder.name:
         all_builder_names.append(builder.name)
+    elif 'release' in builder.name:
+        release_builder_names.append(builder.name)
     elif 'installer' in builder.name:
         all_installer_names.append(builder.name)
     else:
         raise Exception("Bad builder config name '{0}'".format(builder.name))
 
+# Testament workers. Builders with a 'testament_pool' run their tests on
+# every slave of that pool, one worker build per slave. Each worker takes
+# categories from the build's queue on the master until none are left.
+
+testament_worker_names = {}
+for pool in distributed_testament_pools:
+    testament_worker_names[pool] = [
+        '{0}-testament-worker-{1}'.format(pool, index + 1)
+        for index in range(len(platform_slaves[pool]))
+    ]
+    for name in testament_worker_names[pool]:
+        c['builders'].append(BuilderConfig(
+            name=name,
+            slavenames=platform_slaves[pool],
+            factory=construct_testament_worker(platform='linux'),
+            category='testament-workers',
+            # Requests of different builds use different queues.
+            mergeRequests=False,
+            nextSlave=select_slave
+        ))
+
 # SCHEDULERS
 # Configure the Schedulers, which decide how to react to incoming changes.
 
 from buildbot.schedulers.basic import AnyBranchScheduler
-from buildbot.schedulers.forcesched import ForceScheduler
+from buildbot.schedulers.triggerable import Triggerable
+from change_filter import file_is_important
+from buildbot.schedulers.forcesched import ForceScheduler, BooleanParameter
 
 c['schedulers'] = [
     # Main scheduler, activated when a branch in the Nim repository is changed.
+    # Documentation-only changes don't trigger builds.
     AnyBranchScheduler(
         name="git-build-scheduler",
         treeStableTimer=None,
+        fileIsImportant=file_is_important,
         builderNames=all_builder_names,
         codebases={
             'nim': {'repository': ''},
@@ -300,7 +464,13 @@ c['schedulers'] = [
         name="force-build-scheduler",
         builderNames=all_builder_names,
         buttonName="Force Compiler Build",
-        properties=[],
+        properties=[
+            BooleanParameter(
+                name="force_rebuild",
+                label="Rebuild even if these revisions already passed",
+                default=False
+            )
+        ],
         codebases={
             'nim': {'repository': ''},
             'csources': {'repository': ''},
@@ -310,7 +480,7 @@ c['schedulers'] = [
 
     ForceScheduler(
         name="force-installer-scheduler",
-        builderNames=all_installer_names,
+        builderNames=release_builder_names,
         buttonName="Force Installer Build",
         properties=[],
         codebases={
@@ -321,6 +491,29 @@ c['schedulers'] = [
     )
 ]
 
+# Triggered by the builds of each distributed testament pool.
+for pool in distributed_testament_pools:
+    c['schedulers'].append(Triggerable(
+        name=testament_scheduler_name(pool),
+        builderNames=testament_worker_names[pool],
+        codebases={
+            'nim': {'repository': ''},
+            'csources': {'repository': ''},
+            'scripts': {'repository': ''},
+        }
+    ))
+
+# Triggered by the release builder, once the release sources are published.
+c['schedulers'].append(Triggerable(
+    name=release_installer_scheduler,
+    builderNames=all_installer_names,
+    codebases={
+        'nim': {'repository': ''},
+        'csources': {'repository': ''},
+        'scripts': {'repository': ''},
+    }
+))
+
 
 # STATUS TARGETS
 # Set up the various target for build status.
@@ -329,7 +522,6 @@ c['schedulers'] = [
 
 from buildbot.status import html
 from buildbot.status.web import authz, auth
-from buildbot.status.builder import Results
 from buildbot.status.web.base import HtmlResource
 from buildbot.status.mail import MailNotifier
 from buildbot.status import words
@@ -375,7 +567,30 @@ gs = GitHubStatus(
     endDescription='Build done.'
 )
 
-c['status'] = [irc, gs]
+# Step timings, checked for regressions at the end of every build
+from timing_status import StepTimingRecorder
+
+# Artifact retention: revisions of release tags and the 20 newest revisions
+# of every builder are kept. Older test results are compacted into monthly
+# archives, served through the 'archived' page.
+from retention_service import ArtifactRetentionService
+
+artifact_retention = ArtifactRetentionService(
+    max_bytes=50 * 1024 ** 3,
+    max_age_days=90,
+    keep_recent=20
+)
+
+# Step logs, stored compressed as they stream in and shown through the
+# 'logtail' page. The store only keeps the recent builds, so the master keeps
+# its own complete, compressed copy of every log.
+from log_status import StepLogRecorder
+
+c['logCompressionMethod'] = 'gz'
+c['logCompressionLimit'] = 16 * 1024
+
+c['status'] = [irc, gs, StepTimingRecorder(), artifact_retention,
+               StepLogRecorder(keep_builds=50)]
 
 class BuilderResource(HtmlResource):
 
@@ -416,43 +631,337 @@ class BuilderResource(HtmlResource):
 
         return self.content_hook(request, ctx, builder, build, number)
 
-from datetime import datetime
-from buildbot.util import UTC
+from status_cache import BuildResultCache, load_status_images
+from status_cache import summarize_build
 
 class StatusImageResource(BuilderResource):
     contentType = 'image/svg+xml'
 
+    def __init__(self, result_cache, images):
+        BuilderResource.__init__(self)
+        self.result_cache = result_cache
+        self.images = images
+
+    def content(self, request, ctx):
+        """
+        Serves the badge of a builder's last finished build from memory.
+        Requests for a specific build number go through the builder history.
+        """
+        name = request.args.get('builder', (None,))[0]
+        number = request.args.get('number', (None,))[0]
+        if name is None:
+            return 'builder parameter missing'
+        if number not in (None, '-1'):
+            return BuilderResource.content(self, request, ctx)
+
+        summary = self.result_cache.get(name)
+        if summary is None:
+            return "invalid builder '%s'" % name
+        return self.send_image(request, summary)
+
     def content_hook(self, request, ctx, builder, build, number):
-        """Display a build status image like Travis does."""
-        start_time, end_time = build.getTimes()
-        target_time = end_time or start_time or datetime.utcnow()
-        if isinstance(target_time, float):
-            target_time = datetime.fromtimestamp(target_time, UTC)
-        
+        summary = summarize_build(builder.getName(), build)
+        return self.send_image(request, summary)
+
+    def send_image(self, request, summary):
         request.setHeader('Cache-Control', 'no-cache')
-        request.setHeader('Last-Modified', target_time.strftime('%a, %d %b %Y %H:%M:%S GMT'))
+        request.setHeader('Last-Modified', summary['last_modified'])
+        request.setHeader('ETag', summary['etag'])
+        if request.getHeader('If-None-Match') == summary['etag']:
+            request.setResponseCode(304)
+            return ''
 
         # SUCCESS, WARNINGS, FAILURE, SKIPPED or EXCEPTION
-        res = build.getResults()
-        resname = Results[res]
+        return self.images[summary['result']]
+
+
+class StatusSummaryResource(HtmlResource):
+    contentType = 'application/json'
+
+    def __init__(self, result_cache):
+        HtmlResource.__init__(self)
+        self.result_cache = result_cache
+
+    def content(self, request, ctx):
+        """
+        Serves the precomputed summary of the last finished build of every
+        builder and installer.
+        """
+        request.setHeader('Cache-Control', 'no-cache')
+        request.setHeader('ETag', self.result_cache.summary_etag)
+        if request.getHeader('If-None-Match') == self.result_cache.summary_etag:
+            request.setResponseCode(304)
+            return ''
+        return self.result_cache.summary_json
+
+
+import json
+from twisted.internet import defer
+from scheduling import summarize_queue
+
+class BuildQueueResource(HtmlResource):
+    contentType = 'application/json'
+
+    @defer.inlineCallbacks
+    def content(self, request, ctx):
+        """
+        Serves the depth of every builder's queue of pending requests and the
+        age of its oldest and newest request, in seconds.
+        """
+        status = self.getStatus(request)
+        request.setHeader('Cache-Control', 'no-cache')
+        brdicts = yield status.master.db.buildrequests.getBuildRequests(
+            claimed=False, complete=False
+        )
+        defer.returnValue(json.dumps(summarize_queue(brdicts), sort_keys=True))
+
+
+import urllib
+from test_warehouse import TestWarehouse, comparison_statuses
+
+class TestComparisonResource(HtmlResource):
+
+    """
+    Lists the results of a build's tests compared with the builder's
+    previous build, from the test warehouse.
+    """
+
+    pageTitle = 'Test Comparison'
+    page_size = 100
+
+    def __init__(self):
+        HtmlResource.__init__(self)
+        self.warehouse = None
+
+    def content(self, request, ctx):
+        if self.warehouse is None:
+            self.warehouse = TestWarehouse()
+
+        name = request.args.get('builder', (None,))[0]
+        number = request.args.get('number', (None,))[0]
+        if name is None:
+            return 'builder parameter missing'
+        try:
+            page = max(int(request.args.get('page', ('1',))[0]), 1)
+            if number is not None:
+                number = int(number)
+        except ValueError:
+            return 'invalid build or page number'
+
+        if number is None:
+            build = self.warehouse.latest_build(name)
+        else:
+            build = self.warehouse.find_build(name, number)
+        if build is None:
+            return "no test results for builder '%s'" % name
+        previous = self.warehouse.previous_build(build)
+
+        statuses = [status for status in request.args.get('status', [])
+                    if status in comparison_statuses]
+        name_filter = request.args.get('filter', ('',))[0]
+
+        ctx.update(
+            build=build,
+            previous=previous,
+            summary=self.warehouse.comparison_summary(build, previous),
+            all_statuses=comparison_statuses,
+            statuses=statuses,
+            name_filter=name_filter,
+            page=page,
+            page_query=urllib.urlencode(
+                [('builder', build['builder']), ('number', build['number']),
+                 ('filter', name_filter)] +
+                [('status', status) for status in statuses]
+            ),
+            has_next=False,
+            results=self.warehouse.compare_builds(
+                build, previous, statuses, name_filter,
+                offset=(page - 1) * self.page_size,
+                limit=self.page_size + 1
+            )
+        )
+        # One extra row tells whether a filtered list has a next page.
+        if len(ctx['results']) > self.page_size:
+            ctx['has_next'] = True
+            ctx['results'] = ctx['results'][:self.page_size]
+
+        template = request.site.buildbot_service.templates.get_template(
+            'testcomparison.html'
+        )
+        return template.render(**ctx)
+
+
+from twisted.web import resource
+from artifact_retention import read_archived
+
+class ArchivedResultResource(resource.Resource):
+
+    """
+    Serves test results which were compacted into a monthly archive by the
+    artifact retention service.
+    """
+
+    isLeaf = True
+    content_types = {
+        '.html': 'text/html; charset=utf-8',
+        '.db': 'application/x-sqlite3',
+    }
+
+    def render_GET(self, request):
+        names = [request.args.get(name, ('',))[0]
+                 for name in ('builder', 'revision', 'file')]
+        if not all(names) or any('/' in n or '\\' in n or n.startswith('.')
+                                 for n in names):
+            request.setResponseCode(400)
+            return 'builder, revision and file parameters required'
+
+        builder, revision, name = names
+        content = read_archived(
+            os.path.join('public_html', 'test-data', builder),
+            revision + '/' + name
+        )
+        if content is None:
+            request.setResponseCode(404)
+            return "no archived file '%s' for %s" % (name, revision)
+
+        extension = os.path.splitext(name)[1]
+        request.setHeader('Content-Type', self.content_types.get(
+            extension, 'application/octet-stream'
+        ))
+        request.setHeader('Cache-Control', 'max-age=86400')
+        return content
+
+
+from log_store import LogReader, default_log_root, log_path
+
+def step_log_reader(request, max_errors=None):
+    """
+    Returns the stored log named by the request's parameters, the parameters
+    themselves, or None when there is no such log.
+    """
+    names = [request.args.get(name, (default,))[0] for name, default in
+             (('builder', None), ('number', None), ('step', None),
+              ('log', 'stdio'))]
+    if not all(names) or not names[1].isdigit():
+        return None, names
+    base = log_path(default_log_root, *names)
+    if not LogReader.exists(base):
+        return None, names
+    return LogReader(base, max_errors), names
+
 
-        img = 'public_html/status-img/status_image_%s.svg' % resname
-        here = os.path.dirname(__file__)
-        imgfile = os.path.join(here, img)
+class LogTailResource(HtmlResource):
 
-        imgcontent = open(imgfile, 'rb').read()
+    """
+    Shows the last KBs and the error lines of a step log from the compressed
+    log store, without loading the rest of the log.
+    """
+
+    pageTitle = 'Log Tail'
+    default_kb = 64
+    context_bytes = 8 * 1024
+    max_errors = 200
+
+    def content(self, request, ctx):
+        reader, names = step_log_reader(request, self.max_errors)
+        if reader is None:
+            return 'no stored log for these builder, number, step and log ' \
+                   'parameters'
+        try:
+            kb = int(request.args.get('kb', (self.default_kb,))[0])
+            around = request.args.get('around', (None,))[0]
+            if around is not None:
+                around = int(around)
+        except ValueError:
+            return 'invalid kb or around parameter'
+
+        size = reader.size()
+        if around is None:
+            start = max(size - max(kb, 1) * 1024, 0)
+            end = size
+        else:
+            start = max(around - self.context_bytes, 0)
+            end = around + self.context_bytes
+        text = reader.read_range(start, end).decode('utf-8', 'replace')
+        # Don't start in the middle of a line.
+        if start > 0 and '\n' in text:
+            text = text[text.index('\n') + 1:]
+
+        builder, number, step, log = names
+        ctx.update(
+            builder=builder,
+            number=number,
+            step=step,
+            log=log,
+            query=urllib.urlencode([('builder', builder), ('number', number),
+                                    ('step', step), ('log', log)]),
+            size_kb=size // 1024,
+            kb=kb,
+            around=around,
+            errors=list(reader.errors),
+            more_errors=reader.error_count - len(reader.errors),
+            text=text
+        )
+        template = request.site.buildbot_service.templates.get_template(
+            'logtail.html'
+        )
+        return template.render(**ctx)
 
-        return imgcontent
+
+class StepLogResource(resource.Resource):
+
+    """
+    Serves a whole step log from the compressed log store as plain text,
+    decompressing it one block at a time.
+    """
+
+    isLeaf = True
+
+    def render_GET(self, request):
+        reader, names = step_log_reader(request)
+        if reader is None:
+            request.setResponseCode(404)
+            return 'no stored log for these builder, number, step and log ' \
+                   'parameters'
+        request.setHeader('Content-Type', 'text/plain; charset=utf-8')
+        request.setHeader('Content-Length', str(reader.size()))
+        for block in reader.iter_blocks():
+            request.write(block)
+        return ''
 
 
 class NimBuildStatus(html.WebStatus):
 
+    def __init__(self, *args, **kwargs):
+        summary_builders = kwargs.pop('summary_builders', ())
+        html.WebStatus.__init__(self, *args, **kwargs)
+        self.result_cache = BuildResultCache(summary_builders)
+        self.status_images = load_status_images()
+
     def setupUsualPages(self, numbuilds, num_events, num_events_max):
         File.contentTypes[".db"] = "application/x-sqlite3"
 
         html.WebStatus.setupUsualPages(
             self, numbuilds, num_events, num_events_max)
-        self.putChild("buildstatusimage", StatusImageResource())
+        self.putChild("buildstatusimage", StatusImageResource(
+            self.result_cache, self.status_images
+        ))
+        self.putChild("buildstatussummary", StatusSummaryResource(
+            self.result_cache
+        ))
+        self.putChild("buildqueue", BuildQueueResource())
+        self.putChild("archived", ArchivedResultResource())
+        self.putChild("testcomparison", TestComparisonResource())
+        self.putChild("logtail", LogTailResource())
+        self.putChild("steplog", StepLogResource())
+
+    def startService(self):
+        html.WebStatus.startService(self)
+        self.result_cache.attach(self.getStatus())
+
+    def stopService(self):
+        self.result_cache.detach()
+        return html.WebStatus.stopService(self)
 
 
 
@@ -468,7 +977,12 @@ authz_cfg = authz.Authz(
     stopAllBuilds='auth',
     cancelPendingBuild='auth',
 )
-c['status'].append(NimBuildStatus(http_port=8010, authz=authz_cfg))
+c['status'].append(NimBuildStatus(
+    http_port=8010,
+    authz=authz_cfg,
+    summary_builders=(all_builder_names + release_builder_names +
+                      all_installer_names)
+))
 
 
 # PROJECT IDENTITY
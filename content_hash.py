@@ -0,0 +1,47 @@
+"""
+Hashes a file, or every file of a directory, before it's uploaded, so that
+the master can reuse content it already has instead of transferring it.
+
+usage: content_hash.py <property> <path>
+
+The content is described by a manifest, mapping the path of every file,
+relative to <path> and with '/' separators, to the SHA-256 of its content.
+A single file is listed under the empty path. Only the digest of the
+manifest is reported, as the <property> property; the master computes the
+same manifest for what it has.
+"""
+import json
+import os
+import os.path as path
+import sys
+
+from slave_utils import report_property, hash_file, hash_strings
+
+
+def content_hashes(source):
+    if path.isfile(source):
+        return {'': hash_file(source, 'sha256')}
+    hashes = {}
+    for root, dirs, files in os.walk(source):
+        for name in files:
+            full_path = path.join(root, name)
+            relative = path.relpath(full_path, source).replace(os.sep, '/')
+            hashes[relative] = hash_file(full_path, 'sha256')
+    return hashes
+
+
+def manifest_digest(hashes):
+    return hash_strings([json.dumps(hashes, sort_keys=True)])
+
+
+def main():
+    property_name, source = sys.argv[1:3]
+    if not path.exists(source):
+        sys.exit('Nothing to hash at {0}'.format(source))
+    hashes = content_hashes(source)
+    digest = manifest_digest(hashes)
+    print('Hashed {0} files of {1} as {2}'.format(len(hashes), source, digest))
+    report_property(property_name, digest)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Content-addressed store of the files uploaded to the master, used to skip
+uploads of content the master already has.
+
+Stored files live in '{root}/{hash[:2]}/{hash}' and are hard links to the
+uploaded artifacts, so they take no extra space. The manifest of every
+stored upload, as described in content_hash.py, lives in
+'{root}/manifests/{digest}.json', named after its digest. A build hashes
+what it is about to upload on the slave; when the store has the manifest
+and all of its files, they are linked into place and nothing is
+transferred. Otherwise the upload runs as usual, and is added to the store
+afterwards. Entries which no artifact links to anymore are removed by the
+artifact retention.
+"""
+import errno
+import json
+import os
+import os.path as path
+import shutil
+
+from content_hash import content_hashes, manifest_digest
+from slave_utils import hash_file
+
+default_store_root = 'public_html/content-store'
+manifests_dir = 'manifests'
+
+
+def entry_path(root, digest):
+    return path.join(root, digest[:2], digest)
+
+
+def manifest_path(root, digest):
+    return path.join(root, manifests_dir, digest + '.json')
+
+
+def destination_path(masterdest, relative):
+    if not relative:
+        return masterdest
+    return path.join(masterdest, *relative.split('/'))
+
+
+def make_parent(file_path):
+    try:
+        os.makedirs(path.dirname(path.abspath(file_path)))
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def remove_file(file_path):
+    try:
+        os.remove(file_path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        # Hard links don't cross file systems.
+        shutil.copy2(source, target)
+
+
+def read_manifest(root, digest):
+    try:
+        with open(manifest_path(root, digest)) as fh:
+            return json.load(fh)
+    except (IOError, ValueError):
+        return None
+
+
+def is_stored(root, digest):
+    """
+    Whether the store holds intact content for a hash. Damaged entries are
+    removed.
+    """
+    entry = entry_path(root, digest)
+    if not path.isfile(entry):
+        return False
+    if hash_file(entry, 'sha256') != digest:
+        remove_file(entry)
+        return False
+    return True
+
+
+def unlink_stored(masterdest):
+    """
+    Removes the files at a destination which share their content with the
+    store, so that an upload can't write through them into the store.
+    """
+    if path.isfile(masterdest):
+        if os.stat(masterdest).st_nlink > 1:
+            remove_file(masterdest)
+        return
+    for directory, dirs, files in os.walk(masterdest):
+        for name in files:
+            file_path = path.join(directory, name)
+            if os.stat(file_path).st_nlink > 1:
+                remove_file(file_path)
+
+
+def link(root, digest, masterdest):
+    """
+    Links the stored content of an upload into place, and returns its
+    manifest, or None when not all of it was stored. Then nothing is linked.
+    """
+    hashes = read_manifest(root, digest)
+    if not hashes or not all(is_stored(root, file_digest)
+                             for file_digest in hashes.values()):
+        unlink_stored(masterdest)
+        return None
+
+    for relative, file_digest in sorted(hashes.items()):
+        target = destination_path(masterdest, relative)
+        make_parent(target)
+        remove_file(target)
+        link_or_copy(entry_path(root, file_digest), target)
+    return hashes
+
+
+def add(root, digest, masterdest):
+    """
+    Adds an upload to the store, and returns the number of bytes added. The
+    manifest is only kept when the uploaded content matches the digest the
+    slave reported.
+    """
+    if not path.exists(masterdest):
+        return 0
+    hashes = content_hashes(masterdest)
+    added = 0
+    for relative, file_digest in sorted(hashes.items()):
+        entry = entry_path(root, file_digest)
+        if path.isfile(entry):
+            continue
+        make_parent(entry)
+        link_or_copy(destination_path(masterdest, relative), entry)
+        added += path.getsize(entry)
+    if manifest_digest(hashes) == digest:
+        manifest = manifest_path(root, digest)
+        make_parent(manifest)
+        with open(manifest, 'w') as fh:
+            json.dump(hashes, fh, sort_keys=True)
+    return added
+
+
+def prune(root):
+    """
+    Removes the entries no artifact links to anymore, and the manifests of
+    uploads whose files are gone, and returns the number of bytes freed.
+    """
+    freed = 0
+    if not path.isdir(root):
+        return freed
+    for prefix in os.listdir(root):
+        prefix_dir = path.join(root, prefix)
+        if prefix == manifests_dir or not path.isdir(prefix_dir):
+            continue
+        for name in os.listdir(prefix_dir):
+            entry = path.join(prefix_dir, name)
+            stat = os.stat(entry)
+            if stat.st_nlink <= 1:
+                os.remove(entry)
+                freed += stat.st_size
+        if not os.listdir(prefix_dir):
+            os.rmdir(prefix_dir)
+
+    manifest_root = path.join(root, manifests_dir)
+    if path.isdir(manifest_root):
+        for name in os.listdir(manifest_root):
+            hashes = read_manifest(root, name[:-len('.json')])
+            if not hashes or not all(path.isfile(entry_path(root, digest))
+                                     for digest in hashes.values()):
+                os.remove(path.join(manifest_root, name))
+    return freed
@@ -0,0 +1,65 @@
+"""
+Restores or stores the csources bootstrap binary in a slave-local cache.
+
+usage: csources_cache.py (fetch|store) <cache dir> <limit in MB>
+                         <csources revision> <build command> <bin dir>
+
+The cache key combines the csources revision, the identity of the C compiler,
+the slave's platform and the command used to build csources, so a cached
+binary is only reused when it would have been rebuilt byte-for-byte.
+"""
+import os.path as path
+import platform
+import sys
+
+from artifact_cache import ArtifactCache
+from slave_utils import report_property, hash_strings, c_compiler_identity
+from slave_utils import exe_name
+
+binary_names = [exe_name('nim'), exe_name('nimrod')]
+
+
+def cache_key(revision, build_command):
+    return hash_strings([
+        revision,
+        c_compiler_identity(),
+        platform.system(),
+        platform.machine(),
+        build_command
+    ])
+
+
+def main():
+    action, cache_dir, limit_mb, revision, build_command, bin_dir = sys.argv[1:7]
+    cache = ArtifactCache(path.join(cache_dir, 'csources'),
+                          int(limit_mb) * 1024 * 1024)
+    key = cache_key(revision, build_command)
+    report_property('csources_cache_key', key)
+
+    if action == 'fetch':
+        stored_names = cache.read_metadata(key).get('binaries', [])
+        files = {name: path.join(bin_dir, name) for name in stored_names}
+        if files and cache.fetch(key, files) is not None:
+            print('Restored {0} from {1}'.format(', '.join(files), key))
+            report_property('csources_cache', 'hit')
+        else:
+            print('No cached binary for {0}'.format(key))
+            report_property('csources_cache', 'miss')
+
+    elif action == 'store':
+        files = {}
+        for name in binary_names:
+            if path.isfile(path.join(bin_dir, name)):
+                files[name] = path.join(bin_dir, name)
+        if not files:
+            sys.exit('No csources binary found in {0}'.format(bin_dir))
+        cache.store(key, files, {'binaries': sorted(files),
+                                 'revision': revision})
+        print('Stored {0} as {1}'.format(', '.join(files), key))
+        report_property('csources_cache_size', cache.size())
+
+    else:
+        sys.exit('Unknown action {0}'.format(action))
+
+if __name__ == "__main__":
+    main()
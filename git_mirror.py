@@ -0,0 +1,117 @@
+"""
+Maintains bare mirrors of the build's git repositories on the slave, so that
+checkouts can borrow objects through '--reference' instead of cloning from
+scratch.
+
+usage: git_mirror.py <mirror dir> <gc interval> <name>=<url> [<name>=<url>...]
+
+For every repository the mirror's path, the number of bytes fetched and an
+estimate of the time saved compared to a fresh clone are reported as build
+properties.
+"""
+import json
+import os.path as path
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from slave_utils import report_property, tree_size
+
+
+def git(mirror, *args):
+    command = ['git', '--git-dir', mirror] + list(args)
+    print('> ' + ' '.join(command))
+    sys.stdout.flush()
+    return subprocess.call(command) == 0
+
+
+def load_stats(stats_path):
+    try:
+        with open(stats_path) as fh:
+            return json.load(fh)
+    except (IOError, ValueError):
+        return {'fetches': 0, 'clone_rate': None}
+
+
+def save_stats(stats_path, stats):
+    with open(stats_path, 'w') as fh:
+        json.dump(stats, fh)
+
+
+def is_valid_mirror(mirror):
+    return path.isdir(mirror) and git(mirror, 'rev-parse', '--verify', '--quiet', 'HEAD')
+
+
+def clone_mirror(url, mirror, stats):
+    if path.exists(mirror):
+        shutil.rmtree(mirror)
+    start_time = time.time()
+    if subprocess.call(['git', 'clone', '--mirror', url, mirror]) != 0:
+        sys.exit('Unable to clone {0}'.format(url))
+    elapsed = time.time() - start_time
+    stats['clone_rate'] = tree_size(mirror) / max(elapsed, 1.0)
+    return tree_size(mirror)
+
+
+def update_mirror(name, url, mirror_dir, gc_interval):
+    mirror = path.join(mirror_dir, name + '.git')
+    stats_path = path.join(mirror_dir, name + '.json')
+    stats = load_stats(stats_path)
+
+    seconds_saved = 0
+    if not is_valid_mirror(mirror):
+        print('Creating mirror of {0} in {1}'.format(url, mirror))
+        fetched = clone_mirror(url, mirror, stats)
+    else:
+        size_before = tree_size(mirror)
+        start_time = time.time()
+        if git(mirror, 'fetch', '--prune', 'origin'):
+            fetched = max(tree_size(mirror) - size_before, 0)
+            elapsed = time.time() - start_time
+            if stats['clone_rate']:
+                seconds_saved = tree_size(mirror) / stats['clone_rate'] - elapsed
+        elif git(mirror, 'fsck', '--connectivity-only'):
+            # Most likely a network error, the mirror is kept as it is.
+            print('Fetch failed, keeping {0} until the next build'.format(
+                mirror
+            ))
+            fetched = 0
+        else:
+            print('Fetch failed and {0} is corrupt'.format(mirror))
+            fetched = clone_mirror(url, mirror, stats)
+
+    stats['fetches'] += 1
+    if gc_interval > 0 and stats['fetches'] % gc_interval == 0:
+        if not (git(mirror, 'gc') and
+                git(mirror, 'fsck', '--connectivity-only')):
+            print('Maintenance failed, recloning {0}'.format(mirror))
+            clone_mirror(url, mirror, stats)
+    save_stats(stats_path, stats)
+
+    report_property(name + '_mirror', mirror)
+    report_property(name + '_mirror_fetched_bytes', fetched)
+    report_property(name + '_mirror_seconds_saved', int(max(seconds_saved, 0)))
+    return fetched, max(seconds_saved, 0)
+
+
+def main():
+    mirror_dir = path.abspath(sys.argv[1])
+    gc_interval = int(sys.argv[2])
+    if not path.isdir(mirror_dir):
+        os.makedirs(mirror_dir)
+
+    total_fetched = 0
+    total_saved = 0
+    for repository in sys.argv[3:]:
+        name, url = repository.split('=', 1)
+        fetched, saved = update_mirror(name, url, mirror_dir, gc_interval)
+        total_fetched += fetched
+        total_saved += saved
+
+    report_property('git_mirror_fetched_bytes', total_fetched)
+    report_property('git_mirror_seconds_saved', int(total_saved))
+
+if __name__ == "__main__":
+    main()
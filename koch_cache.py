@@ -0,0 +1,199 @@
+"""
+Restores or stores the koch binary in a slave-local cache.
+
+usage: koch_cache.py (fetch|store) <cache dir> <limit in MB> <nim dir>
+
+The cache key combines the hash of the compiler in '<nim dir>/bin', the
+identity of the C compiler, the slave's platform and the content of every
+module koch imports, found by following the import and include statements
+from koch.nim. Modules which can't be found in the Nim tree are included
+in the key by name, so they can't cause a stale binary to be reused. The
+configuration files the compiler reads, nimbase.h and the files named by
+the compile, link and header pragmas of those modules are hashed too.
+"""
+import os.path as path
+import platform
+import re
+import sys
+
+from artifact_cache import ArtifactCache
+from slave_utils import report_property, hash_strings, hash_file
+from slave_utils import c_compiler_identity, exe_name
+
+koch_source = 'koch.nim'
+koch_binary = exe_name('koch')
+
+# Directories searched for imported modules, relative to the Nim tree.
+search_dirs = [
+    'lib', 'lib/pure', 'lib/pure/collections', 'lib/pure/concurrency',
+    'lib/core', 'lib/std', 'lib/system', 'lib/impure', 'lib/posix',
+    'lib/windows', 'lib/js', 'compiler', 'tools'
+]
+# Every module implicitly imports the system module.
+implicit_modules = ['lib/system.nim']
+# Configuration and C files which affect every compilation of koch.
+build_inputs = [
+    'config/nim.cfg', 'config/nimrod.cfg', 'config/config.nims',
+    'nim.cfg', 'koch.cfg', 'koch.nim.cfg', 'koch.nims', 'lib/nimbase.h'
+]
+
+statement_pattern = re.compile(
+    r'(?:^|[:;])\s*(?:import|include|from\s+(\S+)\s+import)\b(.*)$'
+)
+string_pattern = re.compile(r'"([^"]+)"')
+# Files passed to the C compiler or linker by a module's pragmas.
+pragma_file_pattern = re.compile(
+    r'\b(?:compile|link|header)\s*:\s*"([^"<>$]+)"'
+)
+
+
+def import_statements(source):
+    """
+    Yields the text after every import, include and 'from' statement of a
+    module. Statements continued over several lines are joined.
+    """
+    lines = source.splitlines()
+    i = 0
+    while i < len(lines):
+        match = statement_pattern.search(lines[i].split('#')[0])
+        i += 1
+        if match is None:
+            continue
+        if match.group(1):
+            yield match.group(1)
+            continue
+        text = match.group(2).strip()
+        while (not text or text.endswith(',') or
+               text.count('[') > text.count(']')) and i < len(lines):
+            text += ' ' + lines[i].split('#')[0].strip()
+            i += 1
+        yield text
+
+
+def module_names(statement):
+    """
+    Returns the module names of an import statement, expanding the
+    'std/[os, strutils]' form.
+    """
+    names = string_pattern.findall(statement)
+    statement = string_pattern.sub('', statement)
+    statement = re.sub(r'\s+except\s+.*$', '', statement)
+    for group in re.finditer(r'([\w./]*)\[([^\]]*)\]', statement):
+        prefix = group.group(1)
+        names.extend(prefix + name.strip()
+                     for name in group.group(2).split(',') if name.strip())
+    statement = re.sub(r'[\w./]*\[[^\]]*\]', '', statement)
+    for name in statement.split(','):
+        name = re.sub(r'\s+as\s+\w+$', '', name.strip())
+        if name:
+            names.append(name)
+    return names
+
+
+def resolve_module(nim_dir, importer_dir, name):
+    name = name.replace(' ', '')
+    for prefix in ('std/', 'pkg/'):
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+    if not name.endswith('.nim'):
+        name += '.nim'
+    candidates = [path.join(importer_dir, name)] + \
+        [path.join(nim_dir, directory, name) for directory in search_dirs]
+    for candidate in candidates:
+        if path.isfile(candidate):
+            return path.normpath(candidate)
+    return None
+
+
+def pragma_files(nim_dir, module, source):
+    """
+    Returns the files of the Nim tree named by the compile, link and header
+    pragmas of a module. Other names, like system headers, are left out.
+    """
+    found = []
+    for name in pragma_file_pattern.findall(source):
+        for directory in (path.dirname(module), path.join(nim_dir, 'lib')):
+            candidate = path.join(directory, name)
+            if path.isfile(candidate):
+                found.append(path.normpath(candidate))
+                break
+    return found
+
+
+def koch_inputs(nim_dir):
+    """
+    Returns the source and configuration files koch is built from, and the
+    names of imported modules which couldn't be found.
+    """
+    pending = [path.join(nim_dir, koch_source)] + \
+        [path.join(nim_dir, name) for name in implicit_modules]
+    found = set()
+    extra = set(path.normpath(path.join(nim_dir, name))
+                for name in build_inputs
+                if path.isfile(path.join(nim_dir, name)))
+    missing = set()
+    while pending:
+        module = path.normpath(pending.pop())
+        if module in found or not path.isfile(module):
+            continue
+        found.add(module)
+        with open(module, 'rb') as fh:
+            source = fh.read().decode('utf-8', 'replace')
+        extra.update(pragma_files(nim_dir, module, source))
+        for config in (module + '.cfg', module[:-len('.nim')] + '.cfg'):
+            if path.isfile(config):
+                extra.add(path.normpath(config))
+        for statement in import_statements(source):
+            for name in module_names(statement):
+                resolved = resolve_module(nim_dir, path.dirname(module), name)
+                if resolved is None:
+                    missing.add(name)
+                else:
+                    pending.append(resolved)
+    return sorted(found | extra), sorted(missing)
+
+
+def cache_key(nim_dir):
+    inputs, missing = koch_inputs(nim_dir)
+    parts = [
+        hash_file(path.join(nim_dir, 'bin', exe_name('nim'))),
+        c_compiler_identity(),
+        platform.system(),
+        platform.machine()
+    ]
+    for name in inputs:
+        parts.append(path.relpath(name, nim_dir).replace('\\', '/'))
+        parts.append(hash_file(name))
+    parts.extend(missing)
+    return hash_strings(parts), len(inputs)
+
+
+def main():
+    action, cache_dir, limit_mb, nim_dir = sys.argv[1:5]
+    cache = ArtifactCache(path.join(cache_dir, 'koch'),
+                          int(limit_mb) * 1024 * 1024)
+    key, input_count = cache_key(nim_dir)
+    print('Koch is built from {0} files'.format(input_count))
+    report_property('koch_cache_key', key)
+
+    binary = path.join(nim_dir, koch_binary)
+    if action == 'fetch':
+        if cache.fetch(key, {koch_binary: binary}) is not None:
+            print('Restored {0} from {1}'.format(koch_binary, key))
+            report_property('koch_cache', 'hit')
+        else:
+            print('No cached koch binary for {0}'.format(key))
+            report_property('koch_cache', 'miss')
+
+    elif action == 'store':
+        if not path.isfile(binary):
+            sys.exit('No koch binary found in {0}'.format(nim_dir))
+        cache.store(key, {koch_binary: binary}, {'inputs': input_count})
+        print('Stored {0} as {1}'.format(koch_binary, key))
+        report_property('koch_cache_size', cache.size())
+
+    else:
+        sys.exit('Unknown action {0}'.format(action))
+
+if __name__ == "__main__":
+    main()
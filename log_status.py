@@ -0,0 +1,78 @@
+"""
+Status receiver which stores every step log in the compressed log store as
+it streams in, and links each step to the tail view of its logs.
+"""
+import urllib
+
+from buildbot.status.base import StatusReceiverMultiService
+from buildbot.status.logfile import HTMLLogFile
+
+from log_store import LogWriter, default_log_root, log_path, prune_builds
+
+
+class StepLogRecorder(StatusReceiverMultiService):
+
+    def __init__(self, log_root=default_log_root, keep_builds=50):
+        StatusReceiverMultiService.__init__(self)
+        self.log_root = log_root
+        self.keep_builds = keep_builds
+        self.writers = {}
+
+    def setServiceParent(self, parent):
+        # Like the other status targets, our parent is the master's status.
+        StatusReceiverMultiService.setServiceParent(self, parent)
+        self.status = self.parent
+        self.status.subscribe(self)
+
+    def disownServiceParent(self):
+        self.status.unsubscribe(self)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+        return StatusReceiverMultiService.disownServiceParent(self)
+
+    # StatusReceiver interface
+
+    def builderAdded(self, builder_name, builder):
+        return self
+
+    def buildStarted(self, builder_name, build):
+        return self
+
+    def buildFinished(self, builder_name, build, results):
+        prune_builds(self.log_root, builder_name, self.keep_builds)
+
+    def stepStarted(self, build, step):
+        # Returning ourselves subscribes us to the step's log events.
+        return self
+
+    def logStarted(self, build, step, log):
+        if isinstance(log, HTMLLogFile):
+            return None
+        builder_name = build.getBuilder().getName()
+        self.writers[log] = LogWriter(log_path(
+            self.log_root, builder_name, build.getNumber(), step.getName(),
+            log.getName()
+        ))
+        step.addURL('{0} tail'.format(log.getName()), self.tail_url(
+            builder_name, build.getNumber(), step.getName(), log.getName()
+        ))
+        # Returning ourselves subscribes us to the log's chunks.
+        return self
+
+    def logChunk(self, build, step, log, channel, text):
+        writer = self.writers.get(log)
+        if writer is not None:
+            writer.write(text)
+
+    def logFinished(self, build, step, log):
+        writer = self.writers.pop(log, None)
+        if writer is not None:
+            writer.close()
+
+    @staticmethod
+    def tail_url(builder_name, number, step_name, log_name):
+        return '/logtail?' + urllib.urlencode([
+            ('builder', builder_name), ('number', number),
+            ('step', step_name), ('log', log_name)
+        ])
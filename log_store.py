@@ -0,0 +1,183 @@
+"""
+Compressed storage for step logs, written while the log streams in.
+
+A log is stored as '<base>.gz', a series of independent gzip members which
+each hold a block of the log, and '<base>.idx', an append-only index. The
+index records where every block starts, both in the log and in the
+compressed file, and the offset of every line which looks like an error.
+The tail of a log, or its error lines, are read by decompressing only the
+blocks involved.
+"""
+import gzip
+import io
+import os
+import os.path as path
+import re
+import shutil
+import zlib
+from collections import deque
+
+default_log_root = 'step-logs'
+block_size = 256 * 1024
+error_pattern = re.compile(
+    r'(\berror\b|Error:|\bFAIL|Traceback|fatal|FAILURE|reFail)', re.IGNORECASE
+)
+max_error_line = 300
+
+
+def safe_name(name):
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+def log_path(root, builder, number, step, log):
+    """
+    Returns the base path of a step log, '{root}/{builder}/{number}/{step}.{log}'.
+    """
+    return path.join(root, safe_name(builder), str(number),
+                     '{0}.{1}'.format(safe_name(step), safe_name(log)))
+
+
+def prune_builds(root, builder, keep):
+    """
+    Removes the logs of all but the newest 'keep' builds of a builder.
+    """
+    builder_dir = path.join(root, safe_name(builder))
+    if not path.isdir(builder_dir):
+        return
+    numbers = sorted(int(name) for name in os.listdir(builder_dir)
+                     if name.isdigit())
+    for number in numbers[:-keep]:
+        shutil.rmtree(path.join(builder_dir, str(number)), ignore_errors=True)
+
+
+def compress_block(data):
+    output = io.BytesIO()
+    with gzip.GzipFile(fileobj=output, mode='wb', mtime=0) as fh:
+        fh.write(data)
+    return output.getvalue()
+
+
+class LogWriter(object):
+
+    def __init__(self, base):
+        directory = path.dirname(base)
+        if directory and not path.isdir(directory):
+            os.makedirs(directory)
+        self.data = open(base + '.gz', 'wb')
+        # Error lines are text, which the master's Python 2 would otherwise
+        # only write when it's ASCII.
+        self.index = io.open(base + '.idx', 'w', encoding='utf-8',
+                             newline='\n')
+        self.buffer = []
+        self.buffered = 0
+        self.offset = 0
+        self.compressed_offset = 0
+        self.partial_line = b''
+        self.line_offset = 0
+
+    def write(self, text):
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8', 'replace')
+        self.scan_errors(text)
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= block_size:
+            self.flush_block()
+
+    def scan_errors(self, text):
+        lines = (self.partial_line + text).split(b'\n')
+        self.partial_line = lines.pop()
+        for line in lines:
+            decoded = line.decode('utf-8', 'replace')
+            if error_pattern.search(decoded):
+                self.index.write(u'E {0} {1}\n'.format(
+                    self.line_offset,
+                    decoded[:max_error_line].replace('\r', '')
+                ))
+            self.line_offset += len(line) + 1
+
+    def flush_block(self):
+        if not self.buffered:
+            return
+        block = compress_block(b''.join(self.buffer))
+        self.data.write(block)
+        self.data.flush()
+        self.index.write(u'B {0} {1} {2} {3}\n'.format(
+            self.offset, self.buffered, self.compressed_offset, len(block)
+        ))
+        self.index.flush()
+        self.offset += self.buffered
+        self.compressed_offset += len(block)
+        self.buffer = []
+        self.buffered = 0
+
+    def close(self):
+        if self.partial_line:
+            self.scan_errors(b'\n')
+        self.flush_block()
+        self.data.close()
+        self.index.close()
+
+
+class LogReader(object):
+
+    def __init__(self, base, max_errors=None):
+        """
+        Reads the index of a log, keeping only the last 'max_errors' error
+        lines when given.
+        """
+        self.base = base
+        self.blocks = []
+        self.errors = deque(maxlen=max_errors)
+        self.error_count = 0
+        with io.open(base + '.idx', encoding='utf-8', errors='replace',
+                     newline='\n') as fh:
+            for line in fh:
+                # The last line may still be being written.
+                if not line.endswith('\n'):
+                    break
+                if line.startswith('B '):
+                    self.blocks.append(tuple(int(v) for v in line.split()[1:5]))
+                elif line.startswith('E '):
+                    offset, _, text = line[2:].rstrip('\n').partition(' ')
+                    self.errors.append((int(offset), text))
+                    self.error_count += 1
+
+    @staticmethod
+    def exists(base):
+        return path.isfile(base + '.idx') and path.isfile(base + '.gz')
+
+    def size(self):
+        if not self.blocks:
+            return 0
+        offset, length, _, _ = self.blocks[-1]
+        return offset + length
+
+    def read_block(self, fh, block):
+        _, _, compressed_offset, compressed_length = block
+        fh.seek(compressed_offset)
+        return zlib.decompress(fh.read(compressed_length), 16 + zlib.MAX_WBITS)
+
+    def read_range(self, start, end):
+        """
+        Returns the bytes of the log between two offsets, decompressing only
+        the blocks they span.
+        """
+        chunks = []
+        with open(self.base + '.gz', 'rb') as fh:
+            for block in self.blocks:
+                offset, length = block[0], block[1]
+                if offset + length <= start or offset >= end:
+                    continue
+                data = self.read_block(fh, block)
+                chunks.append(data[max(start - offset, 0):end - offset])
+        return b''.join(chunks)
+
+    def tail(self, nbytes):
+        size = self.size()
+        return self.read_range(max(size - nbytes, 0), size)
+
+    def iter_blocks(self):
+        with open(self.base + '.gz', 'rb') as fh:
+            for block in self.blocks:
+                yield self.read_block(fh, block)
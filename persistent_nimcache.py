@@ -0,0 +1,69 @@
+"""
+Prepares a nimcache directory which lives outside the Nim tree, so that it
+survives the cleaning of the repository and consecutive builds of the same
+branch only recompile the C files which changed.
+
+usage: persistent_nimcache.py <cache dir> <builder> <branch> <name>
+                              <nim exe> [<flag>...]
+
+The directory is '<cache dir>/nimcache/<builder>/<branch>/<name>' and is
+reported as the 'nimcache_<name>' property. It is emptied whenever the
+version of the bootstrapping compiler, the C compiler or the flags differ
+from those of the build which filled it.
+"""
+import os
+import os.path as path
+import re
+import shutil
+import sys
+
+from slave_utils import report_property, hash_strings, command_output
+from slave_utils import c_compiler_identity
+
+stamp_file = 'nimcache.key'
+
+
+def safe_name(name):
+    return re.sub(r'[^A-Za-z0-9._-]', '_', name) or 'default'
+
+
+def read_stamp(nimcache):
+    try:
+        with open(path.join(nimcache, stamp_file)) as fh:
+            return fh.read().strip()
+    except IOError:
+        return None
+
+
+def main():
+    cache_dir, builder, branch, name, nim_exe = sys.argv[1:6]
+    flags = sys.argv[6:]
+
+    nimcache = path.abspath(path.join(
+        cache_dir, 'nimcache', safe_name(builder), safe_name(branch), name
+    ))
+    key = hash_strings([
+        command_output([path.abspath(nim_exe), '--version']),
+        c_compiler_identity()
+    ] + flags)
+
+    previous = read_stamp(nimcache)
+    if previous == key:
+        print('Reusing {0}'.format(nimcache))
+        report_property('nimcache_' + name + '_state', 'warm')
+    else:
+        if previous is None:
+            print('Creating {0}'.format(nimcache))
+        else:
+            print('Compiler or flags changed, emptying {0}'.format(nimcache))
+        if path.exists(nimcache):
+            shutil.rmtree(nimcache)
+        os.makedirs(nimcache)
+        with open(path.join(nimcache, stamp_file), 'w') as fh:
+            fh.write(key)
+        report_property('nimcache_' + name + '_state', 'cold')
+
+    report_property('nimcache_' + name, nimcache)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Packs and unpacks the architecture independent part of a release: the C
+sources generated by 'koch csources' and the generated documentation. One
+builder produces them, and the installer builders of every architecture
+compile and package them.
+
+usage: release_sources.py pack <nim dir> <archive>
+       release_sources.py unpack <archive> <nim dir>
+       release_sources.py collect <script dir> <bin dir>
+
+'collect' moves the compiler built by the generated build scripts, which
+write it to the 'bin' directory next to them, into the Nim tree's <bin dir>.
+It then removes that 'bin' directory and the object files from <script dir>,
+as the installers package that directory.
+"""
+import os
+import os.path as path
+import shutil
+import sys
+import tarfile
+
+from slave_utils import exe_name
+
+# Directories of the Nim tree which make up the release sources.
+release_dirs = ['build', 'doc', path.join('web', 'upload')]
+
+# Extensions of the object files the generated build scripts leave behind.
+object_extensions = ('.o', '.obj')
+
+
+def pack(nim_dir, archive):
+    packed = []
+    with tarfile.open(archive, 'w:bz2') as tar:
+        for name in release_dirs:
+            if not path.isdir(path.join(nim_dir, name)):
+                continue
+            tar.add(path.join(nim_dir, name), name.replace(path.sep, '/'))
+            packed.append(name)
+    if 'build' not in packed:
+        sys.exit('No generated C sources in {0}'.format(nim_dir))
+    print('Packed {0} into {1}'.format(', '.join(packed), archive))
+
+
+def unpack(archive, nim_dir):
+    with tarfile.open(archive, 'r:bz2') as tar:
+        for member in tar.getmembers():
+            name = path.normpath(member.name)
+            if path.isabs(name) or name.startswith('..'):
+                sys.exit('Bad archive member {0}'.format(member.name))
+        tar.extractall(nim_dir)
+    print('Unpacked {0} into {1}'.format(archive, nim_dir))
+
+
+def clean_build_output(script_dir):
+    removed = 0
+    for root, dirs, files in os.walk(script_dir):
+        for name in files:
+            if name.endswith(object_extensions):
+                os.remove(path.join(root, name))
+                removed += 1
+    print('Removed {0} object files from {1}'.format(removed, script_dir))
+
+
+def collect(script_dir, bin_dir):
+    script_bin_dir = path.join(script_dir, 'bin')
+    source = path.join(script_bin_dir, exe_name('nim'))
+    target = path.join(bin_dir, exe_name('nim'))
+    if path.isfile(source):
+        if not path.isdir(bin_dir):
+            os.makedirs(bin_dir)
+        shutil.copy2(source, target)
+        print('Copied {0} to {1}'.format(source, target))
+    elif path.isfile(target):
+        print('The compiler was built into {0}'.format(bin_dir))
+    else:
+        sys.exit('No compiler found in {0}'.format(script_bin_dir))
+    if path.abspath(script_bin_dir) != path.abspath(bin_dir):
+        shutil.rmtree(script_bin_dir, ignore_errors=True)
+    clean_build_output(script_dir)
+
+
+def main():
+    action = sys.argv[1]
+    if action == 'pack':
+        pack(sys.argv[2], sys.argv[3])
+    elif action == 'unpack':
+        unpack(sys.argv[2], sys.argv[3])
+    elif action == 'collect':
+        collect(sys.argv[2], sys.argv[3])
+    else:
+        sys.exit('Unknown action {0}'.format(action))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Reruns the tests which failed in a testament run, to tell flaky tests from
+ones which fail consistently.
+
+usage: rerun_failures.py <nim dir> <reruns> <max tests> [<output>]
+
+Every failing test in '<nim dir>/testament.db' is run again up to <reruns>
+times with 'tester r'. A test which passes at least once is labelled
+'flaky', one which never passes 'consistently failing'. When more than
+<max tests> tests failed, the rest are labelled 'not rerun', as that many
+failures are rarely flakes. Tests which testament ran with extra options,
+such as the gc variants, are labelled 'not rerun' too, as 'tester r' can't
+run them with the same options. The original testament.db is restored after the
+reruns, so that they don't change the uploaded results.
+
+The labels are added to the 'reruns' section of <output>, which defaults to
+'compresults.json', and their counts are reported as the 'tests_flaky',
+'tests_consistently_failing' and 'tests_not_rerun' properties. The exit code
+is 1 when a test failed consistently, 2 when only flaky or unrerun tests
+failed and 0 otherwise.
+"""
+import json
+import os
+import os.path as path
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+from slave_utils import report_property, exe_name
+
+tester_path = path.join('tests', 'testament', exe_name('tester'))
+passing_results = ['reSuccess', 'reIgnored', 'reDisabled', 'reJoined']
+
+
+def dict_factory(cursor, row):
+    return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+
+
+def failing_tests(db_path):
+    """
+    Returns the latest result of every test whose latest result, for any
+    target, was a failure.
+    """
+    connection = sqlite3.connect(db_path)
+    connection.row_factory = dict_factory
+    try:
+        return connection.execute("""
+            SELECT name, category, target, result FROM TestResult
+            WHERE rowid IN (SELECT max(rowid) FROM TestResult
+                            GROUP BY name, target)
+              AND result NOT IN ({0})
+            ORDER BY category, name
+        """.format(', '.join('?' * len(passing_results))),
+            passing_results
+        ).fetchall()
+    finally:
+        connection.close()
+
+
+def results_since(db_path, rowid):
+    connection = sqlite3.connect(db_path)
+    try:
+        return connection.execute(
+            'SELECT rowid, result FROM TestResult WHERE rowid > ?', (rowid,)
+        ).fetchall()
+    finally:
+        connection.close()
+
+
+def last_rowid(db_path):
+    connection = sqlite3.connect(db_path)
+    try:
+        return connection.execute(
+            'SELECT coalesce(max(rowid), 0) FROM TestResult'
+        ).fetchone()[0]
+    finally:
+        connection.close()
+
+
+def recorded_options(test):
+    """
+    Returns the options testament recorded after the file name of a test.
+    """
+    return test['name'].split()[1:]
+
+
+def find_test_file(nim_dir, test):
+    """
+    Testament records tests by file name, followed by their options. The
+    file is looked up in the test's category first.
+    """
+    name = test['name'].split()[0]
+    if not name.endswith('.nim'):
+        name += '.nim'
+    if path.isfile(path.join(nim_dir, name)):
+        return name
+    tests_dir = path.join(nim_dir, 'tests')
+    search_dirs = [path.join(tests_dir, test['category'] or ''), tests_dir]
+    for directory in search_dirs:
+        for root, dirs, files in os.walk(directory):
+            if path.basename(name) in files:
+                return path.relpath(path.join(root, path.basename(name)),
+                                    nim_dir)
+    return None
+
+
+def rerun(nim_dir, db_path, test_file, reruns):
+    """
+    Returns how many of the reruns of a test passed.
+    """
+    passed = 0
+    for attempt in range(reruns):
+        rowid = last_rowid(db_path)
+        command = [path.join(nim_dir, tester_path), 'r', test_file]
+        print('> {0}'.format(' '.join(command)))
+        sys.stdout.flush()
+        returncode = subprocess.call(command, cwd=nim_dir)
+        results = [result for _, result in results_since(db_path, rowid)]
+        if results:
+            success = all(result in passing_results for result in results)
+        else:
+            success = returncode == 0
+        if success:
+            passed += 1
+    return passed
+
+
+def write_labels(output, labels):
+    content = {}
+    if path.exists(output):
+        try:
+            with open(output) as fh:
+                content = json.load(fh)
+        except ValueError:
+            content = {}
+    content['reruns'] = labels
+    with open(output, 'w') as fh:
+        json.dump(content, fh, indent=1, sort_keys=True)
+
+
+def main():
+    nim_dir = path.abspath(sys.argv[1])
+    reruns, max_tests = int(sys.argv[2]), int(sys.argv[3])
+    output = sys.argv[4] if len(sys.argv) > 4 else 'compresults.json'
+    db_path = path.join(nim_dir, 'testament.db')
+
+    if not path.exists(db_path):
+        sys.exit('No testament results in {0}'.format(nim_dir))
+    tests = failing_tests(db_path)
+    print('{0} tests failed'.format(len(tests)))
+
+    backup_path = db_path + '.orig'
+    shutil.copyfile(db_path, backup_path)
+    labels = {}
+    rerun_count = 0
+    try:
+        for test in tests:
+            # A test failing for several targets is rerun once.
+            if test['name'] in labels:
+                continue
+            label = dict(test, runs=0, passed=0)
+            labels[test['name']] = label
+            if rerun_count >= max_tests:
+                label['label'] = 'not rerun'
+                continue
+            if recorded_options(test):
+                print('Unable to rerun {0} with its options'.format(
+                    test['name']
+                ))
+                label['label'] = 'not rerun'
+                continue
+            test_file = find_test_file(nim_dir, test)
+            if test_file is None:
+                print('Unable to find the file of {0}'.format(test['name']))
+                label['label'] = 'not rerun'
+                continue
+            rerun_count += 1
+            label['runs'] = reruns
+            label['passed'] = rerun(nim_dir, db_path, test_file, reruns)
+            label['label'] = ('flaky' if label['passed']
+                              else 'consistently failing')
+    finally:
+        shutil.move(backup_path, db_path)
+
+    write_labels(output, labels)
+    counts = {}
+    for name, label in sorted(labels.items()):
+        print('{0}: {1} ({2}/{3} reruns passed)'.format(
+            name, label['label'], label['passed'], label['runs']
+        ))
+        counts[label['label']] = counts.get(label['label'], 0) + 1
+    flaky = counts.get('flaky', 0)
+    failing = counts.get('consistently failing', 0)
+    not_rerun = counts.get('not rerun', 0)
+    report_property('tests_flaky', flaky)
+    report_property('tests_consistently_failing', failing)
+    report_property('tests_not_rerun', not_rerun)
+
+    if failing:
+        sys.exit(1)
+    if flaky or not_rerun:
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
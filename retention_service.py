@@ -0,0 +1,43 @@
+"""
+Master service which periodically applies the artifact retention budget to
+public_html, outside of the reactor thread.
+"""
+from twisted.application.internet import TimerService
+from twisted.internet import threads
+from twisted.python import log
+
+from buildbot.status.base import StatusReceiverMultiService
+
+from artifact_retention import prune
+
+
+class ArtifactRetentionService(StatusReceiverMultiService):
+
+    def __init__(self, public_html='public_html', max_bytes=50 * 1024 ** 3,
+                 max_age_days=90, keep_recent=20, interval=6 * 3600):
+        StatusReceiverMultiService.__init__(self)
+        self.public_html = public_html
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.keep_recent = keep_recent
+        self.running_prune = None
+        TimerService(interval, self.prune).setServiceParent(self)
+
+    def prune(self):
+        # A slow run isn't started over by the next tick.
+        if self.running_prune is not None:
+            return
+        self.running_prune = threads.deferToThread(
+            prune, self.public_html, self.max_bytes, self.max_age_days,
+            self.keep_recent, log=log.msg
+        )
+        self.running_prune.addCallback(
+            lambda removed: log.msg('Pruned {0} artifact revisions'.format(
+                removed
+            ))
+        )
+        self.running_prune.addErrback(log.err, 'Pruning artifacts failed')
+        self.running_prune.addBoth(self.pruned)
+
+    def pruned(self, result):
+        self.running_prune = None
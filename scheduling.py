@@ -0,0 +1,90 @@
+"""
+Policies deciding which pending build requests a compiler builder runs
+next.
+
+Pending requests for the same branch are merged, so that a builder which
+fell behind builds only the newest revision of a branch instead of every
+superseded push. The main branches are built before feature branches.
+"""
+import calendar
+import time
+
+# Branches built ahead of every other branch, in order of priority.
+priority_branches = ['devel', 'master']
+
+
+def nim_branch(request):
+    source = request.sources.get('nim')
+    if source is None:
+        return None
+    return source.branch
+
+
+def branch_rank(request):
+    branch = nim_branch(request)
+    if branch in priority_branches:
+        return priority_branches.index(branch)
+    return len(priority_branches)
+
+
+def sources_compatible(source, other):
+    if (source.repository != other.repository or
+            source.branch != other.branch or
+            source.project != other.project):
+        return False
+    if source.patch or other.patch:
+        return False
+    # Requests triggered by pushes build the newest revision of the branch.
+    # Requests for explicit revisions (forced builds) only merge with
+    # requests for the same revision.
+    if source.changes and other.changes:
+        return True
+    return not (source.changes or other.changes) and \
+        source.revision == other.revision
+
+
+def merge_requests(builder, request, other):
+    """
+    Merges requests whose codebases all track the same branches. The merged
+    build checks out the newest revision among the merged changes.
+    """
+    if set(request.sources) != set(other.sources):
+        return False
+    return all(
+        sources_compatible(source, other.sources[codebase])
+        for codebase, source in request.sources.items()
+    )
+
+
+def next_build(builder, requests):
+    """
+    Picks the request on a main branch which has waited the longest, or the
+    oldest request when none is on a main branch. The builder then merges
+    the other pending requests for its branch into it.
+    """
+    if not requests:
+        return None
+    return min(requests, key=lambda r: (branch_rank(r), r.submittedAt))
+
+
+def summarize_queue(request_dicts, now=None):
+    """
+    Returns the depth of every builder's queue of unclaimed requests, and the
+    age in seconds of its oldest and newest request.
+    """
+    if now is None:
+        now = time.time()
+    queues = {}
+    for brdict in request_dicts:
+        submitted = brdict['submitted_at']
+        if hasattr(submitted, 'timetuple'):
+            submitted = calendar.timegm(submitted.utctimetuple())
+        queue = queues.setdefault(brdict['buildername'], {
+            'depth': 0, 'oldest_age': 0, 'newest_age': None
+        })
+        age = max(now - submitted, 0)
+        queue['depth'] += 1
+        queue['oldest_age'] = max(queue['oldest_age'], age)
+        if queue['newest_age'] is None or age < queue['newest_age']:
+            queue['newest_age'] = age
+    return queues
@@ -0,0 +1,22 @@
+"""
+Reports the slave's one minute load average as the 'slave_load' property,
+which the master records along with the timing of the following steps, and
+its number of processors as the 'slave_cpus' property.
+
+usage: slave_load.py
+"""
+import multiprocessing
+
+from slave_utils import report_property, load_average
+
+
+def main():
+    load = load_average()
+    report_property('slave_load', '' if load is None else load)
+    try:
+        report_property('slave_cpus', multiprocessing.cpu_count())
+    except NotImplementedError:
+        report_property('slave_cpus', 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Groups the build slaves into per-platform pools, and picks the slave of a
+pool which runs a build.
+
+Slaves are named "{operating system}-{architecture}-slave-{slave number}",
+and every slave of a platform can run the builders of that platform.
+"""
+import re
+
+from scheduling import nim_branch
+
+slave_name_pattern = re.compile(r'^(?P<platform>[a-z0-9]+-[a-z0-9]+)-slave-\d+$')
+
+
+def slave_platform(slave_name):
+    match = slave_name_pattern.match(slave_name)
+    if match is None:
+        raise Exception("Bad slave name '{0}'".format(slave_name))
+    return match.group('platform')
+
+
+def slave_pools(slave_names):
+    """
+    Maps each platform, such as 'linux-x64', to the names of its slaves.
+    """
+    pools = {}
+    for name in slave_names:
+        pools.setdefault(slave_platform(name), []).append(name)
+    return pools
+
+
+class SlaveSelector(object):
+    """
+    A nextSlave policy choosing the available slave running the fewest
+    builds. Ties go to a slave which recently built the requested branch,
+    since its git mirrors and caches are already warm for it.
+    """
+
+    def __init__(self, remembered_branches=5):
+        self.remembered_branches = remembered_branches
+        self.recent_branches = {}
+
+    def running_builds(self, slavebuilder):
+        slave_status = getattr(slavebuilder.slave, 'slave_status', None)
+        if slave_status is None:
+            return 0
+        return len(slave_status.getRunningBuilds())
+
+    def remember(self, slave_name, branch):
+        branches = self.recent_branches.setdefault(slave_name, [])
+        if branch in branches:
+            branches.remove(branch)
+        branches.insert(0, branch)
+        del branches[self.remembered_branches:]
+
+    def __call__(self, builder, slavebuilders, request=None):
+        # Buildbot versions which don't pass the request get no branch
+        # preference.
+        if not slavebuilders:
+            return None
+        branch = nim_branch(request) if request is not None else None
+
+        def load(slavebuilder):
+            name = slavebuilder.slave.slavename
+            warm = branch in self.recent_branches.get(name, [])
+            return (self.running_builds(slavebuilder), not warm, name)
+
+        chosen = min(slavebuilders, key=load)
+        if branch is not None:
+            self.remember(chosen.slave.slavename, branch)
+        return chosen
@@ -0,0 +1,71 @@
+import hashlib
+import os
+import os.path as path
+import subprocess
+import sys
+
+# Lines starting with this prefix are turned into build properties by the
+# SetPropertyFromCommand steps which run these scripts.
+property_prefix = 'property: '
+
+
+def report_property(name, value):
+    print('{0}{1}={2}'.format(property_prefix, name, value))
+    sys.stdout.flush()
+
+
+def hash_strings(parts):
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part.encode('utf-8') if not isinstance(part, bytes) else part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def hash_file(p, algorithm='sha1'):
+    digest = hashlib.new(algorithm)
+    with open(p, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def command_output(command):
+    try:
+        process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        )
+        output = process.communicate()[0]
+    except OSError:
+        return ''
+    return output.decode('utf-8', 'replace').strip()
+
+
+def c_compiler_identity():
+    compiler = os.environ.get('CC', 'gcc')
+    return compiler + '\n' + command_output([compiler, '--version'])
+
+
+def exe_name(name):
+    return name + ('.exe' if sys.platform == 'win32' else '')
+
+
+def tree_size(p):
+    total = 0
+    for root, dirs, files in os.walk(p):
+        for name in files:
+            try:
+                total += path.getsize(path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def load_average():
+    """
+    Returns the one minute load average, or None where it isn't available.
+    """
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
@@ -0,0 +1,152 @@
+"""
+Master-side cache of the latest finished build of every builder, kept up to
+date from build-finished events, so that the status web resources can answer
+without walking builder history or loading build pickles.
+"""
+import hashlib
+import json
+import os.path as path
+import sqlite3
+from datetime import datetime
+
+from buildbot.status.base import StatusReceiver
+from buildbot.status.builder import Results
+from buildbot.util import UTC
+
+from test_warehouse import TestWarehouse, default_warehouse_path
+
+status_image_dir = path.join(
+    path.dirname(path.abspath(__file__)), 'public_html', 'status-img'
+)
+
+
+def load_status_images(image_dir=status_image_dir):
+    """
+    Reads the build status badges once, keyed by result name.
+    """
+    images = {}
+    for name in Results:
+        image_path = path.join(image_dir, 'status_image_%s.svg' % name)
+        if path.isfile(image_path):
+            with open(image_path, 'rb') as fh:
+                images[name] = fh.read()
+    return images
+
+
+def http_date(timestamp):
+    if timestamp is None:
+        target_time = datetime.utcnow()
+    else:
+        target_time = datetime.fromtimestamp(timestamp, UTC)
+    return target_time.strftime('%a, %d %b %Y %H:%M:%S GMT')
+
+
+def build_revision(build):
+    revision = build.getProperty('got_revision')
+    if isinstance(revision, dict):
+        return revision.get('nim')
+    return revision
+
+
+def summarize_build(builder_name, build):
+    start_time, end_time = build.getTimes()
+    result_name = Results[build.getResults()]
+    return {
+        'builder': builder_name,
+        'number': build.getNumber(),
+        'result': result_name,
+        'revision': build_revision(build),
+        'start_time': start_time,
+        'end_time': end_time,
+        'last_modified': http_date(end_time or start_time),
+        'etag': '"%s-%d-%s"' % (builder_name, build.getNumber(), result_name),
+    }
+
+
+class BuildResultCache(StatusReceiver):
+    """
+    Keeps a summary of the last finished build of each builder. The cache is
+    seeded from the builders' history once, when it is attached to the
+    status, and afterwards only updated by buildFinished events.
+
+    The summaries of the builders in 'summary_builders' are also kept
+    serialized as a single JSON document, rebuilt whenever one of them
+    changes. Test counts come from the test warehouse.
+    """
+
+    def __init__(self, summary_builders=(),
+                 warehouse_path=default_warehouse_path):
+        self.status = None
+        self.latest = {}
+        self.summary_builders = list(summary_builders)
+        self.warehouse_path = warehouse_path
+        self.warehouse = None
+        self.summary_json = None
+        self.summary_etag = None
+        self.serialize_summary()
+
+    def attach(self, status):
+        # Subscribing announces every existing builder through builderAdded.
+        self.status = status
+        status.subscribe(self)
+
+    def detach(self):
+        if self.status is not None:
+            self.status.unsubscribe(self)
+            self.status = None
+        if self.warehouse is not None:
+            self.warehouse.close()
+            self.warehouse = None
+
+    def seed(self, builder_name, builder):
+        if builder_name in self.latest:
+            return
+        build = builder.getLastFinishedBuild()
+        if build is not None:
+            self.update(builder_name, build)
+
+    def update(self, builder_name, build):
+        summary = summarize_build(builder_name, build)
+        summary['tests'] = self.test_counts(builder_name, build.getNumber())
+        self.latest[builder_name] = summary
+        if builder_name in self.summary_builders:
+            self.serialize_summary()
+
+    def test_counts(self, builder_name, number):
+        try:
+            if self.warehouse is None:
+                self.warehouse = TestWarehouse(self.warehouse_path)
+            return self.warehouse.result_counts(builder_name, number)
+        except sqlite3.Error:
+            return None
+
+    def serialize_summary(self):
+        fields = ['number', 'result', 'revision', 'start_time', 'end_time',
+                  'tests']
+        builders = {}
+        for name in self.summary_builders:
+            summary = self.latest.get(name)
+            if summary is not None:
+                summary = dict((field, summary[field]) for field in fields)
+            builders[name] = summary
+
+        self.summary_json = json.dumps({'builders': builders}, sort_keys=True)
+        self.summary_etag = '"%s"' % hashlib.sha1(
+            self.summary_json.encode('utf-8')
+        ).hexdigest()
+
+    def get(self, builder_name):
+        return self.latest.get(builder_name)
+
+    # StatusReceiver interface
+
+    def builderAdded(self, builder_name, builder):
+        self.seed(builder_name, builder)
+        # Returning ourselves subscribes us to the builder's build events.
+        return self
+
+    def builderRemoved(self, builder_name):
+        self.latest.pop(builder_name, None)
+
+    def buildFinished(self, builder_name, build, results):
+        self.update(builder_name, build)
@@ -0,0 +1,159 @@
+"""
+Master-side store of the time taken by every build step.
+
+Each finished step is recorded with its builder, build number, start time,
+duration and the slave's load average when it started. A step is flagged as
+a regression when it takes longer than its baseline, the median of its last
+successful runs on the same builder, by more than a threshold.
+
+usage: step_timings.py check <store> <builder> <build number> [<threshold>]
+       step_timings.py baselines <store> <builder>
+
+'check' prints the regressed steps of a build and exits with 1 when there
+are any, so that a master-side step turns the build's result to WARNINGS.
+"""
+import json
+import sqlite3
+import sys
+
+default_timings_path = 'step_timings.sqlite'
+default_threshold = 0.3
+
+# Steps need this many earlier runs, and a baseline of at least this many
+# seconds, before they are checked. Short steps are mostly noise.
+baseline_runs = 10
+minimum_runs = 5
+minimum_seconds = 10.0
+
+schema = """
+CREATE TABLE IF NOT EXISTS StepTiming(
+    builder  TEXT NOT NULL,
+    number   INTEGER NOT NULL,
+    step     TEXT NOT NULL,
+    started  REAL NOT NULL,
+    duration REAL NOT NULL,
+    load     REAL,
+    result   INTEGER,
+    PRIMARY KEY (builder, step, number)
+) WITHOUT ROWID;
+"""
+
+
+def dict_factory(cursor, row):
+    return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+class StepTimingStore(object):
+
+    def __init__(self, timings_path=default_timings_path):
+        self.connection = sqlite3.connect(timings_path, timeout=60)
+        self.connection.row_factory = dict_factory
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(schema)
+
+    def close(self):
+        self.connection.close()
+
+    def record(self, builder, number, step, started, duration, load=None,
+               result=None):
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO StepTiming'
+                ' (builder, number, step, started, duration, load, result)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (builder, number, step, started, duration, load, result)
+            )
+
+    def build_steps(self, builder, number):
+        return self.connection.execute(
+            'SELECT * FROM StepTiming WHERE builder = ? AND number = ?'
+            ' ORDER BY started',
+            (builder, number)
+        ).fetchall()
+
+    def baseline(self, builder, step, before=None):
+        """
+        Returns the median duration of the last successful runs of a step,
+        and the number of runs it is based on. Results 0 and 1 are buildbot's
+        SUCCESS and WARNINGS.
+        """
+        query = ('SELECT duration FROM StepTiming'
+                 ' WHERE builder = ? AND step = ? AND result IN (0, 1)')
+        parameters = [builder, step]
+        if before is not None:
+            query += ' AND number < ?'
+            parameters.append(before)
+        query += ' ORDER BY number DESC LIMIT ?'
+        parameters.append(baseline_runs)
+        durations = [row['duration'] for row in
+                     self.connection.execute(query, parameters)]
+        if not durations:
+            return None, 0
+        return median(durations), len(durations)
+
+    def baselines(self, builder):
+        steps = self.connection.execute(
+            'SELECT DISTINCT step FROM StepTiming WHERE builder = ?'
+            ' ORDER BY step',
+            (builder,)
+        ).fetchall()
+        result = {}
+        for row in steps:
+            seconds, runs = self.baseline(builder, row['step'])
+            result[row['step']] = {'seconds': seconds, 'runs': runs}
+        return result
+
+    def regressions(self, builder, number, threshold=default_threshold):
+        """
+        Returns the steps of a build which ran slower than their baseline by
+        more than 'threshold', as a fraction of the baseline.
+        """
+        result = []
+        for timing in self.build_steps(builder, number):
+            seconds, runs = self.baseline(builder, timing['step'], number)
+            if runs < minimum_runs or seconds < minimum_seconds:
+                continue
+            if timing['duration'] > seconds * (1 + threshold):
+                timing['baseline'] = seconds
+                timing['slowdown'] = timing['duration'] / seconds - 1
+                result.append(timing)
+        return result
+
+
+def main():
+    action, timings_path, builder = sys.argv[1:4]
+    store = StepTimingStore(timings_path)
+    try:
+        if action == 'check':
+            number = int(sys.argv[4])
+            threshold = default_threshold
+            if len(sys.argv) > 5:
+                threshold = float(sys.argv[5])
+            regressions = store.regressions(builder, number, threshold)
+            for timing in regressions:
+                print('{0}: {1:.0f}s, {2:.0%} slower than its baseline of'
+                      ' {3:.0f}s (load {4})'.format(
+                          timing['step'], timing['duration'],
+                          timing['slowdown'], timing['baseline'],
+                          timing['load']
+                      ))
+            if regressions:
+                sys.exit(1)
+            print('No step regressed')
+        elif action == 'baselines':
+            print(json.dumps(store.baselines(builder), indent=1))
+        else:
+            sys.exit('Unknown action {0}'.format(action))
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Master-side store of the results of every testament run.
+
+Each uploaded testament.db is loaded into a single indexed database, keyed by
+builder, revision, build number and test name, so that questions spanning
+many builds are answered without opening each build's database.
+
+usage: test_warehouse.py ingest <warehouse> <testament.db> <builder>
+                                <revision> <build number>
+       test_warehouse.py history <warehouse> <test name>
+       test_warehouse.py flipped <warehouse> <build count>
+"""
+import json
+import sqlite3
+import sys
+import time
+
+default_warehouse_path = 'test_warehouse.sqlite'
+
+schema = """
+CREATE TABLE IF NOT EXISTS Build(
+    id       INTEGER PRIMARY KEY,
+    builder  TEXT NOT NULL,
+    revision TEXT NOT NULL,
+    number   INTEGER NOT NULL,
+    ingested REAL NOT NULL,
+    UNIQUE (builder, number)
+);
+CREATE INDEX IF NOT EXISTS BuildRevision ON Build(revision, builder);
+
+CREATE TABLE IF NOT EXISTS Result(
+    build    INTEGER NOT NULL REFERENCES Build(id),
+    name     TEXT NOT NULL,
+    category TEXT,
+    target   TEXT,
+    result   TEXT NOT NULL,
+    expected TEXT,
+    given    TEXT
+);
+CREATE INDEX IF NOT EXISTS ResultName ON Result(name, build);
+CREATE INDEX IF NOT EXISTS ResultBuild ON Result(build, name);
+"""
+
+# Testament results which don't count as failures.
+passing_results = ['reSuccess', 'reIgnored', 'reDisabled', 'reJoined']
+
+
+def passed_sql(column):
+    """
+    Returns an SQL condition on a result column holding a passing result.
+    """
+    return '{0} IN ({1})'.format(
+        column, ', '.join("'{0}'".format(r) for r in passing_results)
+    )
+
+
+# Classifies every result of a build against the same test in an earlier
+# build of the builder. Both sides are looked up through ResultBuild.
+comparison_query = """
+SELECT n.name, n.category, n.target, n.result,
+       o.result AS previous_result,
+       CASE
+           WHEN o.result IS NULL THEN 'new'
+           WHEN {new_passed} AND NOT {old_passed}
+               THEN 'newly passed'
+           WHEN NOT {new_passed} AND {old_passed}
+               THEN 'newly failed'
+           WHEN {new_passed} THEN 'passed'
+           ELSE 'failed'
+       END AS status
+FROM Result n
+LEFT JOIN Result o ON o.build = :previous AND o.name = n.name
+                  AND o.target IS n.target
+WHERE n.build = :build
+""".format(new_passed=passed_sql('n.result'),
+           old_passed=passed_sql('o.result'))
+
+# Order in which the comparison lists results.
+comparison_statuses = ['newly failed', 'newly passed', 'new', 'failed',
+                       'passed']
+
+# Columns copied from testament's TestResult table, when present. The
+# expected and given outputs are only kept for tests which didn't pass.
+result_columns = ['name', 'category', 'target', 'result']
+detail_columns = ['expected', 'given']
+
+
+def dict_factory(cursor, row):
+    return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+
+
+class TestWarehouse(object):
+
+    def __init__(self, warehouse_path=default_warehouse_path):
+        self.connection = sqlite3.connect(warehouse_path, timeout=60)
+        self.connection.row_factory = dict_factory
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(schema)
+
+    def close(self):
+        self.connection.close()
+
+    def ingest(self, source_path, builder, revision, number):
+        """
+        Loads a testament database as the results of the given build,
+        replacing any results previously loaded for it.
+        """
+        connection = self.connection
+        connection.execute('ATTACH DATABASE ? AS source', (source_path,))
+        try:
+            available = set(
+                row['name'] for row in connection.execute(
+                    'PRAGMA source.table_info(TestResult)'
+                )
+            )
+            selects = []
+            for column in result_columns:
+                selects.append(column if column in available else 'NULL')
+            for column in detail_columns:
+                if column in available:
+                    selects.append(
+                        'CASE WHEN {0} THEN NULL ELSE {1} END'.format(
+                            passed_sql('result'), column
+                        )
+                    )
+                else:
+                    selects.append('NULL')
+
+            with connection:
+                previous = connection.execute(
+                    'SELECT id FROM Build WHERE builder = ? AND number = ?',
+                    (builder, number)
+                ).fetchone()
+                if previous is not None:
+                    connection.execute('DELETE FROM Result WHERE build = ?',
+                                       (previous['id'],))
+                    connection.execute('DELETE FROM Build WHERE id = ?',
+                                       (previous['id'],))
+
+                build_id = connection.execute(
+                    'INSERT INTO Build(builder, revision, number, ingested)'
+                    ' VALUES (?, ?, ?, ?)',
+                    (builder, revision, number, time.time())
+                ).lastrowid
+                connection.execute(
+                    'INSERT INTO Result(build, {0})'
+                    ' SELECT ?, {1} FROM source.TestResult'.format(
+                        ', '.join(result_columns + detail_columns),
+                        ', '.join(selects)
+                    ),
+                    (build_id,)
+                )
+        finally:
+            connection.execute('DETACH DATABASE source')
+        return build_id
+
+    def find_build(self, builder, number):
+        return self.connection.execute(
+            'SELECT * FROM Build WHERE builder = ? AND number = ?',
+            (builder, number)
+        ).fetchone()
+
+    def latest_build(self, builder):
+        return self.connection.execute(
+            'SELECT * FROM Build WHERE builder = ?'
+            ' ORDER BY number DESC LIMIT 1',
+            (builder,)
+        ).fetchone()
+
+    def previous_build(self, build):
+        return self.connection.execute(
+            'SELECT * FROM Build WHERE builder = ? AND number < ?'
+            ' ORDER BY number DESC LIMIT 1',
+            (build['builder'], build['number'])
+        ).fetchone()
+
+    def result_counts(self, builder, number):
+        """
+        Returns the number of passed and failed tests of a build, or None
+        when no results were ingested for it.
+        """
+        return self.connection.execute(
+            'SELECT count(*) AS total,'
+            ' coalesce(sum({0}), 0) AS passed,'
+            ' coalesce(sum(NOT {0}), 0) AS failed'
+            ' FROM Build b JOIN Result r ON r.build = b.id'
+            ' WHERE b.builder = ? AND b.number = ?'
+            ' HAVING count(*) > 0'.format(passed_sql('r.result')),
+            (builder, number)
+        ).fetchone()
+
+    def comparison_summary(self, build, previous):
+        """
+        Returns the number of results of a build in each comparison status.
+        """
+        rows = self.connection.execute(
+            'SELECT status, count(*) AS count FROM ({0}) GROUP BY status'
+            .format(comparison_query),
+            {'build': build['id'],
+             'previous': previous['id'] if previous else None}
+        ).fetchall()
+        counts = dict((status, 0) for status in comparison_statuses)
+        counts.update((row['status'], row['count']) for row in rows)
+        return counts
+
+    def compare_builds(self, build, previous, statuses=None, name_filter=None,
+                       offset=0, limit=100):
+        """
+        Returns a page of the results of a build compared with an earlier
+        build, newly failed and newly passed tests first. 'statuses' limits
+        the comparison statuses listed, and 'name_filter' the test names to
+        those containing it.
+        """
+        query = 'SELECT * FROM ({0}) WHERE 1'.format(comparison_query)
+        parameters = {'build': build['id'],
+                      'previous': previous['id'] if previous else None,
+                      'offset': offset, 'limit': limit}
+        if statuses:
+            names = []
+            for index, status in enumerate(statuses):
+                parameters['status{0}'.format(index)] = status
+                names.append(':status{0}'.format(index))
+            query += ' AND status IN ({0})'.format(', '.join(names))
+        if name_filter:
+            parameters['name_filter'] = '%{0}%'.format(
+                name_filter.replace('\\', '\\\\')
+                           .replace('%', '\\%').replace('_', '\\_')
+            )
+            query += " AND name LIKE :name_filter ESCAPE '\\'"
+        query += ' ORDER BY CASE status {0} END, name, target'.format(
+            ' '.join("WHEN '{0}' THEN {1}".format(status, rank)
+                     for rank, status in enumerate(comparison_statuses))
+        )
+        query += ' LIMIT :limit OFFSET :offset'
+        return self.connection.execute(query, parameters).fetchall()
+
+    def test_history(self, name, builder=None, limit=None):
+        """
+        Returns the results of a test across builds, newest first.
+        """
+        query = ('SELECT b.builder, b.number, b.revision, r.category,'
+                 ' r.target, r.result'
+                 ' FROM Result r JOIN Build b ON b.id = r.build'
+                 ' WHERE r.name = ?')
+        parameters = [name]
+        if builder is not None:
+            query += ' AND b.builder = ?'
+            parameters.append(builder)
+        query += ' ORDER BY b.ingested DESC, b.id DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            parameters.append(limit)
+        return self.connection.execute(query, parameters).fetchall()
+
+    def flipped_tests(self, build_count, builder=None):
+        """
+        Returns the tests which both passed and failed within the last
+        'build_count' builds of a builder.
+        """
+        query = """
+            SELECT b.builder, r.name,
+                   sum({0}) AS passes,
+                   sum(NOT {0}) AS failures,
+                   max(b.number) AS last_build
+            FROM Build b JOIN Result r ON r.build = b.id
+            WHERE (SELECT count(*) FROM Build newer
+                   WHERE newer.builder = b.builder
+                   AND newer.number > b.number) < ?
+        """.format(passed_sql('r.result'))
+        parameters = [build_count]
+        if builder is not None:
+            query += ' AND b.builder = ?'
+            parameters.append(builder)
+        query += """
+            GROUP BY b.builder, r.name
+            HAVING passes > 0 AND failures > 0
+            ORDER BY b.builder, r.name
+        """
+        return self.connection.execute(query, parameters).fetchall()
+
+
+def main():
+    action, warehouse_path = sys.argv[1:3]
+    warehouse = TestWarehouse(warehouse_path)
+    try:
+        if action == 'ingest':
+            source_path, builder, revision, number = sys.argv[3:7]
+            build_id = warehouse.ingest(source_path, builder, revision,
+                                        int(number))
+            print('Ingested {0} as build {1}'.format(source_path, build_id))
+        elif action == 'history':
+            print(json.dumps(warehouse.test_history(sys.argv[3]), indent=1))
+        elif action == 'flipped':
+            print(json.dumps(warehouse.flipped_tests(int(sys.argv[3])),
+                             indent=1))
+        else:
+            sys.exit('Unknown action {0}'.format(action))
+    finally:
+        warehouse.close()
+
+if __name__ == "__main__":
+    main()
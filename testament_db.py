@@ -0,0 +1,154 @@
+import shutil
+import sqlite3
+import os.path as path
+
+
+def table_columns(connection, schema, table):
+    rows = connection.execute(
+        'PRAGMA {0}.table_info([{1}])'.format(schema, table)
+    ).fetchall()
+    columns = [row[1] for row in rows]
+    primary_keys = [row[1] for row in rows if row[5]]
+    return columns, primary_keys
+
+
+def table_names(connection, schema):
+    rows = connection.execute(
+        "SELECT name, sql FROM {0}.sqlite_master WHERE type = 'table'"
+        " AND name NOT LIKE 'sqlite_%'".format(schema)
+    ).fetchall()
+    return dict(rows)
+
+
+def foreign_keys(connection, schema, table):
+    rows = connection.execute(
+        'PRAGMA {0}.foreign_key_list([{1}])'.format(schema, table)
+    ).fetchall()
+    # (column, referenced table, referenced column)
+    return [(row[3], row[2], row[4]) for row in rows]
+
+
+def natural_key_match(connection, table, left, right):
+    """
+    Rows of the lookup tables (Machine, Commit) are identified by everything
+    except their generated primary key.
+    """
+    columns, primary_keys = table_columns(connection, 'main', table)
+    return ' AND '.join(
+        '{0}.[{2}] IS {1}.[{2}]'.format(left, right, column)
+        for column in columns if column not in primary_keys
+    )
+
+
+def referenced_tables(connection, schema):
+    """
+    Returns the lowercased names of the tables other tables refer to, as
+    foreign keys don't keep the case of the table names.
+    """
+    return set(
+        ref_table.lower() for table in table_names(connection, schema)
+        for _, ref_table, _ in foreign_keys(connection, schema, table)
+    )
+
+
+def check_lookup_tables(connection):
+    """
+    Makes sure that no two rows of a lookup table have the same natural
+    key, which would split the results of a machine or commit.
+    """
+    for table in table_names(connection, 'main'):
+        if table.lower() not in referenced_tables(connection, 'main'):
+            continue
+        columns, primary_keys = table_columns(connection, 'main', table)
+        key = ', '.join('[{0}]'.format(column) for column in columns
+                        if column not in primary_keys)
+        duplicates = connection.execute(
+            'SELECT count(*) FROM (SELECT 1 FROM main.[{0}] GROUP BY {1}'
+            ' HAVING count(*) > 1)'.format(table, key)
+        ).fetchone()[0]
+        if duplicates:
+            raise ValueError('{0} rows of {1} are duplicated'.format(
+                duplicates, table
+            ))
+
+
+def merge_database(connection, source):
+    connection.execute('ATTACH DATABASE ? AS source', (source,))
+    try:
+        source_tables = table_names(connection, 'source')
+        target_tables = table_names(connection, 'main')
+        for table, sql in source_tables.items():
+            if table not in target_tables:
+                connection.execute(sql)
+
+        # Lookup tables go first, so references can be remapped.
+        ordered = sorted(
+            source_tables,
+            key=lambda t: len(foreign_keys(connection, 'source', t))
+        )
+        lookup_tables = referenced_tables(connection, 'source')
+        for table in ordered:
+            columns, primary_keys = table_columns(connection, 'source', table)
+            references = dict(
+                (column, (ref_table, ref_column))
+                for column, ref_table, ref_column
+                in foreign_keys(connection, 'source', table)
+            )
+            targets = []
+            selects = []
+            for column in columns:
+                if column in primary_keys and len(primary_keys) == 1:
+                    continue
+                targets.append('[{0}]'.format(column))
+                if column in references:
+                    ref_table, ref_column = references[column]
+                    selects.append(
+                        '(SELECT m.[{1}] FROM main.[{0}] m, source.[{0}] s'
+                        ' WHERE s.[{1}] = r.[{2}] AND {3})'.format(
+                            ref_table, ref_column, column,
+                            natural_key_match(connection, ref_table, 'm', 's')
+                        )
+                    )
+                else:
+                    selects.append('r.[{0}]'.format(column))
+            # The generated keys never collide, so rows of the lookup tables
+            # which main already has are skipped by their natural key.
+            condition = ''
+            if table.lower() in lookup_tables:
+                condition = (
+                    ' WHERE NOT EXISTS (SELECT 1 FROM main.[{0}] m'
+                    ' WHERE {1})'.format(
+                        table, natural_key_match(connection, table, 'm', 'r')
+                    )
+                )
+            connection.execute(
+                'INSERT OR IGNORE INTO main.[{0}] ({1}) SELECT {2}'
+                ' FROM source.[{0}] r{3}'.format(
+                    table, ', '.join(targets), ', '.join(selects), condition
+                )
+            )
+        connection.commit()
+    finally:
+        connection.execute('DETACH DATABASE source')
+
+
+def merge_databases(target, sources):
+    """
+    Merges several testament databases into 'target', remapping the machine
+    and commit references of every test result. The target is created from
+    the first source when it doesn't exist yet.
+    """
+    sources = [s for s in sources if path.isfile(s)]
+    if not path.exists(target):
+        if not sources:
+            return
+        shutil.copyfile(sources[0], target)
+        sources = sources[1:]
+
+    connection = sqlite3.connect(target)
+    try:
+        for source in sources:
+            merge_database(connection, source)
+        check_lookup_tables(connection)
+    finally:
+        connection.close()
@@ -0,0 +1,28 @@
+"""
+Prepares a testament run which is distributed between the slaves of a
+platform pool: compiles the tester, and reports the categories to run as
+the comma-separated 'testament_categories' property. The master queues the
+categories as work items for the pool's testament workers.
+
+usage: testament_items.py <nim dir> [<category>,<category>...|all]
+"""
+import os
+import os.path as path
+import sys
+
+from slave_utils import report_property
+from testament_shards import select_categories, compile_tester
+
+
+def main():
+    nim_dir = path.abspath(sys.argv[1])
+    requested = sys.argv[2] if len(sys.argv) > 2 else 'all'
+    os.chdir(nim_dir)
+
+    categories, _ = select_categories(nim_dir, requested)
+    compile_tester()
+    print('Queueing {0} categories'.format(len(categories)))
+    report_property('testament_categories', ','.join(categories))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Master-side queues of testament categories, for testament runs which are
+distributed between the slaves of a platform pool.
+
+A compiler build queues the categories it has to run, then triggers the
+pool's testament workers. Each worker claims a batch of categories at a
+time, one for each of its testament shards, until the queue is empty, so
+that fast slaves take on more categories than slow ones. Categories are handed out longest first, using the time they took on
+the pool before. The queues live in the master's memory, as the builds using
+them run on the same master.
+
+Files shared between a build and its workers live in
+'{work_root}/{builder}-{build number}/'.
+"""
+import os.path as path
+
+from testament_shards import load_timings, save_timings
+
+work_root = 'testament-work'
+default_estimate = 60.0
+
+queues = {}
+
+
+def queue_id(builder, number):
+    return '{0}-{1}'.format(builder, number)
+
+
+def work_dir(queue_name):
+    return path.join(work_root, queue_name)
+
+
+def timings_path(pool):
+    return path.join(work_root, 'timings-{0}.json'.format(pool))
+
+
+class WorkQueue(object):
+
+    def __init__(self, pool, categories):
+        self.pool = pool
+        self.timings = load_timings(timings_path(pool))
+        known = [self.timings[c] for c in categories if c in self.timings]
+        average = sum(known) / len(known) if known else default_estimate
+        self.pending = sorted(
+            categories, key=lambda c: -self.timings.get(c, average)
+        )
+        self.claimed = {}
+        # category -> (worker, passed, seconds)
+        self.results = {}
+
+    def claim(self, worker, count=1):
+        """
+        Returns up to 'count' of the next categories for a worker, or an
+        empty list once every category has been handed out.
+        """
+        categories = self.pending[:count]
+        del self.pending[:count]
+        for category in categories:
+            self.claimed[category] = worker
+        return categories
+
+    def estimate(self, category):
+        if category in self.timings:
+            return self.timings[category]
+        return default_estimate
+
+    def complete(self, category, worker, passed, seconds):
+        self.claimed.pop(category, None)
+        self.results[category] = (worker, passed, seconds)
+
+    def complete_batch(self, categories, worker, passed, seconds):
+        """
+        Completes categories which ran together, sharing out their time in
+        proportion to the time each took before.
+        """
+        total = sum(self.estimate(c) for c in categories)
+        for category in categories:
+            self.complete(category, worker, passed,
+                          seconds * self.estimate(category) / total)
+
+    def release(self, worker):
+        """
+        Puts the categories a worker claimed but didn't finish back at the
+        front of the queue, for the other workers.
+        """
+        released = [c for c, w in self.claimed.items() if w == worker]
+        for category in released:
+            del self.claimed[category]
+        self.pending[:0] = released
+        return released
+
+    def failed(self):
+        return sorted(c for c, (_, passed, _) in self.results.items()
+                      if not passed)
+
+    def unfinished(self):
+        return sorted(self.pending + list(self.claimed))
+
+    def save_timings(self):
+        save_timings(timings_path(self.pool), self.timings, dict(
+            (c, seconds) for c, (_, _, seconds) in self.results.items()
+        ))
+
+
+def create_queue(queue_name, pool, categories):
+    queues[queue_name] = WorkQueue(pool, categories)
+    return queues[queue_name]
+
+
+def get_queue(queue_name):
+    return queues.get(queue_name)
+
+
+def remove_queue(queue_name):
+    return queues.pop(queue_name, None)
@@ -0,0 +1,266 @@
+"""
+Runs the testament suite split by category into shards which run
+concurrently, then merges the shard results into the 'testament.db' and
+'testresults.html' that a plain 'koch test' would have produced.
+
+usage: testament_shards.py <nim dir> <timings file> <shard count|auto>
+                           [<category>,<category>...|all] [<results db>]
+
+Each shard runs in its own directory, made of symbolic links to the Nim
+tree, so that every shard writes to a separate 'testament.db'. Categories
+are distributed between shards using the wall times recorded by earlier
+runs, longest first. Where symbolic links are not available, or only one
+shard is requested, the suite runs through 'koch test' as before.
+
+When categories are given, only those categories are run. When a results
+database is given, the run's results are merged into it as well, so that
+the results of several runs can be collected, as testament workers do.
+"""
+import json
+import multiprocessing
+import os
+import os.path as path
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from slave_utils import exe_name
+from testament_db import merge_databases
+
+shards_dir = 'testament-shards'
+tester_path = path.join('tests', 'testament', exe_name('tester'))
+excluded_categories = ['testament', 'testdata', 'nimcache']
+# Categories testament runs in 'tester all' which aren't directories below
+# tests/, such as the standard library's own tests.
+additional_categories = ['lib', 'examples', 'debugger']
+results_files = ['testament.db', 'testresults.html']
+
+
+def list_categories(nim_dir):
+    tests_dir = path.join(nim_dir, 'tests')
+    return sorted(set(
+        name for name in os.listdir(tests_dir)
+        if path.isdir(path.join(tests_dir, name))
+        and name not in excluded_categories
+    ) | set(additional_categories))
+
+
+def count_tests(nim_dir, category):
+    count = 0
+    for root, dirs, files in os.walk(path.join(nim_dir, 'tests', category)):
+        count += len([name for name in files if name.endswith('.nim')])
+    return max(count, 1)
+
+
+def load_timings(timings_path):
+    try:
+        with open(timings_path) as fh:
+            return json.load(fh)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_timings(timings_path, timings, measured):
+    for category, seconds in measured.items():
+        previous = timings.get(category)
+        if previous is None:
+            timings[category] = seconds
+        else:
+            # Smooth out noise from slave load.
+            timings[category] = 0.7 * previous + 0.3 * seconds
+    timings_dir = path.dirname(timings_path)
+    if timings_dir and not path.isdir(timings_dir):
+        os.makedirs(timings_dir)
+    with open(timings_path, 'w') as fh:
+        json.dump(timings, fh, indent=1, sort_keys=True)
+
+
+def estimate_times(nim_dir, categories, timings):
+    """
+    Categories without recorded timings are estimated from their number of
+    test files, using the average time per test of the known categories.
+    """
+    counts = dict((c, count_tests(nim_dir, c)) for c in categories)
+    known = [c for c in categories if c in timings]
+    per_test = 1.0
+    if known:
+        per_test = (sum(timings[c] for c in known) /
+                    sum(counts[c] for c in known))
+    return dict(
+        (c, timings[c] if c in timings else counts[c] * per_test)
+        for c in categories
+    )
+
+
+def partition(estimates, shard_count):
+    shards = [[] for _ in range(shard_count)]
+    loads = [0.0] * shard_count
+    for category in sorted(estimates, key=lambda c: -estimates[c]):
+        index = loads.index(min(loads))
+        shards[index].append(category)
+        loads[index] += estimates[category]
+    return [shard for shard in shards if shard]
+
+
+def create_workspace(nim_dir, workspace):
+    """
+    Creates a directory mirroring the Nim tree through symbolic links,
+    leaving out the files testament writes its results to.
+    """
+    if path.exists(workspace):
+        shutil.rmtree(workspace)
+    os.makedirs(workspace)
+    for name in os.listdir(nim_dir):
+        if name in results_files or name == shards_dir:
+            continue
+        os.symlink(path.join(nim_dir, name), path.join(workspace, name))
+
+
+def run_logged(command, cwd, log):
+    log.write('> {0}\n'.format(' '.join(command)))
+    log.flush()
+    return subprocess.call(command, cwd=cwd, stdout=log,
+                           stderr=subprocess.STDOUT)
+
+
+class Shard(threading.Thread):
+
+    def __init__(self, index, categories, workspace, log_path):
+        threading.Thread.__init__(self)
+        self.index = index
+        self.categories = categories
+        self.workspace = workspace
+        self.log_path = log_path
+        self.failed = False
+        self.timings = {}
+
+    def run(self):
+        tester = path.join(self.workspace, tester_path)
+        with open(self.log_path, 'w') as log:
+            for category in self.categories:
+                start_time = time.time()
+                if run_logged([tester, 'cat', category], self.workspace, log):
+                    self.failed = True
+                self.timings[category] = time.time() - start_time
+
+
+def shard_count_for(requested):
+    if requested == 'auto':
+        try:
+            return multiprocessing.cpu_count()
+        except NotImplementedError:
+            return 1
+    return max(int(requested), 1)
+
+
+def compile_tester():
+    if subprocess.call(['nim', 'c', '--taintMode:on',
+                        path.join('tests', 'testament', 'tester')]):
+        sys.exit('Unable to compile the tester')
+
+
+def run_serially(nim_dir, categories):
+    """
+    Runs the given categories one after another, in the Nim tree itself.
+    """
+    compile_tester()
+    for name in results_files:
+        if path.exists(name):
+            os.remove(name)
+    failed = False
+    tester = path.join(nim_dir, tester_path)
+    for category in categories:
+        print('> {0} cat {1}'.format(tester, category))
+        sys.stdout.flush()
+        if subprocess.call([tester, 'cat', category]):
+            failed = True
+    if subprocess.call([tester, 'html']) or failed:
+        sys.exit(1)
+
+
+def run_sharded(nim_dir, timings_path, shard_count, categories):
+    timings = load_timings(timings_path)
+    shards = partition(estimate_times(nim_dir, categories, timings),
+                       shard_count)
+
+    compile_tester()
+
+    root = path.join(nim_dir, shards_dir)
+    runners = []
+    for index, categories in enumerate(shards):
+        workspace = path.join(root, str(index))
+        create_workspace(nim_dir, workspace)
+        print('Shard {0}: {1}'.format(index, ', '.join(categories)))
+        runners.append(Shard(index, categories, workspace,
+                             path.join(root, '{0}.log'.format(index))))
+    sys.stdout.flush()
+
+    for runner in runners:
+        runner.start()
+    for runner in runners:
+        runner.join()
+        print('\n===== Shard {0} ====='.format(runner.index))
+        with open(runner.log_path) as fh:
+            shutil.copyfileobj(fh, sys.stdout)
+    sys.stdout.flush()
+
+    for name in results_files:
+        if path.exists(name):
+            os.remove(name)
+    merge_databases('testament.db', [
+        path.join(runner.workspace, 'testament.db') for runner in runners
+    ])
+    html_failed = subprocess.call([path.join(nim_dir, tester_path), 'html'])
+
+    measured = {}
+    for runner in runners:
+        measured.update(runner.timings)
+    save_timings(timings_path, timings, measured)
+    shutil.rmtree(root, ignore_errors=True)
+
+    if html_failed or any(runner.failed for runner in runners):
+        sys.exit(1)
+
+
+def select_categories(nim_dir, requested):
+    """
+    Returns the categories to run for a comma-separated list of categories
+    or 'all', and whether all of them are run.
+    """
+    categories = list_categories(nim_dir)
+    if requested == 'all':
+        return categories, True
+    selected = set(requested.split(','))
+    if selected.intersection(categories):
+        categories = [c for c in categories if c in selected]
+        print('Running only {0}'.format(', '.join(categories)))
+        return categories, False
+    print('None of {0} exist, running everything'.format(requested))
+    return categories, True
+
+
+def main():
+    nim_dir = path.abspath(sys.argv[1])
+    timings_path = path.abspath(sys.argv[2])
+    shard_count = shard_count_for(sys.argv[3])
+    requested = sys.argv[4] if len(sys.argv) > 4 else 'all'
+    results_db = path.abspath(sys.argv[5]) if len(sys.argv) > 5 else None
+    os.chdir(nim_dir)
+
+    categories, run_all = select_categories(nim_dir, requested)
+
+    try:
+        if shard_count == 1 or not hasattr(os, 'symlink'):
+            if run_all:
+                sys.exit(subprocess.call(['koch', 'test']))
+            run_serially(nim_dir, categories)
+        else:
+            run_sharded(nim_dir, timings_path, shard_count, categories)
+    finally:
+        if results_db is not None:
+            merge_databases(results_db, ['testament.db'])
+
+if __name__ == "__main__":
+    main()
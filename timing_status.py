@@ -0,0 +1,67 @@
+"""
+Status receiver which records the timing of every finished build step in the
+step timings store.
+"""
+from buildbot.status.base import StatusReceiverMultiService
+from buildbot.status.results import SKIPPED
+
+from step_timings import StepTimingStore, default_timings_path
+
+
+def parse_load(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class StepTimingRecorder(StatusReceiverMultiService):
+
+    def __init__(self, timings_path=default_timings_path):
+        StatusReceiverMultiService.__init__(self)
+        self.timings_path = timings_path
+        self.start_loads = {}
+
+    def setServiceParent(self, parent):
+        # Like the other status targets, our parent is the master's status.
+        StatusReceiverMultiService.setServiceParent(self, parent)
+        self.store = StepTimingStore(self.timings_path)
+        self.status = self.parent
+        self.status.subscribe(self)
+
+    def disownServiceParent(self):
+        self.status.unsubscribe(self)
+        self.store.close()
+        return StatusReceiverMultiService.disownServiceParent(self)
+
+    # StatusReceiver interface
+
+    def builderAdded(self, builder_name, builder):
+        return self
+
+    def buildStarted(self, builder_name, build):
+        # Returning ourselves subscribes us to the build's step events.
+        return self
+
+    def buildFinished(self, builder_name, build, results):
+        for key in list(self.start_loads):
+            if key[0] is build:
+                del self.start_loads[key]
+
+    def stepStarted(self, build, step):
+        # The slave's load is sampled by a build step, so this is the most
+        # recent sample when the step starts.
+        self.start_loads[(build, step.getName())] = parse_load(
+            build.getProperty('slave_load')
+        )
+
+    def stepFinished(self, build, step, results):
+        load = self.start_loads.pop((build, step.getName()), None)
+        started, finished = step.getTimes()
+        result = results[0] if isinstance(results, tuple) else results
+        if result == SKIPPED or started is None or finished is None:
+            return
+        self.store.record(
+            build.getBuilder().getName(), build.getNumber(), step.getName(),
+            started, finished - started, load, result
+        )
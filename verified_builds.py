@@ -0,0 +1,110 @@
+"""
+Master-side record of the builds which passed, keyed by builder and the
+revisions of the nim, csources and scripts repositories they checked out.
+A later build of the same revisions on the same builder reuses the earlier
+result instead of building again.
+
+usage: verified_builds.py record <store> <builder> <build number>
+                                 <nim revision> <csources revision>
+                                 <scripts revision>
+"""
+import os
+import os.path as path
+import sqlite3
+import sys
+import time
+
+default_verified_path = 'verified_builds.sqlite'
+codebases = ['nim', 'csources', 'scripts']
+
+schema = """
+CREATE TABLE IF NOT EXISTS Verified(
+    builder  TEXT NOT NULL,
+    nim      TEXT NOT NULL,
+    csources TEXT NOT NULL,
+    scripts  TEXT NOT NULL,
+    number   INTEGER NOT NULL,
+    recorded REAL NOT NULL,
+    PRIMARY KEY (builder, nim, csources, scripts)
+);
+"""
+
+
+def dict_factory(cursor, row):
+    return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+
+
+class VerifiedBuilds(object):
+
+    def __init__(self, verified_path=default_verified_path):
+        self.connection = sqlite3.connect(verified_path, timeout=60)
+        self.connection.row_factory = dict_factory
+        self.connection.executescript(schema)
+
+    def close(self):
+        self.connection.close()
+
+    def record(self, builder, number, revisions):
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO Verified'
+                ' (builder, nim, csources, scripts, number, recorded)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                [builder] + [revisions[name] for name in codebases] +
+                [number, time.time()]
+            )
+
+    def lookup(self, builder, revisions):
+        """
+        Returns the earlier build which passed with the same revisions, or
+        None. Builds missing one of the revisions are never matched.
+        """
+        if any(not revisions.get(name) for name in codebases):
+            return None
+        return self.connection.execute(
+            'SELECT * FROM Verified WHERE builder = ? AND nim = ?'
+            ' AND csources = ? AND scripts = ?',
+            [builder] + [revisions[name] for name in codebases]
+        ).fetchone()
+
+
+def link_artifacts(directory, names, dest_filename, old_number, new_number):
+    """
+    Links the artifacts uploaded by an earlier build under the names the
+    given build would have uploaded them as. 'dest_filename' turns an
+    artifact's name and a build number into its uploaded file name. Returns
+    the names of the created links.
+    """
+    linked = []
+    for name in names:
+        source = dest_filename(name, old_number)
+        link = path.join(directory, dest_filename(name, new_number))
+        if not path.isfile(path.join(directory, source)):
+            continue
+        if path.lexists(link):
+            os.remove(link)
+        os.symlink(source, link)
+        linked.append(path.basename(link))
+    return linked
+
+
+def main():
+    action, verified_path = sys.argv[1:3]
+    if action != 'record':
+        sys.exit('Unknown action {0}'.format(action))
+
+    builder, number = sys.argv[3:5]
+    revisions = dict(zip(codebases, sys.argv[5:8]))
+    store = VerifiedBuilds(verified_path)
+    try:
+        store.record(builder, int(number), revisions)
+    finally:
+        store.close()
+    print('Recorded {0} as verified by build {1}'.format(
+        ', '.join('{0}={1}'.format(name, revisions[name])
+                  for name in codebases),
+        number
+    ))
+
+if __name__ == "__main__":
+    main()